@@ -1,9 +1,11 @@
 
-import pickle
-import pandas as pd
 import os
 import sys
 
+# storage2 is a thin wrapper around the one Storage engine, which also reads its pickle/*.pickle layout
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from storage import Storage
+
 data_folder = r'../'*int(sys.argv[1]) + 'data/'
 print('data_folder = ' + data_folder)
 
@@ -11,104 +13,29 @@ saves_folder = r'../'*int(sys.argv[1]) + 'saves/'
 print('saves_folder = ' + saves_folder)
 
 # Create the assumed directories
-os.makedirs(name=data_folder+'csv', exist_ok=True)
-os.makedirs(name=saves_folder+'pickle', exist_ok=True)
-os.makedirs(name=saves_folder+'csv', exist_ok=True)
+storage = Storage(data_folder=data_folder, saves_folder=saves_folder)
 
 # Handy list of the different types of encodings
-encoding = ['latin1', 'iso8859-1', 'utf-8'][2]
+encoding = storage.encoding_type
 
 def load_csv(csv_name=None, folder_path=None):
-    if folder_path is None:
-        csv_folder = data_folder + 'csv/'
-    else:
-        csv_folder = folder_path + 'csv/'
-    if csv_name is None:
-        csv_path = max([os.path.join(csv_folder, f) for f in os.listdir(csv_folder)],
-                       key=os.path.getmtime)
-    else:
-        csv_path = csv_folder + csv_name + '.csv'
-    data_frame = pd.read_csv(csv_path, encoding=encoding)
     
-    return(data_frame)
+    return storage.load_csv(csv_name=csv_name, folder_path=folder_path)
 
 def load_dataframes(**kwargs):
-    frame_dict = {}
-    for frame_name in kwargs:
-        pickle_path = saves_folder + 'pickle/' + frame_name + '.pickle'
-        if not os.path.isfile(pickle_path):
-            print('No pickle exists at ' + pickle_path + ' - attempting to load a saves folder csv.')
-            csv_folder = saves_folder + 'csv/'
-            csv_path = csv_folder + frame_name + '.csv'
-            if not os.path.isfile(csv_path):
-                print('No csv exists at ' + csv_path + ' - trying the data folder.')
-                csv_path = data_folder + 'csv/' + frame_name + '.csv'
-                if not os.path.isfile(csv_path):
-                    print('No csv exists at ' + csv_path + ' - just forget it.')
-                    frame_dict[frame_name] = None
-                else:
-                    frame_dict[frame_name] = load_csv(csv_name=frame_name)
-            else:
-                frame_dict[frame_name] = load_csv(csv_name=frame_name, folder_path=csv_folder)
-        else:
-            frame_dict[frame_name] = load_object(frame_name)
     
-    return frame_dict
+    return storage.load_dataframes(**kwargs)
 
 def load_object(obj_name, download_url=None):
-    pickle_path = saves_folder + 'pickle/' + obj_name + '.pickle'
-    if not os.path.isfile(pickle_path):
-        print('No pickle exists at ' + pickle_path + ' - attempting to load as csv.')
-        csv_path = saves_folder + 'csv/' + obj_name + '.csv'
-        if not os.path.isfile(csv_path):
-            print('No csv exists at ' + csv_path + ' - attempting to download from URL.')
-            object = pd.read_csv(download_url, low_memory=False,
-                                 encoding=encoding)
-        else:
-            object = pd.read_csv(csv_path, low_memory=False,
-                                 encoding=encoding)
-        if isinstance(object, pd.DataFrame):
-            attempt_to_pickle(object, pickle_path, raise_exception=False)
-        else:
-            with open(pickle_path, 'wb') as handle:
-                pickle.dump(object, handle, pickle.HIGHEST_PROTOCOL)
-    else:
-        try:
-            object = pd.read_pickle(pickle_path)
-        except:
-            with open(pickle_path, 'rb') as handle:
-                object = pickle.load(handle)
     
-    return(object)
+    return storage.load_object(obj_name, download_url=download_url)
 
 def save_dataframes(include_index=False, **kwargs):
-    csv_folder = saves_folder + 'csv/'
-    for frame_name in kwargs:
-        if isinstance(kwargs[frame_name], pd.DataFrame):
-            csv_path = csv_folder + frame_name + '.csv'
-            kwargs[frame_name].to_csv(csv_path, sep=',', encoding=encoding,
-                                      index=include_index)
+    storage.save_dataframes(include_index=include_index, **kwargs)
 
 # Classes, functions, and methods cannot be pickled
 def store_objects(**kwargs):
-    for obj_name in kwargs:
-        if hasattr(kwargs[obj_name], '__call__'):
-            raise RuntimeError('Functions cannot be pickled.')
-        obj_path = saves_folder + 'pickle/' + str(obj_name)
-        pickle_path = obj_path + '.pickle'
-        if isinstance(kwargs[obj_name], pd.DataFrame):
-            attempt_to_pickle(kwargs[obj_name], pickle_path, raise_exception=False)
-        else:
-            print('Pickling to ' + pickle_path)
-            with open(pickle_path, 'wb') as handle:
-                pickle.dump(kwargs[obj_name], handle, pickle.HIGHEST_PROTOCOL)
+    storage.store_objects(**kwargs)
 
 def attempt_to_pickle(df, pickle_path, raise_exception=False):
-    try:
-        print('Pickling to ' + pickle_path)
-        df.to_pickle(pickle_path)
-    except Exception as e:
-        os.remove(pickle_path)
-        print(e, ': Couldn\'t save ' + '{:,}'.format(df.shape[0]*df.shape[1]) + ' cells as a pickle.')
-        if raise_exception:
-            raise
\ No newline at end of file
+    storage.attempt_to_pickle(df, pickle_path, raise_exception=raise_exception)
@@ -0,0 +1,342 @@
+#!/usr/bin/env python
+# Anvil Writer for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+AnvilWriter: Patch a quantized build straight into the .mca region files of a
+world save, re-encoding only the chunk sections under the build
+"""
+from concurrent.futures import ThreadPoolExecutor
+from nbt_reader import NbtReader
+from nbt_writer import NbtWriter, TAG_BYTE, TAG_COMPOUND, TAG_LIST, TAG_LONG_ARRAY, TAG_INT, TAG_LONG, TAG_STRING
+from structure_export import AIR_STATE, DATA_VERSION, StructureExporter, parse_block_state
+import gzip
+import io
+import mmap
+import numpy as np
+import os
+import struct
+import time
+import zlib
+
+# Region files are 32×32 chunks, in 4 KiB sectors after a locations sector and a timestamps sector
+SECTOR_SIZE = 4096
+REGION_CHUNKS = 32
+GZIP_COMPRESSION = 1
+ZLIB_COMPRESSION = 2
+NO_COMPRESSION = 3
+
+# Chunks from before 1.18 keep their sections in another layout
+MIN_DATA_VERSION = 2844
+
+# The overworld of 1.18 runs from y=-64 to y=319
+MIN_SECTION_Y = -4
+MAX_SECTION_Y = 19
+DEFAULT_BIOME = 'minecraft:plains'
+DIMENSION_DIRS_DICT = {'overworld': 'region', 'the_nether': os.path.join('DIM-1', 'region'),
+                       'the_end': os.path.join('DIM1', 'region')}
+
+def get_palette_tag(block_state):
+    name, properties_dict = parse_block_state(block_state)
+    palette_dict = {'Name': (TAG_STRING, name)}
+    if properties_dict:
+        palette_dict['Properties'] = (TAG_COMPOUND, {key: (TAG_STRING, value)
+                                                     for key, value in sorted(properties_dict.items())})
+
+    return palette_dict
+
+def get_palette_key(palette_dict):
+    """Return the block state string of a palette compound, with its properties sorted."""
+    block_state = palette_dict['Name'][1]
+    if 'Properties' in palette_dict:
+        properties_list = sorted(palette_dict['Properties'][1].items())
+        block_state += '[' + ','.join(f'{key}={value}' for key, (_, value) in properties_list) + ']'
+
+    return block_state
+
+def get_bits_per_block(palette_length):
+
+    return max(4, (palette_length - 1).bit_length())
+
+def unpack_block_states(data_array, palette_length):
+    """Unpack the 4096 palette indices of a section, which since 1.16 never span two longs."""
+    if data_array is None:
+
+        return np.zeros(4096, dtype=np.int64)
+    bits = get_bits_per_block(palette_length)
+    shifts_array = np.arange(64 // bits, dtype=np.uint64) * np.uint64(bits)
+    longs_array = np.asarray(data_array, dtype='>i8').view('>u8').astype(np.uint64)
+    values_array = (longs_array[:, None] >> shifts_array) & np.uint64((1 << bits) - 1)
+
+    return values_array.reshape(-1)[:4096].astype(np.int64)
+
+def pack_block_states(indices_array, palette_length):
+    bits = get_bits_per_block(palette_length)
+    values_per_long = 64 // bits
+    long_count = -(-4096 // values_per_long)
+    padded_array = np.zeros(long_count * values_per_long, dtype=np.uint64)
+    padded_array[:4096] = indices_array
+    shifts_array = np.arange(values_per_long, dtype=np.uint64) * np.uint64(bits)
+    longs_array = np.bitwise_or.reduce(padded_array.reshape(long_count, values_per_long) << shifts_array, axis=1)
+
+    return longs_array.view(np.int64).astype('>i8')
+
+def get_empty_section_dict(section_y):
+
+    return {'Y': (TAG_BYTE, section_y),
+            'block_states': (TAG_COMPOUND, {'palette': (TAG_LIST, (TAG_COMPOUND, [get_palette_tag(AIR_STATE)]))}),
+            'biomes': (TAG_COMPOUND, {'palette': (TAG_LIST, (TAG_STRING, [DEFAULT_BIOME]))})}
+
+def get_empty_chunk_dict(chunk_x, chunk_z, data_version=DATA_VERSION):
+    """Return a fully generated chunk of air, with its light and heightmaps left for the game to compute."""
+    sections_list = [get_empty_section_dict(section_y) for section_y in range(MIN_SECTION_Y, MAX_SECTION_Y + 1)]
+    chunk_dict = {'DataVersion': (TAG_INT, data_version), 'xPos': (TAG_INT, chunk_x), 'yPos': (TAG_INT, MIN_SECTION_Y),
+                  'zPos': (TAG_INT, chunk_z), 'Status': (TAG_STRING, 'full'), 'LastUpdate': (TAG_LONG, 0),
+                  'InhabitedTime': (TAG_LONG, 0), 'isLightOn': (TAG_BYTE, 0),
+                  'sections': (TAG_LIST, (TAG_COMPOUND, sections_list)),
+                  'block_entities': (TAG_LIST, (TAG_COMPOUND, []))}
+
+    return chunk_dict
+
+def get_chunk_bytes(chunk_dict):
+    buffer = io.BytesIO()
+    NbtWriter(buffer).write_tag(TAG_COMPOUND, '', chunk_dict)
+
+    return buffer.getvalue()
+
+def read_chunk_dict(region_mmap, location):
+    """Read the chunk at a region header location: a sector offset in the top 24 bits and a sector count."""
+    offset = (location >> 8) * SECTOR_SIZE
+    length, compression = struct.unpack_from('>iB', region_mmap, offset)
+    payload_bytes = region_mmap[offset+5:offset+4+length]
+    if compression == ZLIB_COMPRESSION:
+        payload_bytes = zlib.decompress(payload_bytes)
+    elif compression == GZIP_COMPRESSION:
+        payload_bytes = gzip.decompress(payload_bytes)
+    elif compression != NO_COMPRESSION:
+        raise ValueError(f'Unsupported chunk compression {compression}: oversized chunks in .mcc files are not read')
+
+    return NbtReader(payload_bytes).read_named_tag()[2]
+
+def read_region_locations(region_mmap):
+
+    return np.frombuffer(region_mmap, dtype='>u4', count=REGION_CHUNKS * REGION_CHUNKS).astype(np.int64)
+
+def write_region_chunks(region_path, payloads_dict, max_workers=None):
+    """
+    :param payloads_dict:  uncompressed chunk NBT bytes by index in the region, x + 32*z
+    :param max_workers:    number of threads compressing the chunks
+    """
+
+    # zlib releases the GIL, so the chunks compress in parallel
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        compressed_list = list(executor.map(zlib.compress, payloads_dict.values()))
+    if not os.path.isfile(region_path):
+        os.makedirs(os.path.dirname(os.path.abspath(region_path)), exist_ok=True)
+        with open(region_path, 'wb') as f:
+            f.write(bytes(2 * SECTOR_SIZE))
+    with open(region_path, 'r+b') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        end_sector = max(2, -(-file_size // SECTOR_SIZE))
+        region_mmap = mmap.mmap(f.fileno(), 0)
+        locations_array = read_region_locations(region_mmap)
+
+        # Rewrite a chunk in its own sectors if it still fits, and otherwise move it to the end
+        placements_list = []
+        for index, compressed_bytes in zip(payloads_dict.keys(), compressed_list):
+            chunk_bytes = struct.pack('>iB', len(compressed_bytes) + 1, ZLIB_COMPRESSION) + compressed_bytes
+            sector_count = -(-len(chunk_bytes) // SECTOR_SIZE)
+            if sector_count > 255:
+                raise ValueError(f'Chunk {index} of {region_path} needs {sector_count} sectors, over the limit of 255')
+            old_sector, old_sector_count = locations_array[index] >> 8, locations_array[index] & 0xFF
+            if (old_sector >= 2) and (sector_count <= old_sector_count):
+                sector = int(old_sector)
+            else:
+                sector = end_sector
+                end_sector += sector_count
+            placements_list.append((index, sector, sector_count, chunk_bytes))
+        if end_sector * SECTOR_SIZE > file_size:
+            region_mmap.close()
+            f.truncate(end_sector * SECTOR_SIZE)
+            region_mmap = mmap.mmap(f.fileno(), 0)
+        timestamp = int(time.time())
+        for index, sector, sector_count, chunk_bytes in placements_list:
+            start = sector * SECTOR_SIZE
+            stop = start + sector_count * SECTOR_SIZE
+            region_mmap[start:stop] = chunk_bytes + bytes(stop - start - len(chunk_bytes))
+            struct.pack_into('>I', region_mmap, 4 * index, (sector << 8) | sector_count)
+            struct.pack_into('>I', region_mmap, SECTOR_SIZE + 4 * index, timestamp)
+        region_mmap.flush()
+        region_mmap.close()
+
+def get_region_path(world_dir, region_x, region_z, dimension='overworld'):
+
+    return os.path.join(world_dir, DIMENSION_DIRS_DICT[dimension], f'r.{region_x}.{region_z}.mca')
+
+def write_empty_world(world_dir, chunk_positions_list, dimension='overworld', data_version=DATA_VERSION):
+    """Write region files of empty chunks, as a fixture to try AnvilWriter against."""
+    regions_dict = {}
+    for chunk_x, chunk_z in chunk_positions_list:
+        index = (chunk_x % REGION_CHUNKS) + REGION_CHUNKS * (chunk_z % REGION_CHUNKS)
+        payloads_dict = regions_dict.setdefault((chunk_x // REGION_CHUNKS, chunk_z // REGION_CHUNKS), {})
+        payloads_dict[index] = get_chunk_bytes(get_empty_chunk_dict(chunk_x, chunk_z, data_version=data_version))
+    for (region_x, region_z), payloads_dict in regions_dict.items():
+        write_region_chunks(get_region_path(world_dir, region_x, region_z, dimension=dimension), payloads_dict)
+
+class AnvilWriter(StructureExporter):
+    """This class places the floor laid out by StructureExporter at world
+    coordinates and writes it into a world's region files. Only the chunks
+    under the build are read and rewritten, and in them only the sections
+    holding its blocks are unpacked, patched and repacked; the game
+    recomputes their light and heightmaps on load. Air in the build leaves
+    the world alone. Close the world in Minecraft before writing to it.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import anvil_writer
+    >>> writer = anvil_writer.AnvilWriter(block_grid, horizontal_offset=-495, vertical_offset=207, y=-60)
+    >>> writer.write('../saves/worlds/Pixel Art')
+    """
+
+    def __init__(self, block_grid, name='pixel_art', horizontal_offset=0, vertical_offset=0, y=64,
+                 allow_side_textures=False):
+        """
+        :param horizontal_offset:  the X coordinate of column 0
+        :param vertical_offset:    the Z coordinate of row 0
+        :param y:                  the Y coordinate of the floor
+        """
+        super().__init__(block_grid, name=name, allow_side_textures=allow_side_textures)
+        self.horizontal_offset = horizontal_offset
+        self.vertical_offset = vertical_offset
+        self.y = y
+        self.palette_keys_list = [get_palette_key(get_palette_tag(block_state)) for block_state in self.states_list]
+    
+    
+    
+    def get_block_changes(self):
+        """Return the world x, y and z, and the palette index, of every non-air block of the build."""
+        changes_list = []
+        for layer, lut_array in enumerate(self.layer_luts_list):
+            values_array = lut_array[self.block_grid.codes_array]
+            rows_array, columns_array = np.nonzero(values_array)
+            x_array = columns_array + self.block_grid.column_start + self.horizontal_offset
+            z_array = rows_array + self.block_grid.row_start + self.vertical_offset
+
+            # The top layer is the floor, and any backing layer is under it
+            y_array = np.full(len(x_array), self.y - (self.height - 1 - layer))
+            changes_list.append(np.stack([x_array, y_array, z_array, values_array[rows_array, columns_array]], axis=1))
+        changes_array = np.concatenate(changes_list).astype(np.int64)
+        if len(changes_array) and ((changes_array[:, 1].min() < MIN_SECTION_Y * 16) or
+                                   (changes_array[:, 1].max() >= (MAX_SECTION_Y + 1) * 16)):
+            raise ValueError(f'The build must lie between y={MIN_SECTION_Y * 16} and y={(MAX_SECTION_Y + 1) * 16 - 1}')
+
+        return changes_array
+    
+    
+    
+    def patch_chunk(self, chunk_dict, changes_array):
+        """Write the blocks that fall in one chunk into it, re-encoding only the sections they touch."""
+        data_version = chunk_dict.get('DataVersion', (TAG_INT, 0))[1]
+        if data_version < MIN_DATA_VERSION:
+            raise ValueError(f'Chunk data version {data_version} predates 1.18, which this writer needs')
+        _, sections_list = chunk_dict['sections'][1]
+        sections_dict = {section_dict['Y'][1]: section_dict for section_dict in sections_list}
+        section_y_array = changes_array[:, 1] >> 4
+        for section_y in np.unique(section_y_array).tolist():
+            section_changes_array = changes_array[section_y_array == section_y]
+            if section_y not in sections_dict:
+                sections_dict[section_y] = get_empty_section_dict(section_y)
+                sections_list.append(sections_dict[section_y])
+            block_states_dict = sections_dict[section_y]['block_states'][1]
+            _, palette_list = block_states_dict['palette'][1]
+            palette_keys_list = [get_palette_key(palette_dict) for palette_dict in palette_list]
+            data_array = block_states_dict['data'][1] if 'data' in block_states_dict else None
+            indices_array = unpack_block_states(data_array, len(palette_list))
+
+            # Map the build's palette onto the section's, adding the blocks it lacks
+            lookup_array = np.full(len(self.states_list), -1, dtype=np.int64)
+            for state_index in np.unique(section_changes_array[:, 3]).tolist():
+                palette_key = self.palette_keys_list[state_index]
+                if palette_key not in palette_keys_list:
+                    palette_keys_list.append(palette_key)
+                    palette_list.append(get_palette_tag(self.states_list[state_index]))
+                lookup_array[state_index] = palette_keys_list.index(palette_key)
+            local_array = ((section_changes_array[:, 1] & 15) * 256 + (section_changes_array[:, 2] & 15) * 16 +
+                           (section_changes_array[:, 0] & 15))
+            indices_array[local_array] = lookup_array[section_changes_array[:, 3]]
+
+            # Drop the blocks that were painted over, so the palette stays as small as it can
+            used_indices_array, compact_indices_array = np.unique(indices_array, return_inverse=True)
+            palette_list[:] = [palette_list[index] for index in used_indices_array.tolist()]
+            if len(palette_list) == 1:
+                block_states_dict.pop('data', None)
+            else:
+                block_states_dict['data'] = (TAG_LONG_ARRAY, pack_block_states(compact_indices_array.reshape(-1),
+                                                                               len(palette_list)))
+            sections_dict[section_y].pop('BlockLight', None)
+            sections_dict[section_y].pop('SkyLight', None)
+        sections_list.sort(key=lambda section_dict: section_dict['Y'][1])
+        chunk_dict['sections'] = (TAG_LIST, (TAG_COMPOUND, sections_list))
+        chunk_dict.pop('Heightmaps', None)
+        chunk_dict['isLightOn'] = (TAG_BYTE, 0)
+    
+    
+    
+    def write(self, world_dir, dimension='overworld', create_missing_chunks=False, max_workers=None):
+        """
+        :param world_dir:              the world save folder, holding level.dat
+        :param create_missing_chunks:  True to write chunks that were never generated as air with the build in
+                                       them, False to leave them out
+        :param max_workers:            number of threads compressing the chunks
+        :return:                       lists of the (chunk_x, chunk_z) written and of those left out
+        """
+        changes_array = self.get_block_changes()
+        chunk_x_array = changes_array[:, 0] >> 4
+        chunk_z_array = changes_array[:, 2] >> 4
+        chunk_positions_array, inverse_array = np.unique(np.stack([chunk_x_array, chunk_z_array], axis=1), axis=0,
+                                                         return_inverse=True)
+        inverse_array = inverse_array.reshape(-1)
+        order_array = np.argsort(inverse_array, kind='stable')
+        splits_array = np.cumsum(np.bincount(inverse_array, minlength=len(chunk_positions_array)))[:-1]
+        chunk_changes_list = np.split(changes_array[order_array], splits_array)
+
+        # Group the touched chunks by region file
+        regions_dict = {}
+        for (chunk_x, chunk_z), chunk_changes_array in zip(chunk_positions_array.tolist(), chunk_changes_list):
+            regions_dict.setdefault((chunk_x >> 5, chunk_z >> 5), []).append((chunk_x, chunk_z, chunk_changes_array))
+        written_chunks_list = []
+        missing_chunks_list = []
+        for (region_x, region_z), chunks_list in regions_dict.items():
+            region_path = get_region_path(world_dir, region_x, region_z, dimension=dimension)
+            locations_array = np.zeros(REGION_CHUNKS * REGION_CHUNKS, dtype=np.int64)
+            region_mmap = None
+            if os.path.isfile(region_path) and (os.path.getsize(region_path) >= 2 * SECTOR_SIZE):
+                with open(region_path, 'rb') as f:
+                    region_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                locations_array = read_region_locations(region_mmap)
+            payloads_dict = {}
+            for chunk_x, chunk_z, chunk_changes_array in chunks_list:
+                index = (chunk_x & 31) + REGION_CHUNKS * (chunk_z & 31)
+                if locations_array[index] != 0:
+                    chunk_dict = read_chunk_dict(region_mmap, int(locations_array[index]))
+                elif create_missing_chunks:
+                    chunk_dict = get_empty_chunk_dict(chunk_x, chunk_z, data_version=self.data_version)
+                else:
+                    missing_chunks_list.append((chunk_x, chunk_z))
+                    continue
+                self.patch_chunk(chunk_dict, chunk_changes_array)
+                payloads_dict[index] = get_chunk_bytes(chunk_dict)
+                written_chunks_list.append((chunk_x, chunk_z))
+            if region_mmap is not None:
+                region_mmap.close()
+            if payloads_dict:
+                write_region_chunks(region_path, payloads_dict, max_workers=max_workers)
+
+        return written_chunks_list, missing_chunks_list
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# Block Grid for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+BlockGrid: O(1) (row, column) access to the blocks of a pixel art build, held
+as an int16 code grid plus a small blocks table
+"""
+import numpy as np
+import pandas as pd
+
+class BlockGrid(object):
+    """This class holds a build as a 2-D array of block codes plus a small
+    table of the attributes of each code, so that renderers can look up any
+    cell without filtering the whole file names dataframe.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import block_grid
+    >>> grid = block_grid.BlockGrid.from_dataframe(file_names_df)
+    >>> grid[(row, col)]['block_name']
+    >>> grid.to_dataframe()
+    """
+
+    def __init__(self, codes_array, blocks_df, row_start=0, column_start=0):
+        self.codes_array = codes_array
+        self.blocks_df = blocks_df
+        self.row_start = row_start
+        self.column_start = column_start
+        self.records_list = blocks_df.to_dict(orient='records')
+        self.dataframe = None
+    
+    
+    
+    @classmethod
+    def from_dataframe(cls, file_names_df):
+        row_start = int(file_names_df.row_number.min())
+        column_start = int(file_names_df.column_number.min())
+        row_count = int(file_names_df.row_number.max()) - row_start + 1
+        column_count = int(file_names_df.column_number.max()) - column_start + 1
+
+        # One code per distinct block, with its attributes kept once in the blocks table
+        codes_array, file_names_index = pd.factorize(file_names_df.file_name)
+        first_indices = pd.Series(np.arange(len(codes_array))).groupby(codes_array).first()
+        blocks_df = file_names_df.iloc[first_indices.values][['file_name', 'block_name', 'hex_str']]
+        blocks_df = blocks_df.astype(str).reset_index(drop=True)
+        grid_array = np.full((row_count, column_count), -1, dtype=np.int16)
+        grid_array[file_names_df.row_number.values - row_start,
+                   file_names_df.column_number.values - column_start] = codes_array
+
+        return cls(grid_array, blocks_df, row_start=row_start, column_start=column_start)
+    
+    
+    
+    @classmethod
+    def from_labels(cls, labels_array, file_names_list, get_attributes_dict):
+        """
+        :param labels_array:         H×W grid of indices into file_names_list
+        :param get_attributes_dict:  function returning the block_name, hex_str and RGB attributes of a file name
+        :return:                     a BlockGrid with one int16 code per cell and one blocks table row per block used
+        """
+        used_labels_array, codes_array = np.unique(labels_array.reshape(-1), return_inverse=True)
+        rows_list = []
+        for label in used_labels_array.tolist():
+            attributes_dict = {'file_name': file_names_list[label]}
+            attributes_dict.update(get_attributes_dict(file_names_list[label]))
+            rows_list.append(attributes_dict)
+        blocks_df = pd.DataFrame(rows_list)
+        grid_array = codes_array.reshape(labels_array.shape).astype(np.int16)
+
+        return cls(grid_array, blocks_df)
+    
+    
+    
+    @property
+    def shape(self):
+
+        return self.codes_array.shape
+    
+    
+    
+    def get_code(self, row, col):
+        grid_row = row - self.row_start
+        grid_column = col - self.column_start
+        if (grid_row < 0) or (grid_column < 0):
+            raise IndexError(f'Row {row}, column {col} is outside of the grid')
+        code = self.codes_array[grid_row, grid_column]
+        if code < 0:
+            raise IndexError(f'Row {row}, column {col} is not in the grid')
+
+        return code
+    
+    
+    
+    def __getitem__(self, row_col_tuple):
+        row, col = row_col_tuple
+        attributes_dict = {'row_number': row, 'column_number': col}
+        attributes_dict.update(self.records_list[self.get_code(row, col)])
+
+        return attributes_dict
+    
+    
+    
+    def get_file_name(self, row, col):
+
+        return self.records_list[self.get_code(row, col)]['file_name']
+    
+    
+    
+    def get_mask(self, *file_names):
+        """Return a boolean grid of the cells holding any of the blocks."""
+        codes_list = np.flatnonzero(self.blocks_df.file_name.isin(file_names).values).tolist()
+
+        return np.isin(self.codes_array, codes_list)
+    
+    
+    
+    def get_value_counts(self, column_name='block_name'):
+        """Count the cells of each value of a blocks table column, most common first."""
+        counts_array = np.bincount(self.codes_array[self.codes_array >= 0], minlength=len(self.blocks_df))
+        counts_series = pd.Series(counts_array, index=self.blocks_df[column_name].values)
+        counts_series = counts_series.groupby(level=0, sort=False).sum().sort_values(ascending=False, kind='stable')
+
+        return counts_series[counts_series > 0]
+    
+    
+    
+    def get_memory_usage(self):
+
+        return self.codes_array.nbytes + int(self.blocks_df.memory_usage(deep=True).sum())
+    
+    
+    
+    def to_dataframe(self, mask_array=None):
+        """
+        :param mask_array:  boolean grid of the cells to include, or None for all of them
+        :return:            one row per cell with categorical file_name, block_name and hex_str columns;
+                            the full dataframe is only built on first use, and then cached
+        """
+        if (mask_array is None) and (self.dataframe is not None):
+
+            return self.dataframe
+        cells_mask_array = self.codes_array >= 0
+        if mask_array is not None:
+            cells_mask_array &= mask_array
+        rows_array, columns_array = np.nonzero(cells_mask_array)
+        codes_array = self.codes_array[rows_array, columns_array]
+        columns_dict = {'row_number': rows_array + self.row_start, 'column_number': columns_array + self.column_start}
+        for column_name in ['file_name', 'block_name', 'hex_str']:
+            categories_array, value_codes_array = np.unique(self.blocks_df[column_name].values.astype(str),
+                                                            return_inverse=True)
+            columns_dict[column_name] = pd.Categorical.from_codes(value_codes_array.reshape(-1)[codes_array],
+                                                                  categories=categories_array)
+        file_names_df = pd.DataFrame(columns_dict)
+        if mask_array is None:
+            self.dataframe = file_names_df
+
+        return file_names_df
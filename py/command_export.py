@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# Command Export for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+CommandExporter: Write a quantized build as a datapack of .mcfunction files,
+merging areas of identical blocks into /fill commands
+"""
+from structure_export import StructureExporter
+import itertools
+import json
+import numpy as np
+import os
+import re
+
+# Game limits: blocks per /fill, and the default maxCommandChainLength game rule
+MAX_FILL_VOLUME = 32768
+MAX_COMMAND_CHAIN_LENGTH = 65536
+
+# The datapack format of 1.18
+PACK_FORMAT = 8
+
+def iter_runs(indices_array):
+    """Yield (start, length, value) for each run of equal values in a 1-D array."""
+    change_indices_array = np.flatnonzero(np.diff(indices_array)) + 1
+    starts_array = np.concatenate([[0], change_indices_array])
+    lengths_array = np.diff(np.concatenate([starts_array, [len(indices_array)]]))
+
+    return zip(starts_array.tolist(), lengths_array.tolist(), indices_array[starts_array].tolist())
+
+class CommandExporter(StructureExporter):
+    """This class turns the floor laid out by StructureExporter into /fill and
+    /setblock commands at world coordinates. A layer with no air first gets
+    its commonest block filled across it, and the other blocks are then
+    covered by greedy rectangles painted on top. The commands are split into
+    functions short enough for one command chain, which the main function
+    schedules on successive ticks.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import command_export
+    >>> exporter = command_export.CommandExporter(block_grid, name='shuriken', horizontal_offset=-495, vertical_offset=207)
+    >>> exporter.export('../saves/datapacks/shuriken')
+    """
+
+    def __init__(self, block_grid, name='pixel_art', horizontal_offset=0, vertical_offset=0, y='~',
+                 allow_side_textures=False):
+        """
+        :param horizontal_offset:  the X coordinate of column 0
+        :param vertical_offset:    the Z coordinate of row 0
+        :param y:                  the Y coordinate of the floor, or '~' for the height the function is run at,
+                                   which only works for builds small enough for one function (see export)
+        """
+        super().__init__(block_grid, name=name, allow_side_textures=allow_side_textures)
+        self.horizontal_offset = horizontal_offset
+        self.vertical_offset = vertical_offset
+        self.y = y
+        self.function_name = re.sub(r'[^a-z0-9_.-]', '_', name.lower())
+    
+    
+    
+    def iter_layer_rectangles(self, layer, values_array):
+        """Cover the non-air cells greedily: grow each rectangle right along its run, then down while
+        the whole strip below is the same block and not yet covered."""
+        row_count = values_array.shape[0]
+        covered_array = values_array == 0
+        for z in range(row_count):
+            for start, length, value in iter_runs(values_array[z]):
+                x = start
+                while (value != 0) and (x < start + length):
+                    if covered_array[z, x]:
+                        x += 1
+                        continue
+                    covered_slice_array = covered_array[z, x:start+length]
+                    width = int(np.argmax(covered_slice_array)) if covered_slice_array.any() else len(covered_slice_array)
+                    depth = 1
+                    while (z + depth < row_count) and ((depth + 1) * width <= MAX_FILL_VOLUME):
+                        if (values_array[z+depth, x:x+width] != value).any() or covered_array[z+depth, x:x+width].any():
+                            break
+                        depth += 1
+                    covered_array[z:z+depth, x:x+width] = True
+                    yield layer, z, x, depth, width, value
+                    x += width
+    
+    
+    
+    def iter_rectangles(self):
+        """Yield (layer, z, x, depth, width, palette index) rectangles, in the order they must be placed."""
+        row_count, column_count = self.block_grid.shape
+        for layer, lut_array in enumerate(self.layer_luts_list):
+            values_array = lut_array[self.block_grid.codes_array]
+            counts_array = np.bincount(values_array.ravel(), minlength=len(self.states_list))
+            if counts_array[0] == 0:
+                
+                # With no air to leave alone, lay the commonest block over the whole layer and paint the rest on top
+                background_index = int(counts_array.argmax())
+                strip_depth = max(1, MAX_FILL_VOLUME // column_count)
+                for z in range(0, row_count, strip_depth):
+                    yield layer, z, 0, min(strip_depth, row_count - z), column_count, background_index
+                values_array = np.where(values_array == background_index, 0, values_array)
+            for rectangle_tuple in self.iter_layer_rectangles(layer, values_array):
+                yield rectangle_tuple
+    
+    
+    
+    def get_y_str(self, layer):
+
+        # The top layer is the floor, and any backing layer is under it
+        y_offset = layer - (self.height - 1)
+        if self.y == '~':
+
+            return '~' if y_offset == 0 else f'~{y_offset}'
+
+        return str(self.y + y_offset)
+    
+    
+    
+    def iter_commands(self):
+        for layer, z, x, depth, width, state_index in self.iter_rectangles():
+            y_str = self.get_y_str(layer)
+            x1 = x + self.block_grid.column_start + self.horizontal_offset
+            z1 = z + self.block_grid.row_start + self.vertical_offset
+            block_state = self.states_list[state_index]
+            if (depth == 1) and (width == 1):
+                yield f'setblock {x1} {y_str} {z1} {block_state}'
+            else:
+                yield f'fill {x1} {y_str} {z1} {x1 + width - 1} {y_str} {z1 + depth - 1} {block_state}'
+    
+    
+    
+    def export(self, datapack_dir, namespace='pixel_art', max_commands=MAX_COMMAND_CHAIN_LENGTH - 1):
+        """
+        A build that needs more than one function has every part scheduled on its own tick. Scheduled
+        functions run as the server at world spawn, so such a build needs an absolute y, and its chunks
+        must be loaded when the parts run.
+        
+        :param datapack_dir:  the datapack folder to write, to be copied into a world's datapacks folder
+        :param max_commands:  the most commands in one function, under the command chain limit
+        :return:              the number of commands written
+        """
+        if max_commands >= MAX_COMMAND_CHAIN_LENGTH:
+            raise ValueError(f'max_commands must leave room in the {MAX_COMMAND_CHAIN_LENGTH} command chain for the call')
+        
+        # Look one command past the first part before writing anything, so a relative y fails cleanly
+        commands_iterator = self.iter_commands()
+        first_commands_list = list(itertools.islice(commands_iterator, max_commands + 1))
+        if (len(first_commands_list) > max_commands) and (self.y == '~'):
+            raise ValueError(f'{self.name} needs more than {max_commands} commands, so its parts are scheduled '
+                             "and run at world spawn; give an absolute y rather than '~'")
+        functions_dir = os.path.join(datapack_dir, 'data', namespace, 'functions')
+        os.makedirs(functions_dir, exist_ok=True)
+        with open(os.path.join(datapack_dir, 'pack.mcmeta'), 'w') as f:
+            json.dump({'pack': {'pack_format': PACK_FORMAT, 'description': f'{self.name} pixel art'}}, f)
+
+        # Stream the commands into numbered parts
+        command_count = 0
+        part_count = 0
+        f = None
+        for command_str in itertools.chain(first_commands_list, commands_iterator):
+            if (command_count % max_commands) == 0:
+                if f is not None:
+                    f.close()
+                part_count += 1
+                f = open(os.path.join(functions_dir, f'{self.function_name}_{part_count}.mcfunction'), 'w')
+            f.write(command_str + '\n')
+            command_count += 1
+        if f is not None:
+            f.close()
+
+        # Run a lone part in place, and otherwise schedule each part on its own tick, so each gets a whole command chain
+        with open(os.path.join(functions_dir, f'{self.function_name}.mcfunction'), 'w') as f:
+            for part in range(1, part_count + 1):
+                function_id = f'{namespace}:{self.function_name}_{part}'
+                if part_count == 1:
+                    f.write(f'function {function_id}\n')
+                else:
+                    f.write(f'schedule function {function_id} {part}t\n')
+
+        return command_count
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# Dithering for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+Ditherer: Floyd–Steinberg, Atkinson and Sierra error diffusion, and Bayer and
+blue-noise ordered dithering, on top of a nearest-block index
+"""
+import functools
+import numpy as np
+
+# Error diffusion kernels as (row offset, column offset, weight) tuples
+KERNELS_DICT = {
+    'floyd_steinberg': [(0, 1, 7/16), (1, -1, 3/16), (1, 0, 5/16), (1, 1, 1/16)],
+
+    # Atkinson only passes on 6/8 of the error, which keeps highlights and shadows clean
+    'atkinson': [(0, 1, 1/8), (0, 2, 1/8), (1, -1, 1/8), (1, 0, 1/8), (1, 1, 1/8), (2, 0, 1/8)],
+    'sierra': [(0, 1, 5/32), (0, 2, 3/32), (1, -2, 2/32), (1, -1, 4/32), (1, 0, 5/32), (1, 1, 4/32),
+               (1, 2, 3/32), (2, -1, 2/32), (2, 0, 3/32), (2, 1, 2/32)],
+    }
+ORDERED_METHODS_LIST = ['bayer', 'blue_noise']
+
+def get_bayer_matrix(size=8):
+    """Return the size×size Bayer index matrix, for a power of two size."""
+    bayer_array = np.zeros((1, 1), dtype=np.int64)
+    while bayer_array.shape[0] < size:
+        bayer_array = np.block([[4 * bayer_array, 4 * bayer_array + 2],
+                                [4 * bayer_array + 3, 4 * bayer_array + 1]])
+
+    return bayer_array
+
+@functools.lru_cache(maxsize=None)
+def get_blue_noise_matrix(size=64, sigma=1.5, seed=0):
+    """Return a size×size blue-noise rank matrix built with Ulichney's void-and-cluster method."""
+
+    # Gaussian energy of one point on the torus, centred on (0, 0)
+    offsets_array = np.minimum(np.arange(size), size - np.arange(size))
+    kernel_array = np.exp(-(offsets_array[:, None]**2 + offsets_array[None, :]**2) / (2 * sigma**2))
+    def toggle(pattern_array, energy_array, row, col, value):
+        pattern_array[row, col] = value
+        energy_array += (1 if value else -1) * np.roll(np.roll(kernel_array, row, axis=0), col, axis=1)
+    def get_tightest_cluster(pattern_array, energy_array):
+
+        return np.unravel_index(np.argmax(np.where(pattern_array, energy_array, -np.inf)), pattern_array.shape)
+    def get_largest_void(pattern_array, energy_array):
+
+        return np.unravel_index(np.argmin(np.where(pattern_array, np.inf, energy_array)), pattern_array.shape)
+
+    # Relax a sparse random pattern until moving its tightest cluster fills its largest void
+    rng = np.random.default_rng(seed)
+    pattern_array = np.zeros((size, size), dtype=bool)
+    energy_array = np.zeros((size, size))
+    for index in rng.choice(size * size, size=max(1, size * size // 10), replace=False).tolist():
+        toggle(pattern_array, energy_array, *divmod(index, size), True)
+    while True:
+        cluster_tuple = get_tightest_cluster(pattern_array, energy_array)
+        toggle(pattern_array, energy_array, *cluster_tuple, False)
+        void_tuple = get_largest_void(pattern_array, energy_array)
+        toggle(pattern_array, energy_array, *void_tuple, True)
+        if void_tuple == cluster_tuple:
+            break
+
+    # Rank the initial points by removing clusters, then the rest by filling voids
+    rank_array = np.zeros((size, size), dtype=np.int64)
+    ones_count = int(pattern_array.sum())
+    removal_pattern_array, removal_energy_array = pattern_array.copy(), energy_array.copy()
+    for rank in range(ones_count - 1, -1, -1):
+        cluster_tuple = get_tightest_cluster(removal_pattern_array, removal_energy_array)
+        toggle(removal_pattern_array, removal_energy_array, *cluster_tuple, False)
+        rank_array[cluster_tuple] = rank
+    for rank in range(ones_count, size * size):
+        void_tuple = get_largest_void(pattern_array, energy_array)
+        toggle(pattern_array, energy_array, *void_tuple, True)
+        rank_array[void_tuple] = rank
+
+    return rank_array
+
+class Ditherer(object):
+    """This class maps an image to block labels the way NearestBlockIndex.query
+    does, but spreads each pixel's quantization error over its neighbours, or
+    perturbs the pixels with a threshold map first, so that gradients become
+    patterns of blocks instead of bands. Error diffusion runs as a wavefront:
+    every pixel whose neighbours above and to the left are done is quantized in
+    the same vectorized step.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import dithering
+    >>> ditherer = dithering.Ditherer(block_index, method='sierra')
+    >>> labels_array = ditherer.dither(img_array)
+    """
+
+    def __init__(self, block_index, method='floyd_steinberg', spread=48, lut_array=None):
+        """
+        :param block_index:  the NearestBlockIndex of the palette
+        :param method:       'floyd_steinberg', 'atkinson', 'sierra', 'bayer' or 'blue_noise'
+        :param spread:       how far, in 0-255 units, ordered dithering may push a channel
+        :param lut_array:    an optional (2**bits)³ block lookup table to quantize through
+        """
+        if (method not in KERNELS_DICT) and (method not in ORDERED_METHODS_LIST):
+            raise ValueError(f'Unknown dithering method {method!r}: choose one of '
+                             f'{sorted(KERNELS_DICT) + ORDERED_METHODS_LIST}')
+        self.block_index = block_index
+        self.method = method
+        self.spread = spread
+        self.lut_array = lut_array
+    
+    
+    
+    def get_labels(self, pixels_array):
+        """Return the palette index of the nearest block for every row of an N×3 array of 0-255 colours."""
+        if self.lut_array is None:
+
+            return self.block_index.query(pixels_array)
+        shift = 8 - int(np.log2(self.lut_array.shape[0]))
+        channels_array = np.clip(np.rint(pixels_array), 0, 255).astype(np.intp) >> shift
+
+        return np.asarray(self.lut_array[channels_array[:, 0], channels_array[:, 1], channels_array[:, 2]],
+                          dtype=np.intp)
+    
+    
+    
+    def get_threshold_array(self, row_count, col_count):
+        if self.method == 'bayer':
+            index_array = get_bayer_matrix()
+        else:
+            index_array = get_blue_noise_matrix()
+
+        # Centre the thresholds on zero, then tile them over the image
+        threshold_array = (index_array + 0.5) / index_array.size - 0.5
+        tile_tuple = (-(-row_count // threshold_array.shape[0]), -(-col_count // threshold_array.shape[1]))
+
+        return np.tile(threshold_array, tile_tuple)[:row_count, :col_count]
+    
+    
+    
+    def get_ordered_labels(self, rgb_array):
+        threshold_array = self.get_threshold_array(*rgb_array.shape[:2])
+        pixels_array = np.clip(np.rint(rgb_array + self.spread * threshold_array[:, :, None]), 0, 255)
+        pixels_array = pixels_array.astype(np.int64).reshape(-1, 3)
+
+        # Query each distinct perturbed colour once, packed into one integer so np.unique sorts scalars
+        codes_array = (pixels_array[:, 0] << 16) | (pixels_array[:, 1] << 8) | pixels_array[:, 2]
+        unique_codes_array, inverse_array = np.unique(codes_array, return_inverse=True)
+        unique_pixels_array = np.column_stack([unique_codes_array >> 16, (unique_codes_array >> 8) & 255,
+                                               unique_codes_array & 255])
+        labels_array = self.get_labels(unique_pixels_array)[inverse_array.reshape(-1)]
+
+        return labels_array.reshape(rgb_array.shape[:2])
+    
+    
+    
+    def get_diffused_labels(self, rgb_array):
+        kernel_list = KERNELS_DICT[self.method]
+        row_count, col_count = rgb_array.shape[:2]
+
+        if any((row_offset < 0) or ((row_offset == 0) and (column_offset <= 0)) for row_offset, column_offset, _ in kernel_list):
+            raise ValueError(f'The {self.method} kernel must only push error right along its row or into rows below')
+
+        # Pixel (r, c) runs at step c + slope*r, after every pixel that pushes error into it, since a
+        # push down and to the left by (row_offset, column_offset) needs slope*row_offset > -column_offset
+        slope = 1 + max([0] + [-column_offset // row_offset for row_offset, column_offset, _ in kernel_list
+                               if row_offset > 0])
+        pad = max([abs(column_offset) for _, column_offset, _ in kernel_list])
+        bottom_pad = max([row_offset for row_offset, _, _ in kernel_list])
+
+        # Error pushed into the padding falls off the edges of the image
+        work_array = np.zeros((row_count + bottom_pad, col_count + 2 * pad, 3))
+        work_array[:row_count, pad:pad+col_count] = rgb_array
+        rgb_palette_array = self.block_index.rgb_array
+        labels_array = np.empty((row_count, col_count), dtype=np.intp)
+        for step in range(col_count + slope * (row_count - 1)):
+            first_row = max(0, -(-(step - col_count + 1) // slope))
+            last_row = min(row_count - 1, step // slope)
+            rows_array = np.arange(first_row, last_row + 1)
+            columns_array = step - slope * rows_array
+            pixels_array = np.clip(work_array[rows_array, columns_array + pad], 0, 255)
+            step_labels_array = self.get_labels(pixels_array)
+            labels_array[rows_array, columns_array] = step_labels_array
+            error_array = pixels_array - rgb_palette_array[step_labels_array]
+            for row_offset, column_offset, weight in kernel_list:
+                work_array[rows_array + row_offset, columns_array + column_offset + pad] += weight * error_array
+
+        return labels_array
+    
+    
+    
+    def dither(self, img_array):
+        """
+        :param img_array:  H×W×3 (or H×W×4) array of pixel colours
+        :return:           H×W array of indices into the block index's file_names_list
+        """
+        rgb_array = np.asarray(img_array, dtype=np.float64)[:, :, :3]
+        if self.method in ORDERED_METHODS_LIST:
+
+            return self.get_ordered_labels(rgb_array)
+
+        return self.get_diffused_labels(rgb_array)
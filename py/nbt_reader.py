@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# NBT Reader for MineCraft world files
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+NbtReader: Parse Named Binary Tag data into a typed tree that NbtWriter.write_tag
+can write back byte for byte
+"""
+from nbt_writer import ARRAY_DTYPES_DICT, SCALAR_FORMATS_DICT, TAG_COMPOUND, TAG_END, TAG_LIST, TAG_STRING
+import numpy as np
+import struct
+
+class NbtReader(object):
+    """This class reads uncompressed NBT. Compounds become dictionaries of
+    (tag type, value) tuples, lists become (element type, values list)
+    tuples, arrays become big-endian numpy arrays, and scalars and strings
+    become Python values, so every tag keeps its type for writing back.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> import zlib
+    >>> sys.path.insert(1, '../py')
+    >>> import nbt_reader
+    >>> tag_type, name, chunk_dict = nbt_reader.NbtReader(zlib.decompress(chunk_bytes)).read_named_tag()
+    >>> chunk_dict['DataVersion']
+    (3, 2865)
+    """
+
+    def __init__(self, payload_bytes):
+        self.payload_bytes = payload_bytes
+        self.position = 0
+    
+    
+    
+    def read_struct(self, format_str):
+        values_tuple = struct.unpack_from(format_str, self.payload_bytes, self.position)
+        self.position += struct.calcsize(format_str)
+
+        return values_tuple
+    
+    
+    
+    def read_string(self):
+        length, = self.read_struct('>H')
+        string = self.payload_bytes[self.position:self.position+length].decode('utf-8')
+        self.position += length
+
+        return string
+    
+    
+    
+    def read_payload(self, tag_type):
+        if tag_type in SCALAR_FORMATS_DICT:
+
+            return self.read_struct(SCALAR_FORMATS_DICT[tag_type])[0]
+        if tag_type == TAG_STRING:
+
+            return self.read_string()
+        if tag_type in ARRAY_DTYPES_DICT:
+            length, = self.read_struct('>i')
+            values_array = np.frombuffer(self.payload_bytes, dtype=ARRAY_DTYPES_DICT[tag_type], count=length,
+                                         offset=self.position)
+            self.position += values_array.nbytes
+
+            return values_array
+        if tag_type == TAG_LIST:
+            element_type, length = self.read_struct('>bi')
+
+            return element_type, [self.read_payload(element_type) for _ in range(length)]
+        if tag_type == TAG_COMPOUND:
+            values_dict = {}
+            while True:
+                child_type, = self.read_struct('>b')
+                if child_type == TAG_END:
+
+                    return values_dict
+                child_name = self.read_string()
+                values_dict[child_name] = (child_type, self.read_payload(child_type))
+        raise ValueError(f'Unknown NBT tag type {tag_type} at byte {self.position}')
+    
+    
+    
+    def read_named_tag(self):
+        """Return the tag type, name and value of the root tag."""
+        tag_type, = self.read_struct('>b')
+        name = self.read_string()
+
+        return tag_type, name, self.read_payload(tag_type)
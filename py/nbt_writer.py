@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# Streaming NBT Writer for MineCraft structure files
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+NbtWriter: Write Named Binary Tag data to a file object as it goes, so that
+large arrays and lists never have to be held in memory as one tree
+"""
+import numpy as np
+import struct
+
+# NBT tag type IDs
+TAG_END = 0
+TAG_BYTE = 1
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_LONG = 4
+TAG_FLOAT = 5
+TAG_DOUBLE = 6
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+TAG_INT_ARRAY = 11
+TAG_LONG_ARRAY = 12
+
+# Big-endian payload formats of the scalar tags
+SCALAR_FORMATS_DICT = {TAG_BYTE: '>b', TAG_SHORT: '>h', TAG_INT: '>i', TAG_LONG: '>q', TAG_FLOAT: '>f',
+                       TAG_DOUBLE: '>d'}
+ARRAY_DTYPES_DICT = {TAG_BYTE_ARRAY: '>i1', TAG_INT_ARRAY: '>i4', TAG_LONG_ARRAY: '>i8'}
+
+def get_name_bytes(name):
+    name_bytes = name.encode('utf-8')
+
+    return struct.pack('>H', len(name_bytes)) + name_bytes
+
+class NbtWriter(object):
+    """This class writes NBT tags straight to a (usually gzip) file object.
+    Every method takes the tag name, or None when the tag is an element of a
+    list and so has no header. Arrays and lists are declared with their
+    length up front and then filled with write_raw or further tags.
+
+    Examples
+    --------
+
+    >>> import gzip
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import nbt_writer
+    >>> with gzip.open('../saves/nbt/example.nbt', 'wb') as f:
+    ...     writer = nbt_writer.NbtWriter(f)
+    ...     writer.begin_compound('')
+    ...     writer.write_int('DataVersion', 2865)
+    ...     writer.end_compound()
+    """
+
+    def __init__(self, file_obj):
+        self.file_obj = file_obj
+    
+    
+    
+    def write_raw(self, payload_bytes):
+        self.file_obj.write(payload_bytes)
+    
+    
+    
+    def write_header(self, tag_type, name):
+        if name is not None:
+            self.file_obj.write(bytes([tag_type]) + get_name_bytes(name))
+    
+    
+    
+    def write_scalar(self, tag_type, name, value):
+        self.write_header(tag_type, name)
+        self.file_obj.write(struct.pack(SCALAR_FORMATS_DICT[tag_type], value))
+    
+    
+    
+    def write_byte(self, name, value):
+        self.write_scalar(TAG_BYTE, name, value)
+    
+    
+    
+    def write_short(self, name, value):
+        self.write_scalar(TAG_SHORT, name, value)
+    
+    
+    
+    def write_int(self, name, value):
+        self.write_scalar(TAG_INT, name, value)
+    
+    
+    
+    def write_long(self, name, value):
+        self.write_scalar(TAG_LONG, name, value)
+    
+    
+    
+    def write_string(self, name, value):
+        self.write_header(TAG_STRING, name)
+        self.file_obj.write(get_name_bytes(value))
+    
+    
+    
+    def begin_array(self, tag_type, name, length):
+        """Declare a byte, int or long array, whose big-endian payload follows through write_raw."""
+        self.write_header(tag_type, name)
+        self.file_obj.write(struct.pack('>i', length))
+    
+    
+    
+    def write_int_array(self, name, values_list):
+        self.begin_array(TAG_INT_ARRAY, name, len(values_list))
+        self.file_obj.write(struct.pack(f'>{len(values_list)}i', *values_list))
+    
+    
+    
+    def begin_list(self, name, element_type, length):
+        """Declare a list, whose length elements follow as nameless tags."""
+        self.write_header(TAG_LIST, name)
+        if length == 0:
+            element_type = TAG_END
+        self.file_obj.write(struct.pack('>bi', element_type, length))
+    
+    
+    
+    def begin_compound(self, name):
+        self.write_header(TAG_COMPOUND, name)
+    
+    
+    
+    def end_compound(self):
+        self.file_obj.write(bytes([TAG_END]))
+    
+    
+    
+    def write_compound(self, name, values_dict):
+        """Write a compound of strings, ints and nested dictionaries in one call."""
+        self.begin_compound(name)
+        for key, value in values_dict.items():
+            if isinstance(value, dict):
+                self.write_compound(key, value)
+            elif isinstance(value, str):
+                self.write_string(key, value)
+            else:
+                self.write_int(key, value)
+        self.end_compound()
+    
+    
+    
+    def write_tag(self, tag_type, name, value):
+        """Write a whole tag tree as NbtReader reads it: compounds as dictionaries of (tag type, value)
+        tuples, lists as (element type, values list) tuples, and arrays as numpy arrays."""
+        if tag_type in SCALAR_FORMATS_DICT:
+            self.write_scalar(tag_type, name, value)
+        elif tag_type == TAG_STRING:
+            self.write_string(name, value)
+        elif tag_type in ARRAY_DTYPES_DICT:
+            self.begin_array(tag_type, name, len(value))
+            self.file_obj.write(np.asarray(value, dtype=ARRAY_DTYPES_DICT[tag_type]).tobytes())
+        elif tag_type == TAG_LIST:
+            element_type, values_list = value
+            self.begin_list(name, element_type, len(values_list))
+            for element_value in values_list:
+                self.write_tag(element_type, None, element_value)
+        elif tag_type == TAG_COMPOUND:
+            self.begin_compound(name)
+            for child_name, (child_type, child_value) in value.items():
+                self.write_tag(child_type, child_name, child_value)
+            self.end_compound()
+        else:
+            raise ValueError(f'Unknown NBT tag type {tag_type}')
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+# Nearest Block Index for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+NearestBlockIndex: A prebuilt nearest-neighbour index over a block palette,
+with selectable RGB, redmean, CIELAB, CIEDE2000 and OKLab colour metrics
+"""
+import numpy as np
+
+# sRGB (D65) to CIE XYZ, and the D65 reference white
+RGB_TO_XYZ_ARRAY = np.array([[0.4124564, 0.3575761, 0.1804375],
+                             [0.2126729, 0.7151522, 0.0721750],
+                             [0.0193339, 0.1191920, 0.9503041]])
+D65_WHITE_ARRAY = np.array([0.95047, 1.0, 1.08883])
+
+# Linear sRGB to OKLab (Björn Ottosson, 2020)
+RGB_TO_LMS_ARRAY = np.array([[0.4122214708, 0.5363325363, 0.0514459929],
+                             [0.2119034982, 0.6806995451, 0.1073969566],
+                             [0.0883024619, 0.2817188376, 0.6299787005]])
+LMS_TO_OKLAB_ARRAY = np.array([[0.2104542553, 0.7936177850, -0.0040720468],
+                               [1.9779984951, -2.4285922050, 0.4505937099],
+                               [0.0259040371, 0.7827717662, -0.8086757660]])
+
+def rgb_to_linear(rgb_array):
+    srgb_array = np.asarray(rgb_array, dtype=np.float64) / 255
+    
+    return np.where(srgb_array <= 0.04045, srgb_array / 12.92, ((srgb_array + 0.055) / 1.055)**2.4)
+
+def linear_to_rgb(linear_array):
+    linear_array = np.clip(np.asarray(linear_array, dtype=np.float64), 0, 1)
+    srgb_array = np.where(linear_array <= 0.0031308, linear_array * 12.92, 1.055 * linear_array**(1 / 2.4) - 0.055)
+    
+    return srgb_array * 255
+
+def rgb_to_lab(rgb_array):
+    xyz_array = rgb_to_linear(rgb_array) @ RGB_TO_XYZ_ARRAY.T / D65_WHITE_ARRAY
+    epsilon = 216 / 24389
+    kappa = 24389 / 27
+    f_array = np.where(xyz_array > epsilon, np.cbrt(xyz_array), (kappa * xyz_array + 16) / 116)
+    lab_array = np.stack([116 * f_array[:, 1] - 16,
+                          500 * (f_array[:, 0] - f_array[:, 1]),
+                          200 * (f_array[:, 1] - f_array[:, 2])], axis=1)
+    
+    return lab_array
+
+def rgb_to_oklab(rgb_array):
+    lms_array = np.cbrt(rgb_to_linear(rgb_array) @ RGB_TO_LMS_ARRAY.T)
+    
+    return lms_array @ LMS_TO_OKLAB_ARRAY.T
+
+def get_squared_euclidean_distances(pixels_array, palette_array):
+    distances_array = np.zeros((pixels_array.shape[0], palette_array.shape[0]))
+    for channel in range(3):
+        distances_array += (pixels_array[:, channel, None] - palette_array[None, :, channel])**2
+    
+    return distances_array
+
+def get_redmean_distances(pixels_array, palette_array):
+    """Weighted RGB distance from https://www.compuphase.com/cmetric.htm"""
+    red_mean_array = (pixels_array[:, 0, None] + palette_array[None, :, 0]) / 2
+    red_diff_array = pixels_array[:, 0, None] - palette_array[None, :, 0]
+    green_diff_array = pixels_array[:, 1, None] - palette_array[None, :, 1]
+    blue_diff_array = pixels_array[:, 2, None] - palette_array[None, :, 2]
+    distances_array = ((2 + red_mean_array / 256) * red_diff_array**2 + 4 * green_diff_array**2 +
+                       (2 + (255 - red_mean_array) / 256) * blue_diff_array**2)
+    
+    return np.sqrt(distances_array)
+
+def get_ciede2000_distances(pixels_array, palette_array):
+    """Vectorized CIEDE2000 colour difference between every CIELAB pixel and
+    every CIELAB palette colour (Sharma, Wu and Dalal, 2005)."""
+    L1, a1, b1 = [pixels_array[:, i, None] for i in range(3)]
+    L2, a2, b2 = [palette_array[None, :, i] for i in range(3)]
+    C_bar = (np.hypot(a1, b1) + np.hypot(a2, b2)) / 2
+    G = 0.5 * (1 - np.sqrt(C_bar**7 / (C_bar**7 + 25**7)))
+    a1_prime = (1 + G) * a1
+    a2_prime = (1 + G) * a2
+    C1_prime = np.hypot(a1_prime, b1)
+    C2_prime = np.hypot(a2_prime, b2)
+    h1_prime = np.degrees(np.arctan2(b1, a1_prime)) % 360
+    h2_prime = np.degrees(np.arctan2(b2, a2_prime)) % 360
+    C_product = C1_prime * C2_prime
+    
+    # Differences in lightness, chroma and hue
+    delta_L = L2 - L1
+    delta_C = C2_prime - C1_prime
+    delta_h = h2_prime - h1_prime
+    delta_h = np.where(delta_h > 180, delta_h - 360, np.where(delta_h < -180, delta_h + 360, delta_h))
+    delta_h = np.where(C_product == 0, 0, delta_h)
+    delta_H = 2 * np.sqrt(C_product) * np.sin(np.radians(delta_h) / 2)
+    
+    # Means, with the hue mean taken around the shorter arc
+    L_bar_prime = (L1 + L2) / 2
+    C_bar_prime = (C1_prime + C2_prime) / 2
+    h_sum = h1_prime + h2_prime
+    H_bar_prime = np.where(np.abs(h1_prime - h2_prime) <= 180, h_sum / 2,
+                           np.where(h_sum < 360, (h_sum + 360) / 2, (h_sum - 360) / 2))
+    H_bar_prime = np.where(C_product == 0, h_sum, H_bar_prime)
+    T = (1 - 0.17 * np.cos(np.radians(H_bar_prime - 30)) + 0.24 * np.cos(np.radians(2 * H_bar_prime)) +
+         0.32 * np.cos(np.radians(3 * H_bar_prime + 6)) - 0.20 * np.cos(np.radians(4 * H_bar_prime - 63)))
+    delta_theta = 30 * np.exp(-((H_bar_prime - 275) / 25)**2)
+    R_C = 2 * np.sqrt(C_bar_prime**7 / (C_bar_prime**7 + 25**7))
+    S_L = 1 + 0.015 * (L_bar_prime - 50)**2 / np.sqrt(20 + (L_bar_prime - 50)**2)
+    S_C = 1 + 0.045 * C_bar_prime
+    S_H = 1 + 0.015 * C_bar_prime * T
+    R_T = -np.sin(np.radians(2 * delta_theta)) * R_C
+    distances_array = ((delta_L / S_L)**2 + (delta_C / S_C)**2 + (delta_H / S_H)**2 +
+                       R_T * (delta_C / S_C) * (delta_H / S_H))
+    
+    return np.sqrt(np.maximum(distances_array, 0))
+
+# The metric engine: colour space conversion, pairwise distances, and
+# whether the metric is Euclidean in that space (and so can use a KD-tree)
+METRICS_DICT = {
+    'rgb': (lambda rgb_array: np.asarray(rgb_array, dtype=np.float64), get_squared_euclidean_distances, True),
+    'redmean': (lambda rgb_array: np.asarray(rgb_array, dtype=np.float64), get_redmean_distances, False),
+    'cie76': (rgb_to_lab, get_squared_euclidean_distances, True),
+    'ciede2000': (rgb_to_lab, get_ciede2000_distances, False),
+    'oklab': (rgb_to_oklab, get_squared_euclidean_distances, True),
+    }
+
+def register_metric(metric, to_color_space, get_distances, is_euclidean=False):
+    METRICS_DICT[metric] = (to_color_space, get_distances, is_euclidean)
+
+def get_color_distance(from_rgb_tuple, to_rgb_tuple, metric='rgb'):
+    to_color_space, get_distances, is_euclidean = METRICS_DICT[metric]
+    from_array = to_color_space(np.array([tuple(from_rgb_tuple)[:3]], dtype=np.float64))
+    to_array = to_color_space(np.array([tuple(to_rgb_tuple)[:3]], dtype=np.float64))
+    color_distance = get_distances(from_array, to_array)[0, 0]
+    if is_euclidean:
+        color_distance = np.sqrt(color_distance)
+    
+    return color_distance
+
+class NearestBlockIndex(object):
+    """This class answers batched nearest-block queries against a
+    palette of texture colours, returning the same block choice as
+    sorting the palette by Euclidean distance: ties go to the block
+    that comes first in the palette dictionary. The palette is converted
+    to the metric's colour space once, when the index is built.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import nearest_blocks
+    >>> block_index = nearest_blocks.NearestBlockIndex(rgb_dict, metric='ciede2000')
+    """
+
+    def __init__(self, rgb_dict, metric='rgb', chunk_size=4096):
+        if metric not in METRICS_DICT:
+            raise ValueError(f'Unknown colour metric {metric!r}: choose one of {sorted(METRICS_DICT)}')
+        self.metric = metric
+        self.to_color_space, self.get_distances, self.is_euclidean = METRICS_DICT[metric]
+        self.file_names_list = list(rgb_dict.keys())
+        rgb_array = np.array([tuple(rgb_dict[file_name])[:3] for file_name in self.file_names_list],
+                             dtype=np.float64).reshape(-1, 3)
+        self.rgb_array = rgb_array
+        self.palette_array = self.to_color_space(rgb_array)
+        self.chunk_size = chunk_size
+        self.tree = None
+        if self.is_euclidean and (len(self.file_names_list) > 1):
+            
+            # scipy is slow to import, so only pay for it once an index is built
+            try:
+                from scipy.spatial import cKDTree
+                self.tree = cKDTree(self.palette_array)
+            except:
+                pass
+    
+    
+    
+    def get_brute_force_labels(self, pixels_array):
+        """Return the index of the nearest palette colour for each pixel
+        (already in the metric's colour space) by evaluating the full
+        distance matrix a chunk at a time."""
+        labels_array = np.empty(pixels_array.shape[0], dtype=np.intp)
+        for start in range(0, pixels_array.shape[0], self.chunk_size):
+            stop = start + self.chunk_size
+            distances_array = self.get_distances(pixels_array[start:stop], self.palette_array)
+
+            # np.argmin returns the first minimum, just like the stable sort did
+            labels_array[start:stop] = np.argmin(distances_array, axis=1)
+
+        return labels_array
+    
+    
+    
+    def query(self, pixels_array):
+        """Return the palette index of the nearest block for every row of
+        an N×3 (or N×4) array of pixel colours."""
+        pixels_array = np.asarray(pixels_array, dtype=np.float64).reshape(-1, np.shape(pixels_array)[-1])[:, :3]
+        pixels_array = self.to_color_space(pixels_array)
+        if self.tree is None:
+
+            return self.get_brute_force_labels(pixels_array)
+        distances_array, labels_array = self.tree.query(pixels_array, k=2)
+        labels_array = labels_array[:, 0].astype(np.intp)
+
+        # Break ties the way the stable sort did
+        tied_mask = np.isclose(distances_array[:, 0], distances_array[:, 1], rtol=1e-12, atol=1e-12)
+        if tied_mask.any():
+            labels_array[tied_mask] = self.get_brute_force_labels(pixels_array[tied_mask])
+
+        return labels_array
+    
+    
+    
+    def query_file_names(self, pixels_array):
+        """Return the texture file name of the nearest block for every pixel."""
+        file_names_array = np.array(self.file_names_list, dtype=object)
+
+        return file_names_array[self.query(pixels_array)]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# Palette Bundle for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+PaletteBundle: The texture names, colour features and block categories of a
+texture set, held in one versioned, memory-mappable structured array
+"""
+import numpy as np
+
+# Bump this whenever the record layout or the category rules change
+BUNDLE_VERSION = 1
+
+# The colour features computed for every texture
+FEATURES_LIST = ['average', 'dominant', 'weighted_average']
+
+# One bit per category, each decided by a rule on the texture file name
+CATEGORIES_DICT = {
+    'concrete': lambda file_name: 'concrete' in file_name,
+    'glass': lambda file_name: ('glass' in file_name) and ('pane' not in file_name),
+    'terracotta': lambda file_name: 'terracotta' in file_name,
+    'glazed': lambda file_name: 'glazed' in file_name,
+    'wool': lambda file_name: 'wool' in file_name,
+    'powder': lambda file_name: 'powder' in file_name,
+    'stained_glass': lambda file_name: file_name.endswith('_stained_glass.png'),
+    }
+CATEGORIES_LIST = list(CATEGORIES_DICT.keys()) + ['blocks']
+
+class PaletteBundle(object):
+    """This class wraps a structured array with one record per texture: its
+    file name, a float32 RGB triple per colour feature, and a bitmask of the
+    categories it belongs to. Saved with np.save it loads in one read, or
+    memory-mapped, and any block list is a mask expression over the records.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import palette_bundle
+    >>> bundle = palette_bundle.PaletteBundle.from_dictionaries(average_dict, dominant_dict, weighted_average_dict)
+    >>> mask = bundle.get_mask('concrete', 'terracotta', 'wool') & ~bundle.get_mask('powder', 'glazed')
+    >>> bundle.get_file_names_list(mask)
+    """
+
+    def __init__(self, records_array):
+        self.records_array = records_array
+        self.file_names_list = records_array['file_name'].tolist()
+    
+    
+    
+    @staticmethod
+    def get_bundle_name(version=BUNDLE_VERSION):
+
+        return f'PALETTE_BUNDLE_v{version}'
+    
+    
+    
+    @staticmethod
+    def get_dtype(file_names_list):
+        name_length = max([len(file_name) for file_name in file_names_list] + [1])
+        fields_list = [('file_name', f'<U{name_length}')]
+        fields_list += [(feature, '<f4', (3,)) for feature in FEATURES_LIST]
+        fields_list += [('categories', '<u2')]
+
+        return np.dtype(fields_list)
+    
+    
+    
+    @staticmethod
+    def get_categories(file_name, blocks_list=None):
+        lower_name = file_name.lower()
+        categories = 0
+        for bit, category in enumerate(CATEGORIES_LIST):
+            if category == 'blocks':
+                is_member = (blocks_list is None) or (file_name in blocks_list)
+            else:
+                is_member = CATEGORIES_DICT[category](lower_name)
+            if is_member:
+                categories |= 1 << bit
+
+        return categories
+    
+    
+    
+    @classmethod
+    def from_dictionaries(cls, average_dict, dominant_dict, weighted_average_dict, blocks_list=None):
+        """
+        :param blocks_list:  the curated list of buildable blocks, or None to mark every texture as one
+        :return: a PaletteBundle with the textures in the order of average_dict
+        """
+        file_names_list = list(average_dict.keys())
+        records_array = np.zeros(len(file_names_list), dtype=cls.get_dtype(file_names_list))
+        records_array['file_name'] = file_names_list
+        for feature, rgb_dict in zip(FEATURES_LIST, [average_dict, dominant_dict, weighted_average_dict]):
+            records_array[feature] = np.array([tuple(rgb_dict[file_name])[:3] for file_name in file_names_list],
+                                              dtype=np.float32).reshape(-1, 3)
+        if blocks_list is not None:
+            blocks_list = set(blocks_list)
+        records_array['categories'] = [cls.get_categories(file_name, blocks_list) for file_name in file_names_list]
+
+        return cls(records_array)
+    
+    
+    
+    def get_mask(self, *categories):
+        """Return a boolean mask of the textures in any of the categories."""
+        category_bits = 0
+        for category in categories:
+            if category not in CATEGORIES_LIST:
+                raise ValueError(f'Unknown block category {category!r}: choose from {CATEGORIES_LIST}')
+            category_bits |= 1 << CATEGORIES_LIST.index(category)
+
+        return (self.records_array['categories'] & category_bits) != 0
+    
+    
+    
+    def get_file_names_list(self, *categories_or_mask):
+        """Return the texture file names selected by a mask, or by the union of some categories."""
+        if categories_or_mask and not isinstance(categories_or_mask[0], str):
+            mask_array = np.asarray(categories_or_mask[0], dtype=bool)
+        else:
+            mask_array = self.get_mask(*categories_or_mask)
+
+        return [file_name for file_name, is_selected in zip(self.file_names_list, mask_array) if is_selected]
+    
+    
+    
+    def get_rgb_dict(self, feature, mask_array=None):
+        """Return a {file_name: (r, g, b)} dictionary of one colour feature."""
+        rgb_array = self.records_array[feature].astype(np.float64)
+        if mask_array is None:
+            mask_array = np.ones(len(self.file_names_list), dtype=bool)
+        rgb_dict = {file_name: tuple(rgb_list) for file_name, rgb_list, is_selected
+                    in zip(self.file_names_list, rgb_array.tolist(), mask_array) if is_selected}
+
+        return rgb_dict
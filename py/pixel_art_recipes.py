@@ -10,27 +10,164 @@
 """
 PixelArtRecipies: A set of utility functions common to building MineCraft pixel art
 """
-from IPython.display import HTML, display
 from PIL import Image
-from math import sqrt
-from matplotlib.colors import to_hex
+from anvil_writer import AnvilWriter
+from block_grid import BlockGrid
+from command_export import CommandExporter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dithering import Ditherer
+from nearest_blocks import NearestBlockIndex, get_color_distance, linear_to_rgb, rgb_to_linear
+from palette_bundle import PaletteBundle
 from pathlib import Path
-import cv2
-import imageio
+from structure_export import StructureExporter, is_shown_on_top
+import base64
+import hashlib
+import io
 import itertools
 import math
 import numpy as np
 import operator
 import os
-import pandas as pd
+import re
 import storage as s
+import time
 import traceback
 import webbrowser
-import webcolors
 
+# cv2, matplotlib, IPython and webcolors are imported where they are used, to keep the import cheap
 import warnings
 warnings.filterwarnings("ignore")
 
+def get_texture_features(file_path, n_colors=5):
+    """
+    :param file_path:  path to a 16x16 texture PNG
+    :param n_colors:   number of k-means clusters in the texture palette
+    :return:           (average, dominant, weighted_average, seconds), or None if the texture is not 16x16 RGB
+    """
+    start_time = time.perf_counter()
+    
+    # Convert palette-mode textures (like the backlit ones) rather than failing on them
+    img_array = np.array(Image.open(file_path).convert('RGB'))
+    if img_array.shape != (16, 16, 3):
+        
+        return None
+
+    # Calculate the mean of each chromatic channel
+    average = img_array.mean(axis=0).mean(axis=0)
+
+    # Get the palette color which occurs most frequently
+    import cv2
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, .1)
+    flags = cv2.KMEANS_RANDOM_CENTERS
+    pixels = np.float32(img_array.reshape(-1, 3))
+    _, labels, palette = cv2.kmeans(pixels, n_colors, None, criteria, 10, flags)
+    _, counts = np.unique(labels, return_counts=True)
+    dominant = palette[np.argmax(counts)]
+
+    # Calculate the mean of the palette patch
+    indices = np.argsort(counts)[::-1]   
+    freqs = np.cumsum(np.hstack([[0], counts[indices]/float(counts.sum())]))
+    rows = np.int_(img_array.shape[0]*freqs)
+    palette_patch = np.zeros(shape=img_array.shape, dtype=np.uint8)
+    for i in range(len(rows) - 1):
+        palette_patch[rows[i]:rows[i + 1], :, :] += np.uint8(palette[indices[i]])
+    weighted_average = palette_patch.mean(axis=0).mean(axis=0)
+    
+    return tuple(average), tuple(dominant), tuple(weighted_average), time.perf_counter() - start_time
+
+def get_batched_texture_features(img_arrays, n_colors=5, attempts=3, max_iter=200, epsilon=.1, seed=0):
+    """
+    :param img_arrays:  N×16×16×3 stack of texture images
+    :param n_colors:    number of k-means clusters in each texture palette
+    :param attempts:    k-means++ restarts per texture, keeping the most compact
+    :param seed:        seed for the k-means++ initialization, making the results reproducible
+    :return:            dictionary of N×3 average, dominant, and weighted_average arrays,
+                        and the N×n_colors×3 palette array sorted by frequency
+    """
+    rng = np.random.default_rng(seed)
+    img_arrays = np.asarray(img_arrays)
+    texture_count, height = img_arrays.shape[:2]
+    pixels_array = img_arrays.reshape(texture_count, -1, 3).astype(np.float32)
+    pixel_count = pixels_array.shape[1]
+    
+    # Run every attempt for every texture as one batch
+    batch_array = np.repeat(pixels_array, attempts, axis=0)
+    batch_count = batch_array.shape[0]
+    batch_indices = np.arange(batch_count)
+    
+    # Seeded k-means++ initialization
+    centers_array = np.empty((batch_count, n_colors, 3), dtype=np.float32)
+    centers_array[:, 0] = batch_array[batch_indices, rng.integers(0, pixel_count, batch_count)]
+    closest_array = ((batch_array - centers_array[:, 0, None])**2).sum(axis=2)
+    for j in range(1, n_colors):
+        totals_array = closest_array.sum(axis=1, keepdims=True)
+        
+        # Fall back to uniform sampling for textures with fewer distinct colours than clusters
+        probabilities_array = np.where(totals_array > 0, closest_array / np.where(totals_array > 0, totals_array, 1),
+                                       1 / pixel_count)
+        thresholds_array = rng.random((batch_count, 1))
+        chosen_array = (np.cumsum(probabilities_array, axis=1) < thresholds_array).sum(axis=1)
+        centers_array[:, j] = batch_array[batch_indices, np.minimum(chosen_array, pixel_count - 1)]
+        closest_array = np.minimum(closest_array, ((batch_array - centers_array[:, j, None])**2).sum(axis=2))
+    
+    # Batched Lloyd iterations, dropping each attempt from the batch once it converges
+    def get_distances(active_array):
+        centers_subset = centers_array[active_array]
+        pixels_subset = batch_array[active_array]
+        distances_array = np.zeros((active_array.size, pixel_count, n_colors), dtype=np.float32)
+        for channel in range(3):
+            distances_array += (pixels_subset[:, :, channel, None] - centers_subset[:, None, :, channel])**2
+        
+        return distances_array
+    active_array = batch_indices
+    for _ in range(max_iter):
+        labels_array = get_distances(active_array).argmin(axis=2)
+        flat_labels_array = (np.arange(active_array.size)[:, None] * n_colors + labels_array).ravel()
+        bin_count = active_array.size * n_colors
+        counts_array = np.bincount(flat_labels_array, minlength=bin_count).reshape(-1, n_colors)
+        sums_array = np.stack([np.bincount(flat_labels_array, weights=batch_array[active_array, :, channel].ravel(),
+                                           minlength=bin_count) for channel in range(3)], axis=1)
+        sums_array = sums_array.reshape(-1, n_colors, 3)
+        
+        # Empty clusters keep their previous centre
+        old_centers_array = centers_array[active_array]
+        new_centers_array = np.where(counts_array[:, :, None] > 0,
+                                     sums_array / np.maximum(counts_array, 1)[:, :, None], old_centers_array)
+        shifts_array = np.sqrt(((new_centers_array - old_centers_array)**2).sum(axis=2)).max(axis=1)
+        centers_array[active_array] = new_centers_array
+        active_array = active_array[shifts_array > epsilon]
+        if not active_array.size:
+            break
+    distances_array = get_distances(batch_indices)
+    labels_array = distances_array.argmin(axis=2)
+    compactness_array = distances_array.min(axis=2).sum(axis=1)
+    counts_array = (labels_array[:, :, None] == np.arange(n_colors)).sum(axis=1)
+    
+    # Keep the most compact attempt for each texture
+    best_array = compactness_array.reshape(texture_count, attempts).argmin(axis=1)
+    best_array += np.arange(texture_count) * attempts
+    centers_array = centers_array[best_array]
+    counts_array = counts_array[best_array]
+    
+    # Sort each palette by frequency, most frequent first
+    indices_array = np.argsort(counts_array, axis=1)[:, ::-1]
+    palette_array = np.take_along_axis(centers_array, indices_array[:, :, None], axis=1)
+    sorted_counts_array = np.take_along_axis(counts_array, indices_array, axis=1)
+    
+    # The weighted average is the mean of the palette patch, striped by frequency
+    freqs_array = np.cumsum(np.hstack([np.zeros((texture_count, 1)), sorted_counts_array / pixel_count]), axis=1)
+    rows_array = np.int_(height * freqs_array)
+    weighted_average_array = (np.diff(rows_array, axis=1)[:, :, None] *
+                              np.uint8(palette_array)).sum(axis=1) / height
+    features_dict = {
+        'average': img_arrays.reshape(texture_count, -1, 3).mean(axis=1),
+        'dominant': palette_array[:, 0],
+        'palette': palette_array,
+        'weighted_average': weighted_average_array,
+        }
+    
+    return features_dict
+
 class PixelArtRecipies(object):
     """This class implements the core of the utility functions
     needed to build pixel art in MineCraft.
@@ -43,8 +180,109 @@ class PixelArtRecipies(object):
     >>> import pixel_art_recipes
     >>> par = pixel_art_recipes.PixelArtRecipies()
     """
+    
+    # Attributes loaded (or computed and stored) on first access, and the method that loads each
+    LAZY_ATTRIBUTES_DICT = {
+        'palette_bundle': 'load_palette_bundle',
+        'average_dict': 'load_rgb_dictionaries',
+        'dominant_dict': 'load_rgb_dictionaries',
+        'weighted_average_dict': 'load_rgb_dictionaries',
+        }
+    
+    # Each block list as a mask expression over the palette bundle categories:
+    # the textures in any of the first categories and in none of the second
+    BLOCK_LISTS_DICT = {
+        'glass_and_concrete_list': (['glass', 'concrete'], []),
+        'concrete_list': (['concrete'], []),
+        'glass_list': (['glass'], []),
+        'glass_and_concrete_and_terracotta_list': (['glass', 'concrete', 'terracotta'], []),
+        'glass_and_terracotta_list': (['glass', 'terracotta'], []),
+        'terracotta_list': (['terracotta'], []),
+        'glass_and_concrete_and_unglazed_terracotta_list': (['glass', 'concrete', 'terracotta'], ['glazed']),
+        'concrete_and_unglazed_terracotta_list': (['concrete', 'terracotta'], ['glazed']),
+        'blocks_list': (['blocks'], []),
+        'wool_list': (['wool'], []),
+        'unpowdered_and_unglazed_list': (['concrete', 'terracotta', 'wool'], ['powder', 'glazed']),
+        'stained_glass_list': (['stained_glass'], []),
+        }
+    
+    # The buildable blocks, used when there is no stored blocks list to build the palette bundle from
+    DEFAULT_BLOCKS_LIST = [
+        'acacia_log.png', 'acacia_log_top.png', 'acacia_planks.png',
+        'andesite.png', 'birch_log.png', 'birch_log_top.png',
+        'birch_planks.png', 'black_concrete.png', 'black_concrete_powder.png',
+        'black_glazed_terracotta.png', 'black_terracotta.png', 'black_wool.png',
+        'blue_concrete.png', 'blue_concrete_powder.png', 'blue_glazed_terracotta.png',
+        'blue_terracotta.png', 'blue_wool.png', 'bone_block_side.png',
+        'bone_block_top.png', 'bookshelf.png', 'bricks.png',
+        'brown_concrete.png', 'brown_concrete_powder.png', 'brown_glazed_terracotta.png',
+        'brown_terracotta.png', 'brown_wool.png', 'chiseled_nether_bricks.png',
+        'chiseled_quartz_block.png', 'chiseled_quartz_block_top.png',
+        'chiseled_red_sandstone.png',
+        'chiseled_sandstone.png', 'chiseled_stone_bricks.png', 'coal_block.png',
+        'coal_ore.png', 'cobblestone.png', 'cracked_nether_bricks.png',
+        'cracked_stone_bricks.png', 'cyan_concrete.png', 'cyan_concrete_powder.png',
+        'cyan_glazed_terracotta.png', 'cyan_terracotta.png', 'cyan_wool.png',
+        'dark_oak_log.png', 'dark_oak_log_top.png', 'dark_oak_planks.png',
+        'dark_prismarine.png', 'diamond_block.png', 'diorite.png',
+        'dirt.png', 'emerald_block.png', 'end_stone.png',
+        'end_stone_bricks.png', 'furnace_front.png', 'furnace_side.png',
+        'furnace_top.png', 'granite.png', 'grass_block_side.png',
+        'gravel.png', 'gray_concrete.png', 'gray_concrete_powder.png',
+        'gray_glazed_terracotta.png', 'gray_terracotta.png', 'gray_wool.png',
+        'green_concrete.png', 'green_concrete_powder.png',
+        'green_glazed_terracotta.png',
+        'green_terracotta.png', 'green_wool.png', 'hay_block_side.png',
+        'hay_block_top.png', 'iron_block.png', 'iron_ore.png',
+        'jack_o_lantern.png', 'jungle_log.png', 'jungle_log_top.png',
+        'jungle_planks.png', 'lapis_block.png', 'light_blue_concrete.png',
+        'light_blue_concrete_powder.png', 'light_blue_glazed_terracotta.png',
+        'light_blue_terracotta.png',
+        'light_blue_wool.png', 'light_gray_concrete.png',
+        'light_gray_concrete_powder.png',
+        'light_gray_glazed_terracotta.png', 'light_gray_terracotta.png',
+        'light_gray_wool.png',
+        'lime_concrete.png', 'lime_concrete_powder.png', 'lime_glazed_terracotta.png',
+        'lime_terracotta.png', 'lime_wool.png', 'magenta_concrete.png',
+        'magenta_concrete_powder.png', 'magenta_glazed_terracotta.png',
+        'magenta_terracotta.png',
+        'magenta_wool.png', 'melon_side.png', 'melon_top.png',
+        'mossy_cobblestone.png', 'mossy_stone_bricks.png', 'netherite_block.png',
+        'netherrack.png', 'nether_bricks.png', 'nether_quartz_ore.png',
+        'nether_wart_block.png', 'note_block.png', 'oak_log.png',
+        'oak_log_top.png', 'oak_planks.png', 'orange_concrete.png',
+        'orange_concrete_powder.png', 'orange_glazed_terracotta.png',
+        'orange_terracotta.png',
+        'orange_wool.png', 'packed_ice.png', 'pink_concrete.png',
+        'pink_concrete_powder.png', 'pink_glazed_terracotta.png', 'pink_terracotta.png',
+        'pink_wool.png', 'piston_side.png', 'piston_top.png',
+        'piston_top_sticky.png', 'podzol_side.png', 'polished_andesite.png',
+        'polished_diorite.png', 'polished_granite.png', 'prismarine_bricks.png',
+        'pumpkin_side.png', 'pumpkin_top.png', 'purple_concrete.png',
+        'purple_concrete_powder.png', 'purple_glazed_terracotta.png',
+        'purple_terracotta.png',
+        'purple_wool.png', 'purpur_block.png', 'purpur_pillar.png',
+        'purpur_pillar_top.png', 'quartz_block_side.png', 'quartz_block_top.png',
+        'quartz_bricks.png', 'quartz_pillar.png', 'quartz_pillar_top.png',
+        'redstone_block.png', 'redstone_lamp.png', 'redstone_ore.png',
+        'red_concrete.png', 'red_concrete_powder.png', 'red_glazed_terracotta.png',
+        'red_nether_bricks.png', 'red_sand.png', 'red_sandstone.png',
+        'red_sandstone_top.png', 'red_terracotta.png', 'red_wool.png',
+        'sand.png', 'sandstone.png', 'sandstone_top.png',
+        'slime_block.png', 'smooth_stone.png', 'smooth_stone_slab_side.png',
+        'soul_sand.png', 'sponge.png', 'spruce_log.png',
+        'spruce_log_top.png', 'spruce_planks.png', 'stone.png',
+        'stone_bricks.png', 'terracotta.png', 'wet_sponge.png',
+        'white_concrete.png', 'white_concrete_powder.png', 'white_glazed_terracotta.png',
+        'white_terracotta.png', 'white_wool.png', 'yellow_concrete.png',
+        'yellow_concrete_powder.png', 'yellow_glazed_terracotta.png',
+        'yellow_terracotta.png', 'yellow_wool.png']
+    
+    # Cold construction should stay this cheap, since batch jobs build one instance per worker
+    INIT_BUDGET_SECONDS = 0.05
 
-    def __init__(self, textures_dir=None):
+    def __init__(self, textures_dir=None, warm_up=False, verbose=False):
+        start_time = time.perf_counter()
         self.s = s.Storage()
         if textures_dir is None:
             # self.textures_dir = '../data/1.18.1_Default_Resource_Pack/assets/minecraft/textures/block'
@@ -52,224 +290,226 @@ class PixelArtRecipies(object):
         else:
             self.textures_dir = textures_dir
         
-        # Get RGB dictionaries
-        if self.s.pickle_exists('AVERAGE_DICT') and self.s.pickle_exists('DOMINANT_DICT') and self.s.pickle_exists('WEIGHTED_AVERAGE_DICT'):
-            self.average_dict = self.s.load_object('AVERAGE_DICT')
-            self.dominant_dict = self.s.load_object('DOMINANT_DICT')
-            self.weighted_average_dict = self.s.load_object('WEIGHTED_AVERAGE_DICT')
-        else:
-            self.average_dict, self.dominant_dict, self.weighted_average_dict = self.get_dictionaries(self.textures_dir, n_colors=5)
-            self.s.store_objects(AVERAGE_DICT=self.average_dict, DOMINANT_DICT=self.dominant_dict, WEIGHTED_AVERAGE_DICT=self.weighted_average_dict)
-        
-        # Get various block lists
-        if self.s.pickle_exists('minecraft_glass_and_concrete_list') and self.s.pickle_exists('minecraft_concrete_list') and self.s.pickle_exists('minecraft_glass_list'):
-            self.glass_and_concrete_list = self.s.load_object('minecraft_glass_and_concrete_list')
-            self.concrete_list = self.s.load_object('minecraft_concrete_list')
-            self.glass_list = self.s.load_object('minecraft_glass_list')
-        else:
-            self.glass_and_concrete_list = []
-            self.concrete_list = []
-            for file_name in self.average_dict.keys():
-                if ('concrete' in file_name):
-                    (img_array, avg_patch, dom_patch, palette_patch,
-                     weighted_avg_patch) = get_patches(self.textures_dir, file_name, self.average_dict,
-                                                       self.dominant_dict, self.weighted_average_dict)
-                    show_images(file_name, img_array, avg_patch, dom_patch, palette_patch,
-                                weighted_avg_patch)
-                    self.glass_and_concrete_list.append(file_name)
-                    self.concrete_list.append(file_name)
-            self.glass_list = []
-            for file_name in self.average_dict.keys():
-                if ('glass' in file_name) and ('pane' not in file_name):
-                    (img_array, avg_patch, dom_patch, palette_patch,
-                     weighted_avg_patch) = get_patches(self.textures_dir, file_name, self.average_dict,
-                                                       self.dominant_dict, self.weighted_average_dict)
-                    show_images(file_name, img_array, avg_patch, dom_patch, palette_patch,
-                                weighted_avg_patch)
-                    self.glass_and_concrete_list.append(file_name)
-                    self.glass_list.append(file_name)
-            self.s.store_objects(minecraft_glass_and_concrete_list=self.glass_and_concrete_list, minecraft_concrete_list=self.concrete_list, minecraft_glass_list=self.glass_list)
-        
-        pickle_name = 'minecraft_glass_and_concrete_and_terracotta_list'
-        if self.s.pickle_exists(pickle_name):
-            self.glass_and_concrete_and_terracotta_list = self.s.load_object(pickle_name)
-        else:
-            self.glass_and_concrete_and_terracotta_list = self.glass_list + self.concrete_list
-            self.glass_and_concrete_and_terracotta_list += [key for key in self.dominant_dict.keys() if 'terracotta' in key.lower()]
-            self.s.store_objects(**{pickle_name: self.glass_and_concrete_and_terracotta_list})
-        if self.s.pickle_exists('minecraft_glass_and_terracotta_list'):
-            self.glass_and_terracotta_list = self.s.load_object('minecraft_glass_and_terracotta_list')
-        else:
-            self.glass_and_terracotta_list = self.glass_list + [key for key in self.dominant_dict.keys() if 'terracotta' in key.lower()]
-            self.s.store_objects(minecraft_glass_and_terracotta_list=self.glass_and_terracotta_list)
-        if self.s.pickle_exists('minecraft_terracotta_list'):
-            terracotta_list = self.s.load_object('minecraft_terracotta_list')
-        else:
-            terracotta_list = [key for key in self.dominant_dict.keys() if 'terracotta' in key.lower()]
-            self.s.store_objects(minecraft_terracotta_list=terracotta_list)
+        # The palette bundle, dictionaries and block lists are loaded on first access
+        self.horizontal_offset = -495
+        self.vertical_offset = 207
         
-        pickle_name = 'minecraft_glass_and_concrete_and_unglazed_terracotta_list'
-        if self.s.pickle_exists(pickle_name):
-            self.glass_and_concrete_and_unglazed_terracotta_list = self.s.load_object(pickle_name)
-        else:
-            self.glass_and_concrete_and_unglazed_terracotta_list = []
-            for fn in self.glass_and_concrete_and_terracotta_list:
-                if 'glazed' not in fn:
-                    self.glass_and_concrete_and_unglazed_terracotta_list.append(fn)
-            self.s.store_objects(**{pickle_name: self.glass_and_concrete_and_unglazed_terracotta_list})
-        
-        pickle_name = 'minecraft_concrete_and_unglazed_terracotta_list'
-        if self.s.pickle_exists(pickle_name):
-            self.concrete_and_unglazed_terracotta_list = self.s.load_object(pickle_name)
-        else:
-            for fn in self.concrete_list + terracotta_list:
-                if 'glazed' not in fn:
-                    self.concrete_and_unglazed_terracotta_list.append(fn)
-            self.s.store_objects(**{pickle_name: self.concrete_and_unglazed_terracotta_list})
+        # Nearest-block indexes, built once per palette and colour metric:
+        # 'rgb', 'redmean', 'cie76', 'ciede2000', or 'oklab'
+        self.metric = 'rgb'
+        self.block_index_dict = {}
+        self.pixel_to_filename_dict = {}
         
-        if self.s.pickle_exists('minecraft_blocks_list'):
-            self.blocks_list = self.s.load_object('minecraft_blocks_list')
+        # Set to 5, 6, 7, or 8 to quantize through a cached RGB lookup table
+        self.lut_bits_per_channel = None
+        
+        # Set to 'floyd_steinberg', 'atkinson', 'sierra', 'bayer', or 'blue_noise' to dither gradients
+        self.dither_method = None
+        
+        self.init_seconds = time.perf_counter() - start_time
+        if verbose and (self.init_seconds > self.INIT_BUDGET_SECONDS):
+            print(f'PixelArtRecipies construction took {self.init_seconds:.3f} seconds, '
+                  f'over the {self.INIT_BUDGET_SECONDS} second budget')
+        if warm_up:
+            self.warm_up()
+    
+    
+    
+    def __getattr__(self, name):
+        
+        # Only called when normal attribute lookup fails
+        cls = type(self)
+        if name in cls.BLOCK_LISTS_DICT:
+            self.__dict__[name] = self.palette_bundle.get_file_names_list(self.get_block_list_mask(name))
+        elif name in cls.LAZY_ATTRIBUTES_DICT:
+            getattr(self, cls.LAZY_ATTRIBUTES_DICT[name])()
         else:
-            self.blocks_list = [
-                'acacia_log.png', 'acacia_log_top.png', 'acacia_planks.png',
-                'andesite.png', 'birch_log.png', 'birch_log_top.png',
-                'birch_planks.png', 'black_concrete.png', 'black_concrete_powder.png',
-                'black_glazed_terracotta.png', 'black_terracotta.png', 'black_wool.png',
-                'blue_concrete.png', 'blue_concrete_powder.png', 'blue_glazed_terracotta.png',
-                'blue_terracotta.png', 'blue_wool.png', 'bone_block_side.png',
-                'bone_block_top.png', 'bookshelf.png', 'bricks.png',
-                'brown_concrete.png', 'brown_concrete_powder.png', 'brown_glazed_terracotta.png',
-                'brown_terracotta.png', 'brown_wool.png', 'chiseled_nether_bricks.png',
-                'chiseled_quartz_block.png', 'chiseled_quartz_block_top.png',
-                'chiseled_red_sandstone.png',
-                'chiseled_sandstone.png', 'chiseled_stone_bricks.png', 'coal_block.png',
-                'coal_ore.png', 'cobblestone.png', 'cracked_nether_bricks.png',
-                'cracked_stone_bricks.png', 'cyan_concrete.png', 'cyan_concrete_powder.png',
-                'cyan_glazed_terracotta.png', 'cyan_terracotta.png', 'cyan_wool.png',
-                'dark_oak_log.png', 'dark_oak_log_top.png', 'dark_oak_planks.png',
-                'dark_prismarine.png', 'diamond_block.png', 'diorite.png',
-                'dirt.png', 'emerald_block.png', 'end_stone.png',
-                'end_stone_bricks.png', 'furnace_front.png', 'furnace_side.png',
-                'furnace_top.png', 'granite.png', 'grass_block_side.png',
-                'gravel.png', 'gray_concrete.png', 'gray_concrete_powder.png',
-                'gray_glazed_terracotta.png', 'gray_terracotta.png', 'gray_wool.png',
-                'green_concrete.png', 'green_concrete_powder.png',
-                'green_glazed_terracotta.png',
-                'green_terracotta.png', 'green_wool.png', 'hay_block_side.png',
-                'hay_block_top.png', 'iron_block.png', 'iron_ore.png',
-                'jack_o_lantern.png', 'jungle_log.png', 'jungle_log_top.png',
-                'jungle_planks.png', 'lapis_block.png', 'light_blue_concrete.png',
-                'light_blue_concrete_powder.png', 'light_blue_glazed_terracotta.png',
-                'light_blue_terracotta.png',
-                'light_blue_wool.png', 'light_gray_concrete.png',
-                'light_gray_concrete_powder.png',
-                'light_gray_glazed_terracotta.png', 'light_gray_terracotta.png',
-                'light_gray_wool.png',
-                'lime_concrete.png', 'lime_concrete_powder.png', 'lime_glazed_terracotta.png',
-                'lime_terracotta.png', 'lime_wool.png', 'magenta_concrete.png',
-                'magenta_concrete_powder.png', 'magenta_glazed_terracotta.png',
-                'magenta_terracotta.png',
-                'magenta_wool.png', 'melon_side.png', 'melon_top.png',
-                'mossy_cobblestone.png', 'mossy_stone_bricks.png', 'netherite_block.png',
-                'netherrack.png', 'nether_bricks.png', 'nether_quartz_ore.png',
-                'nether_wart_block.png', 'note_block.png', 'oak_log.png',
-                'oak_log_top.png', 'oak_planks.png', 'orange_concrete.png',
-                'orange_concrete_powder.png', 'orange_glazed_terracotta.png',
-                'orange_terracotta.png',
-                'orange_wool.png', 'packed_ice.png', 'pink_concrete.png',
-                'pink_concrete_powder.png', 'pink_glazed_terracotta.png', 'pink_terracotta.png',
-                'pink_wool.png', 'piston_side.png', 'piston_top.png',
-                'piston_top_sticky.png', 'podzol_side.png', 'polished_andesite.png',
-                'polished_diorite.png', 'polished_granite.png', 'prismarine_bricks.png',
-                'pumpkin_side.png', 'pumpkin_top.png', 'purple_concrete.png',
-                'purple_concrete_powder.png', 'purple_glazed_terracotta.png',
-                'purple_terracotta.png',
-                'purple_wool.png', 'purpur_block.png', 'purpur_pillar.png',
-                'purpur_pillar_top.png', 'quartz_block_side.png', 'quartz_block_top.png',
-                'quartz_bricks.png', 'quartz_pillar.png', 'quartz_pillar_top.png',
-                'redstone_block.png', 'redstone_lamp.png', 'redstone_ore.png',
-                'red_concrete.png', 'red_concrete_powder.png', 'red_glazed_terracotta.png',
-                'red_nether_bricks.png', 'red_sand.png', 'red_sandstone.png',
-                'red_sandstone_top.png', 'red_terracotta.png', 'red_wool.png',
-                'sand.png', 'sandstone.png', 'sandstone_top.png',
-                'slime_block.png', 'smooth_stone.png', 'smooth_stone_slab_side.png',
-                'soul_sand.png', 'sponge.png', 'spruce_log.png',
-                'spruce_log_top.png', 'spruce_planks.png', 'stone.png',
-                'stone_bricks.png', 'terracotta.png', 'wet_sponge.png',
-                'white_concrete.png', 'white_concrete_powder.png', 'white_glazed_terracotta.png',
-                'white_terracotta.png', 'white_wool.png', 'yellow_concrete.png',
-                'yellow_concrete_powder.png', 'yellow_glazed_terracotta.png',
-                'yellow_terracotta.png', 'yellow_wool.png']
-            self.s.store_objects(minecraft_blocks_list=self.blocks_list)
-        
-        if self.s.pickle_exists('minecraft_wool_list'):
-            self.wool_list = self.s.load_object('minecraft_wool_list')
+            raise AttributeError(f"'{cls.__name__}' object has no attribute '{name}'")
+        
+        return self.__dict__[name]
+    
+    
+    
+    def __dir__(self):
+        
+        return sorted(set(super().__dir__()) | set(self.LAZY_ATTRIBUTES_DICT) | set(self.BLOCK_LISTS_DICT))
+    
+    
+    
+    def warm_up(self):
+        """Load the palette bundle and derive every dictionary and block list now, rather than on first access."""
+        for attribute_name in itertools.chain(self.LAZY_ATTRIBUTES_DICT, self.BLOCK_LISTS_DICT):
+            getattr(self, attribute_name)
+    
+    
+    
+    def get_block_list_mask(self, list_name):
+        """Return the boolean mask over the palette bundle textures that selects a block list."""
+        included_list, excluded_list = self.BLOCK_LISTS_DICT[list_name]
+        mask_array = self.palette_bundle.get_mask(*included_list)
+        if excluded_list:
+            mask_array &= ~self.palette_bundle.get_mask(*excluded_list)
+        
+        return mask_array
+    
+    
+    
+    def load_palette_bundle(self):
+        bundle_name = PaletteBundle.get_bundle_name()
+        if self.s.npy_exists(bundle_name):
+            self.palette_bundle = PaletteBundle(self.s.load_array(bundle_name, mmap_mode='r'))
         else:
-            self.wool_list = [fn for fn in self.blocks_list if 'wool' in fn]
-            self.s.store_objects(minecraft_wool_list=self.wool_list)
-        self.unpowdered_and_unglazed_list = [fn for fn in self.concrete_and_unglazed_terracotta_list+self.wool_list if 'powder' not in fn.lower()]
-        self.stained_glass_list = [key for key in self.weighted_average_dict.keys() if key.endswith('_stained_glass.png')]
-        self.horizontal_offset = -495
-        self.vertical_offset = 207
+            
+            # Migrate the separately stored dictionaries and blocks list into one bundle
+            if self.s.pickle_exists('AVERAGE_DICT') and self.s.pickle_exists('DOMINANT_DICT') and self.s.pickle_exists('WEIGHTED_AVERAGE_DICT'):
+                average_dict = self.s.load_object('AVERAGE_DICT')
+                dominant_dict = self.s.load_object('DOMINANT_DICT')
+                weighted_average_dict = self.s.load_object('WEIGHTED_AVERAGE_DICT')
+            else:
+                average_dict, dominant_dict, weighted_average_dict = self.get_dictionaries(self.textures_dir, n_colors=5)
+            if self.s.pickle_exists('minecraft_blocks_list'):
+                blocks_list = self.s.load_object('minecraft_blocks_list')
+            else:
+                blocks_list = self.DEFAULT_BLOCKS_LIST
+            self.store_palette_bundle(PaletteBundle.from_dictionaries(average_dict, dominant_dict, weighted_average_dict,
+                                                                      blocks_list=blocks_list))
     
     
     
-    def get_dictionaries(self, textures_dir, n_colors=5):
-        average_dict = {}
-        dominant_dict = {}
-        weighted_dict = {}
+    def store_palette_bundle(self, palette_bundle, verbose=False):
+        """Store the bundle and drop everything derived from the previous one."""
+        self.s.store_arrays(verbose=verbose, **{PaletteBundle.get_bundle_name(): palette_bundle.records_array})
+        for attribute_name in itertools.chain(self.LAZY_ATTRIBUTES_DICT, self.BLOCK_LISTS_DICT):
+            self.__dict__.pop(attribute_name, None)
+        self.palette_bundle = palette_bundle
+        self.block_index_dict = {}
+    
+    
+    
+    def load_rgb_dictionaries(self):
+        self.average_dict = self.palette_bundle.get_rgb_dict('average')
+        self.dominant_dict = self.palette_bundle.get_rgb_dict('dominant')
+        self.weighted_average_dict = self.palette_bundle.get_rgb_dict('weighted_average')
+    
+    
+    
+    def get_dictionaries(self, textures_dir, n_colors=5, max_workers=None, verbose=False, batched=False, seed=0):
+        """
+        :param textures_dir:  folder of 16x16 texture PNGs
+        :param n_colors:      number of k-means clusters in each texture palette
+        :param max_workers:   size of the process pool used for textures not already cached
+        :param batched:       cluster all the uncached textures at once with seeded k-means++,
+                              rather than with cv2.kmeans one texture at a time
+        :return:              average, dominant, and weighted average dictionaries
+        """
+        
+        # Features are cached per file, keyed by a hash of the file's contents
+        cache_name = 'TEXTURE_FEATURES_CACHE'
+        if self.s.pickle_exists(cache_name):
+            features_cache_dict = self.s.load_object(cache_name)
+        else:
+            features_cache_dict = {}
+        cache_keys_dict = {}
         for file_name in os.listdir(textures_dir):
             if file_name.endswith('.png'):
-
-                # Read the image
                 file_path = os.path.join(textures_dir, file_name)
-                try:
-                    img_array = imageio.imread(file_path)[:, :, :3]
-                    if img_array.shape == (16, 16, 3):
-
-                        # Calculate the mean of each chromatic channel
-                        average = img_array.mean(axis=0).mean(axis=0)
-                        average_dict[file_name] = tuple(average)
-
-                        # Get the palette color which occurs most frequently
-                        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, .1)
-                        flags = cv2.KMEANS_RANDOM_CENTERS
-                        pixels = np.float32(img_array.reshape(-1, 3))
-                        _, labels, palette = cv2.kmeans(pixels, n_colors, None, criteria, 10, flags)
-                        _, counts = np.unique(labels, return_counts=True)
-                        dominant = palette[np.argmax(counts)]
-                        dominant_dict[file_name] = tuple(dominant)
-
-                        # Calculate the mean of the palette patch
-                        indices = np.argsort(counts)[::-1]   
-                        freqs = np.cumsum(np.hstack([[0], counts[indices]/float(counts.sum())]))
-                        rows = np.int_(img_array.shape[0]*freqs)
-                        palette_patch = np.zeros(shape=img_array.shape, dtype=np.uint8)
-                        for i in range(len(rows) - 1):
-                            palette_patch[rows[i]:rows[i + 1], :, :] += np.uint8(palette[indices[i]])
-                        weighted_average = palette_patch.mean(axis=0).mean(axis=0)
-                        weighted_dict[file_name] = tuple(weighted_average)
-                except IndexError as e:
-                    print(f'{file_name}: {str(e).strip()}')
-                except Exception as e:
-                    print(f'{e.__class__} error on {file_name}: {str(e).strip()}')
-
+                with open(file_path, 'rb') as f:
+                    cache_keys_dict[file_name] = f'{hashlib.sha1(f.read()).hexdigest()}_{n_colors}'
+                if batched:
+                    cache_keys_dict[file_name] += f'_kmeans++{seed}'
+        
+        # Extract the features of new or changed textures only, in parallel
+        self.texture_timings_dict = {}
+        missing_list = [file_name for file_name, cache_key in cache_keys_dict.items()
+                        if cache_key not in features_cache_dict]
+        if missing_list and batched:
+            start_time = time.perf_counter()
+            img_arrays_list = []
+            for file_name in missing_list:
+                img_array = np.array(Image.open(os.path.join(textures_dir, file_name)).convert('RGB'))
+                if img_array.shape == (16, 16, 3):
+                    img_arrays_list.append((file_name, img_array))
+                else:
+                    features_cache_dict[cache_keys_dict[file_name]] = None
+            if img_arrays_list:
+                features_dict = get_batched_texture_features(np.stack([img_array for _, img_array in img_arrays_list]),
+                                                             n_colors=n_colors, seed=seed)
+                seconds = (time.perf_counter() - start_time) / len(img_arrays_list)
+                for i, (file_name, _) in enumerate(img_arrays_list):
+                    features_cache_dict[cache_keys_dict[file_name]] = (
+                        tuple(features_dict['average'][i]), tuple(features_dict['dominant'][i]),
+                        tuple(features_dict['weighted_average'][i]), seconds
+                        )
+                    self.texture_timings_dict[file_name] = seconds
+                if verbose:
+                    print(f'Clustered {len(img_arrays_list)} textures in {time.perf_counter() - start_time:.3f} seconds')
+            self.s.store_objects(verbose=verbose, **{cache_name: features_cache_dict})
+        elif missing_list:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures_dict = {executor.submit(get_texture_features, os.path.join(textures_dir, file_name),
+                                                n_colors): file_name for file_name in missing_list}
+                for future in as_completed(futures_dict):
+                    file_name = futures_dict[future]
+                    try:
+                        features_tuple = future.result()
+                    except IndexError as e:
+                        print(f'{file_name}: {str(e).strip()}')
+                        continue
+                    except Exception as e:
+                        print(f'{e.__class__} error on {file_name}: {str(e).strip()}')
+                        continue
+                    if features_tuple is not None:
+                        self.texture_timings_dict[file_name] = features_tuple[3]
+                        if verbose:
+                            print(f'{file_name}: {features_tuple[3]:.3f} seconds')
+                    features_cache_dict[cache_keys_dict[file_name]] = features_tuple
+            self.s.store_objects(verbose=verbose, **{cache_name: features_cache_dict})
+        
+        # Keep the directory listing order, since it breaks nearest-block ties
+        average_dict = {}
+        dominant_dict = {}
+        weighted_dict = {}
+        for file_name, cache_key in cache_keys_dict.items():
+            features_tuple = features_cache_dict.get(cache_key)
+            if features_tuple is not None:
+                average_dict[file_name], dominant_dict[file_name], weighted_dict[file_name], _ = features_tuple
+        
         return average_dict, dominant_dict, weighted_dict
     
     
     
-    def color_distance_from(self, from_color, to_rgb_tuple):
+    def update_dictionaries(self, textures_dir=None, n_colors=5, max_workers=None, verbose=True):
+        """Recompute the features of any new or changed textures and merge them
+        into the stored palette bundle, replacing all three dictionaries together."""
+        if textures_dir is None:
+            textures_dir = self.textures_dir
+        average_dict, dominant_dict, weighted_dict = self.get_dictionaries(textures_dir, n_colors=n_colors,
+                                                                           max_workers=max_workers, verbose=verbose)
+        
+        # Build the merged bundle completely before swapping it in
+        new_file_names_list = [file_name for file_name in average_dict if file_name not in self.average_dict]
+        palette_bundle = PaletteBundle.from_dictionaries({**self.average_dict, **average_dict},
+                                                         {**self.dominant_dict, **dominant_dict},
+                                                         {**self.weighted_average_dict, **weighted_dict},
+                                                         blocks_list=self.blocks_list + new_file_names_list)
+        self.store_palette_bundle(palette_bundle, verbose=verbose)
+        if verbose and self.texture_timings_dict:
+            print(f'Recomputed {len(self.texture_timings_dict)} texture(s) in '
+                  f'{sum(self.texture_timings_dict.values()):.3f} seconds of worker time')
+    
+    
+    
+    def color_distance_from(self, from_color, to_rgb_tuple, metric='rgb'):
         if from_color == 'white':
-            green_diff = 255 - to_rgb_tuple[0]
-            blue_diff = 255 - to_rgb_tuple[1]
-            red_diff = 255 - to_rgb_tuple[2]
-            color_distance = sqrt(green_diff**2 + blue_diff**2 + red_diff**2)
+            from_color = (255, 255, 255)
         elif from_color == 'black':
-            color_distance = sqrt(to_rgb_tuple[0]**2 + to_rgb_tuple[1]**2 + to_rgb_tuple[2]**2)
+            from_color = (0, 0, 0)
+        if metric != 'rgb':
+            
+            return get_color_distance(from_color, to_rgb_tuple, metric=metric)
         
         # Assume from_color is also an RGB tuple
-        else:
-            color_distance = np.linalg.norm(np.array(from_color) - np.array(to_rgb_tuple))
+        color_distance = np.linalg.norm(np.array(from_color) - np.array(to_rgb_tuple))
 
         return color_distance
     
@@ -277,6 +517,7 @@ class PixelArtRecipies(object):
     
     def get_text_color(self, text_color='#000000', backround_hex_str='#ffffff'):
         if backround_hex_str != '#ffffff':
+            import webcolors
             rbg_tuple = tuple(webcolors.hex_to_rgb(backround_hex_str))
             text_colors_list = []
             for color in ['white', 'black']:
@@ -319,13 +560,146 @@ class PixelArtRecipies(object):
     
     
     
+    def get_block_index(self, rgb_dict, metric=None):
+        if metric is None:
+            metric = self.metric
+        index_key = (metric, tuple((file_name, tuple(rgb_tuple)) for file_name, rgb_tuple in rgb_dict.items()))
+        if index_key not in self.block_index_dict:
+            self.block_index_dict[index_key] = NearestBlockIndex(rgb_dict, metric=metric)
+        
+        return self.block_index_dict[index_key]
+    
+    
+    
+    def get_unique_pixels(self, img_array):
+        pixels_array = img_array.reshape(-1, img_array.shape[-1])
+        
+        # Pack each uint8 pixel into a single integer so np.unique sorts scalars rather than rows
+        if pixels_array.dtype == np.uint8:
+            codes_array = np.zeros(pixels_array.shape[0], dtype=np.uint64)
+            for channel in range(pixels_array.shape[1]):
+                codes_array = (codes_array << np.uint64(8)) | pixels_array[:, channel]
+            _, first_indices, inverse_array = np.unique(codes_array, return_index=True, return_inverse=True)
+            unique_pixels_array = pixels_array[first_indices]
+        else:
+            unique_pixels_array, inverse_array = np.unique(pixels_array, axis=0, return_inverse=True)
+        
+        return unique_pixels_array, inverse_array.reshape(-1)
+    
+    
+    
+    def get_pixel_to_filename_dict(self, img_array, rgb_dict):
+        
+        # Answer every distinct pixel colour with one batched query
+        unique_pixels_array, _ = self.get_unique_pixels(img_array)
+        file_names_array = self.get_block_index(rgb_dict).query_file_names(unique_pixels_array)
+        pixel_to_filename_dict = {tuple(pixel): file_name for pixel, file_name in zip(unique_pixels_array,
+                                                                                     file_names_array)}
+        
+        return pixel_to_filename_dict
+    
+    
+    
+    def get_lut_name(self, rgb_dict, bits_per_channel=8, metric=None):
+        if metric is None:
+            metric = self.metric
+        
+        # Key the lookup table by the palette contents, not just its name
+        palette_str = ';'.join(f'{file_name}:{",".join(repr(float(c)) for c in rgb_tuple)}'
+                               for file_name, rgb_tuple in rgb_dict.items())
+        palette_hash = hashlib.sha1(f'{metric}|{bits_per_channel}|{palette_str}'.encode('utf-8')).hexdigest()
+        lut_name = f'block_lut_{metric}_{bits_per_channel}bit_{palette_hash[:16]}'
+        
+        return lut_name
+    
+    
+    
+    def get_block_lut(self, rgb_dict, bits_per_channel=8, verbose=False):
+        """
+        :param rgb_dict:          palette of texture file names to colours
+        :param bits_per_channel:  8 for the full 256³ table, or 5 or 6 to cap memory
+        :return:                  memory-mapped (2**bits)³ array of indices into the palette
+        """
+        lut_name = self.get_lut_name(rgb_dict, bits_per_channel=bits_per_channel)
+        if not self.s.npy_exists(lut_name):
+            block_index = self.get_block_index(rgb_dict)
+            level_count = 1 << bits_per_channel
+            shift = 8 - bits_per_channel
+            dtype = np.uint8 if len(block_index.file_names_list) <= 256 else np.uint16
+            
+            # Represent each coarse bin by the colour at its centre
+            levels_array = (np.arange(level_count) << shift) + ((1 << shift) - 1) / 2
+            green_array, blue_array = np.meshgrid(levels_array, levels_array, indexing='ij')
+            lut_array = np.empty((level_count, level_count, level_count), dtype=dtype)
+            for red_level in range(level_count):
+                pixels_array = np.column_stack([np.full(green_array.size, levels_array[red_level]),
+                                                green_array.ravel(), blue_array.ravel()])
+                lut_array[red_level] = block_index.query(pixels_array).reshape(level_count, level_count)
+            self.s.store_arrays(verbose=verbose, **{lut_name: lut_array})
+        lut_array = self.s.load_array(lut_name, mmap_mode='r', verbose=verbose)
+        
+        return lut_array
+    
+    
+    
+    def get_label_grid(self, img_array, rgb_dict):
+        """
+        :param img_array:  H×W×3 (or H×W×4) array of pixel colours
+        :param rgb_dict:   palette of texture file names to colours
+        :return:           H×W array of indices into file_names_list, and file_names_list
+        """
+        block_index = self.get_block_index(rgb_dict)
+        if self.dither_method is not None:
+            lut_array = None
+            if self.lut_bits_per_channel is not None:
+                lut_array = self.get_block_lut(rgb_dict, bits_per_channel=self.lut_bits_per_channel)
+            labels_array = Ditherer(block_index, method=self.dither_method, lut_array=lut_array).dither(img_array)
+            
+            return labels_array, block_index.file_names_list
+        
+        # Quantize with a single fancy-indexing operation
+        if self.lut_bits_per_channel is not None:
+            lut_array = self.get_block_lut(rgb_dict, bits_per_channel=self.lut_bits_per_channel)
+            shift = 8 - self.lut_bits_per_channel
+            channels_list = [img_array[:, :, channel].astype(np.intp) >> shift for channel in range(3)]
+            labels_array = np.asarray(lut_array[channels_list[0], channels_list[1], channels_list[2]],
+                                      dtype=np.intp)
+            
+            return labels_array, block_index.file_names_list
+        
+        unique_pixels_array, inverse_array = self.get_unique_pixels(img_array)
+        labels_array = block_index.query(unique_pixels_array)[inverse_array]
+        labels_array = labels_array.reshape(img_array.shape[:2])
+        
+        return labels_array, block_index.file_names_list
+    
+    
+    
+    def get_labels_block_grid(self, labels_array, file_names_list, rgb_dict):
+        def get_attributes_dict(file_name):
+            red, green, blue = tuple(rgb_dict[file_name])[:3]
+            attributes_dict = {'block_name': self.get_block_name(file_name),
+                               'hex_str': self.get_hex_str(rgb_dict, file_name),
+                               'red': red, 'green': green, 'blue': blue}
+            
+            return attributes_dict
+        
+        return BlockGrid.from_labels(labels_array, file_names_list, get_attributes_dict)
+    
+    
+    
+    def get_labels_dataframe(self, labels_array, file_names_list, rgb_dict):
+        
+        return self.get_labels_block_grid(labels_array, file_names_list, rgb_dict).to_dataframe()
+    
+    
+    
     def pixel_to_filename(self, img_array, row, col, rgb_dict):
         pixel = img_array[row][col]
         if tuple(pixel) in self.pixel_to_filename_dict:
             file_name = self.pixel_to_filename_dict[tuple(pixel)]
         else:
-            f = lambda item: self.color_distance_from(item[1], pixel)
-            file_name = sorted(rgb_dict.items(), key=f)[0][0]
+            file_name = self.get_block_index(rgb_dict).query_file_names(pixel)[0]
             self.pixel_to_filename_dict[tuple(pixel)] = file_name
         
         return file_name
@@ -333,6 +707,7 @@ class PixelArtRecipies(object):
     
     
     def get_hex_str(self, rgb_dict, file_name):
+        from matplotlib.colors import to_hex
         def f(x):
             if x > 255:
                 x = 1
@@ -361,17 +736,31 @@ class PixelArtRecipies(object):
     
     
     
+    def get_text_cell_markup(self, row, col, block_name, hex_str, text_color):
+        x, z = self.convert_rowcols_to_minecraft_coords(row, col)
+        
+        return f'<td title="X:{x} Z:{z}" style="background-color:{hex_str};text-align:center;color:{text_color}">{block_name}</td>'
+    
+    
+    
+    def get_image_cell_markup(self, row, col, block_name, img_path, td_style, img_style):
+        x, z = self.convert_rowcols_to_minecraft_coords(row, col)
+        image_html_str = f'<td title="X:{x} Z:{z} {block_name}" style="{td_style}">'
+        image_html_str += f'<img src="file:///{img_path}" style="{img_style}" /></td>'
+        
+        return image_html_str
+    
+    
+    
     def get_column_markup(self, img_array, rgb_dict, td_style, img_style, row, col, text_html_str,
                           image_html_str):
         file_name = self.pixel_to_filename(img_array, row, col, rgb_dict)
         img_path = os.path.abspath(f'{self.textures_dir}/{file_name}')
         block_name = self.get_block_name(file_name)
         hex_str = self.get_hex_str(rgb_dict, file_name)
-        x, z = self.convert_rowcols_to_minecraft_coords(row, col)
         text_color = self.get_text_color(backround_hex_str=hex_str)
-        text_html_str += f'<td title="X:{x} Z:{z}" style="background-color:{hex_str};text-align:center;color:{text_color}">{block_name}</td>'
-        image_html_str += f'<td title="X:{x} Z:{z} {block_name}" style="{td_style}">'
-        image_html_str += f'<img src="file:///{img_path}" style="{img_style}" /></td>'
+        text_html_str += self.get_text_cell_markup(row, col, block_name, hex_str, text_color)
+        image_html_str += self.get_image_cell_markup(row, col, block_name, img_path, td_style, img_style)
         
         return text_html_str, image_html_str
     
@@ -441,22 +830,136 @@ class PixelArtRecipies(object):
     
     
     
-    def get_it_markup(self, file_path, rgb_dict, file_prefix):
-        minecraft_pixel_art_img = Image.open(file_path)
-        img_array = np.array(minecraft_pixel_art_img)
-        self.pixel_to_filename_dict = {}
-        row_count = img_array.shape[0]
-        col_count = img_array.shape[1]
+    def get_block_markup_dict(self, labels_array, file_names_list, rgb_dict):
+        
+        # Compute the per-block attributes once for each block used
+        blocks_dict = {}
+        for label in np.unique(labels_array):
+            file_name = file_names_list[label]
+            hex_str = self.get_hex_str(rgb_dict, file_name)
+            blocks_dict[label] = (os.path.abspath(f'{self.textures_dir}/{file_name}'), self.get_block_name(file_name),
+                                  hex_str, self.get_text_color(backround_hex_str=hex_str))
+        
+        return blocks_dict
+    
+    
+    
+    def iter_text_markup(self, labels_array, file_names_list, rgb_dict, row_count=None, col_count=None):
+        """
+        :param labels_array:  H×W grid of indices into file_names_list
+        :param row_count:     number of rows to render, or None for all of them
+        :param col_count:     number of columns to render, or None for all of them
+        :return:              yields the text table one row at a time
+        """
+        labels_array = labels_array[:row_count, :col_count]
+        blocks_dict = self.get_block_markup_dict(labels_array, file_names_list, rgb_dict)
+        yield '<table style="border-collapse:collapse;">'
+        for row in range(labels_array.shape[0]):
+            cells_list = []
+            for col, label in enumerate(labels_array[row].tolist()):
+                _, block_name, hex_str, text_color = blocks_dict[label]
+                cells_list.append(self.get_text_cell_markup(row, col, block_name, hex_str, text_color))
+            yield '<tr>' + ''.join(cells_list) + '</tr>'
+        yield '</table><hr />'
+    
+    
+    
+    def iter_image_markup(self, labels_array, file_names_list, rgb_dict, file_prefix, file_path):
+        """
+        :param labels_array:  H×W grid of indices into file_names_list
+        :return:              yields the image table one row at a time
+        """
+        row_count, col_count = labels_array.shape
         td_style = 'padding:0;margin:0;'
         img_style = 'display:block;margin:0!important;padding:0!important;border:0!important;'
-        text_html_str = image_html_str = '<table style="border-collapse:collapse;">'
+        blocks_dict = self.get_block_markup_dict(labels_array, file_names_list, rgb_dict)
+        yield '<table style="border-collapse:collapse;">'
         for row in range(row_count):
-            (text_html_str, image_html_str) = self.get_row_markup(text_html_str, image_html_str, img_array, rgb_dict,
-                                                                  td_style, img_style, file_prefix, file_path,
-                                                                  col_start=0, col_count=col_count,
-                                                                  row_start=row, row_count=row_count)
-        text_html_str += '</table><hr />'
-        image_html_str += '</table>'
+            cells_list = []
+            for col, label in enumerate(labels_array[row].tolist()):
+                img_path, block_name, _, _ = blocks_dict[label]
+                cells_list.append(self.get_image_cell_markup(row, col, block_name, img_path, td_style, img_style))
+            if row == 0:
+                cells_list.append(self.get_rowspan_markup(file_prefix, file_path, td_style, '',
+                                                          row_count, col_count))
+            yield '<tr>' + ''.join(cells_list) + '</tr>'
+        yield '</table>'
+    
+    
+    
+    def get_sprite_atlas(self, file_names_list, labels_list):
+        """
+        :param file_names_list:  texture file names, indexed by label
+        :param labels_list:      labels of the blocks to pack
+        :return:                 the atlas image, and a dictionary of each label's (left, top) offset in it
+        """
+        column_count = max(1, math.ceil(math.sqrt(len(labels_list))))
+        row_count = max(1, math.ceil(len(labels_list) / column_count))
+        atlas_img = Image.new('RGBA', (column_count*16, row_count*16), (0, 0, 0, 0))
+        positions_dict = {}
+        for i, label in enumerate(labels_list):
+            texture_img = Image.open(os.path.join(self.textures_dir, file_names_list[label])).convert('RGBA')
+            
+            # Animated textures are vertical strips of frames, so keep the first one
+            texture_img = texture_img.crop((0, 0, texture_img.width, texture_img.width)).resize((16, 16), Image.NEAREST)
+            left = (i % column_count) * 16
+            top = (i // column_count) * 16
+            atlas_img.paste(texture_img, (left, top))
+            positions_dict[label] = (left, top)
+        
+        return atlas_img, positions_dict
+    
+    
+    
+    def get_sprite_css(self, positions_dict, atlas_url):
+        
+        # One short class per block, positioned over the sprite atlas
+        css_str = 'table.recipe{border-collapse:collapse;}table.recipe td{padding:0;margin:0;}'
+        css_str += f'table.recipe td[class]{{width:16px;height:16px;background-image:url("{atlas_url}");'
+        css_str += 'background-repeat:no-repeat;}'
+        for label, (left, top) in positions_dict.items():
+            css_str += f'.k{label}{{background-position:-{left}px -{top}px;}}'
+        
+        return css_str
+    
+    
+    
+    def get_sprite_script(self, file_names_list, labels_list):
+        
+        # Build the "X:.. Z:.. Block Name" tooltips on hover instead of repeating them in every cell
+        names_str = ','.join(f'k{label}:"{self.get_block_name(file_names_list[label])}"' for label in labels_list)
+        script_str = f'var names={{{names_str}}};'
+        script_str += 'document.addEventListener("mouseover",function(e){var td=e.target;'
+        script_str += 'if(td.tagName=="TD"&&names[td.className]&&!td.title){'
+        script_str += f'td.title="X:"+(td.cellIndex+({self.horizontal_offset}))+" Z:"+'
+        script_str += f'(td.parentNode.rowIndex+({self.vertical_offset}))+" "+names[td.className];}}}});'
+        
+        return script_str
+    
+    
+    
+    def iter_sprite_markup(self, labels_array, file_prefix, file_path):
+        """
+        :param labels_array:  H×W grid of indices into file_names_list
+        :return:              yields the image table one row at a time, styled by get_sprite_css classes
+        """
+        row_count, col_count = labels_array.shape
+        yield '<table class="recipe">'
+        for row in range(row_count):
+            row_html_str = '<tr>' + ''.join([f'<td class=k{label}></td>' for label in labels_array[row].tolist()])
+            if row == 0:
+                row_html_str += self.get_rowspan_markup(file_prefix, file_path, '', '', row_count, col_count)
+            yield row_html_str + '</tr>'
+        yield '</table>'
+    
+    
+    
+    def get_it_markup(self, file_path, rgb_dict, file_prefix):
+        img_array = np.array(Image.open(file_path))
+        labels_array, file_names_list = self.get_label_grid(img_array, rgb_dict)
+        text_html_str = ''.join(self.iter_text_markup(labels_array, file_names_list, rgb_dict))
+        image_html_str = ''.join(self.iter_image_markup(labels_array, file_names_list, rgb_dict, file_prefix,
+                                                        file_path))
         
         return text_html_str, image_html_str
     
@@ -475,30 +978,70 @@ class PixelArtRecipies(object):
     
     
     
-    def show_art_recipe(self, file_path, rgb_dict=None, blocks_list=None,
-                        block_names_df=pd.DataFrame([], columns=['row_number', 'column_number', 'file_name', 'block_name', 'hex_str']), verbose=True):
+    def show_art_recipe(self, file_path, rgb_dict=None, blocks_list=None, block_names_df=None, verbose=True,
+                        preview_row_count=128, preview_col_count=128, atlas_mode=None):
+        """
+        :param block_names_df:  a BlockGrid or file names dataframe to count the blocks of, or None to count the
+                                blocks of this recipe
+        :param atlas_mode:  None to give every cell its own <img> tag and inline style; 'png' to style the cells
+                            with one CSS class per block over a sprite atlas saved next to the HTML, with the
+                            coordinate tooltips built on hover; 'data_uri' to embed that atlas in the page
+        """
         if blocks_list is not None:
             rgb_dict = {k: v for k, v in rgb_dict.items() if k in blocks_list}
         elif rgb_dict is None:
             rgb_dict = self.weighted_average_dict
         file_prefix = file_path.split('/')[-1].split('.')[0]
-        text_html_str, image_html_str = self.get_it_markup(file_path, rgb_dict, file_prefix)
-        display(HTML(text_html_str))
+        block_grid = self.get_file_names_grid(file_path, rgb_dict)
+        labels_array = block_grid.codes_array
+        file_names_list = block_grid.blocks_df.file_name.tolist()
+        
+        # Only preview the top-left corner of big builds in the notebook
+        from IPython.display import HTML, display
+        display(HTML(''.join(self.iter_text_markup(labels_array, file_names_list, rgb_dict,
+                                                   row_count=preview_row_count, col_count=preview_col_count))))
         html_path = os.path.abspath(f'../saves/html/{file_prefix}.html')
         os.makedirs(name=os.path.dirname(html_path), exist_ok=True)
         Path(html_path).touch()
         _, _, _, code = traceback.extract_stack()[-2]
+        
+        # Stream the recipe to disk a row at a time
         with open(html_path, 'w') as f:
-            f.write(f'<html><head><title>{code}</title></head><body>')
-            f.write(image_html_str)
+            if atlas_mode is None:
+                f.write(f'<html><head><title>{code}</title></head><body>')
+                image_html_iter = self.iter_image_markup(labels_array, file_names_list, rgb_dict, file_prefix,
+                                                         file_path)
+            else:
+                atlas_img, positions_dict = self.get_sprite_atlas(file_names_list, np.unique(labels_array).tolist())
+                if atlas_mode == 'data_uri':
+                    buffer = io.BytesIO()
+                    atlas_img.save(buffer, format='PNG')
+                    atlas_url = 'data:image/png;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+                else:
+                    atlas_file_name = f'{file_prefix}_atlas.png'
+                    atlas_img.save(os.path.join(os.path.dirname(html_path), atlas_file_name))
+                    atlas_url = atlas_file_name
+                css_str = self.get_sprite_css(positions_dict, atlas_url)
+                script_str = self.get_sprite_script(file_names_list, list(positions_dict.keys()))
+                f.write(f'<html><head><title>{code}</title><style>{css_str}</style>')
+                f.write(f'<script>{script_str}</script></head><body>')
+                image_html_iter = self.iter_sprite_markup(labels_array, file_prefix, file_path)
+            for image_html_str in image_html_iter:
+                f.write(image_html_str)
             f.write('</body></html>')
+        if block_names_df is None:
+            block_names_df = block_grid
+        if isinstance(block_names_df, BlockGrid):
+            block_names_series = block_names_df.get_value_counts('block_name')
+        else:
+            block_names_series = block_names_df.block_name.value_counts()
         if blocks_list is not None:
-            mask_series = block_names_df.block_name.isin([self.get_block_name(file_name) for file_name in blocks_list])
-            block_names_df = block_names_df[mask_series]
-        block_names_series = block_names_df.block_name.value_counts()
+            mask_series = block_names_series.index.isin([self.get_block_name(file_name) for file_name in blocks_list])
+            block_names_series = block_names_series[mask_series]
+        block_names_series = block_names_series[block_names_series > 0]
         stacks_list = []
         block_names_list = []
-        for block_name, block_count in block_names_series.iteritems():
+        for block_name, block_count in block_names_series.items():
             stacks_list, summary_str = self.get_stack_summary(block_count, block_name, stacks_list)
             if verbose:
                 print(summary_str)
@@ -518,40 +1061,108 @@ class PixelArtRecipies(object):
     
     
     
-    def get_file_names_dataframe(self, file_path, rgb_dict):
+    def get_file_names_grid(self, file_path, rgb_dict):
         img_array = np.array(Image.open(file_path))
-        self.pixel_to_filename_dict = {}
-        row_count = img_array.shape[0]
-        col_count = img_array.shape[1]
-        rows_list = []
-        for row in range(row_count):
-            for col in range(col_count):
-                row_dict = {}
-                row_dict['row_number'] = row
-                row_dict['column_number'] = col
-                
-                file_name = self.pixel_to_filename(img_array, row, col, rgb_dict)
-                row_dict['file_name'] = file_name
-                
-                block_name = self.get_block_name(file_name)
-                row_dict['block_name'] = block_name
-                
-                hex_str = self.get_hex_str(rgb_dict, file_name)
-                row_dict['hex_str'] = hex_str
-                
-                rows_list.append(row_dict)
-        file_names_df = pd.DataFrame(rows_list)
+        labels_array, file_names_list = self.get_label_grid(img_array, rgb_dict)
         
-        return file_names_df
+        return self.get_labels_block_grid(labels_array, file_names_list, rgb_dict)
     
     
     
-    def get_next_file_names_dataframe(self, file_path='../saves/png/visual_construction101x101.png'):
+    def get_file_names_dataframe(self, file_path, rgb_dict):
+        
+        return self.get_file_names_grid(file_path, rgb_dict).to_dataframe()
+    
+    
+    
+    def get_next_file_names_grid(self, file_path='../saves/png/visual_construction101x101.png'):
         blocks_list = self.unpowdered_and_unglazed_list + self.stained_glass_list
         rgb_dict = {k: v for k, v in self.dominant_dict.items() if k in blocks_list}
-        file_names_df = self.get_file_names_dataframe(file_path, rgb_dict)
         
-        return file_names_df
+        return self.get_file_names_grid(file_path, rgb_dict)
+    
+    
+    
+    def get_next_file_names_dataframe(self, file_path='../saves/png/visual_construction101x101.png'):
+        
+        return self.get_next_file_names_grid(file_path).to_dataframe()
+    
+    
+    
+    def get_floor_palette(self, rgb_dict=None, blocks_list=None):
+        """Return the palette for a built floor, which leaves out the textures that no block shows on top."""
+        if rgb_dict is None:
+            rgb_dict = self.weighted_average_dict
+        if blocks_list is not None:
+            rgb_dict = {k: v for k, v in rgb_dict.items() if k in blocks_list}
+        
+        return {k: v for k, v in rgb_dict.items() if is_shown_on_top(k)}
+    
+    
+    
+    def export_structure(self, file_path, rgb_dict=None, blocks_list=None, structure_format='schem', verbose=False):
+        """
+        :param structure_format:  'schem' for WorldEdit, 'nbt' for a structure block, or 'litematic' for Litematica
+        :return:                  the path of the structure file, in ../saves/<structure_format>
+        """
+        file_prefix = file_path.split('/')[-1].split('.')[0]
+        block_grid = self.get_file_names_grid(file_path, self.get_floor_palette(rgb_dict, blocks_list))
+        structure_path = os.path.abspath(f'../saves/{structure_format}/{file_prefix}.{structure_format}')
+        start_time = time.perf_counter()
+        StructureExporter(block_grid, name=file_prefix).export(structure_path)
+        if verbose:
+            print(f'Exported {block_grid.shape[1]}x{block_grid.shape[0]} blocks in '
+                  f'{time.perf_counter() - start_time:.3f} seconds: {structure_path}')
+        
+        return structure_path
+    
+    
+    
+    def export_commands(self, file_path, rgb_dict=None, blocks_list=None, y='~', namespace='pixel_art', verbose=False):
+        """
+        :param y:  the Y coordinate of the floor, or '~' to build at the height the function is run at, for builds
+                   small enough for one function
+        :return:   the path of the datapack folder, in ../saves/datapacks, whose main function places the build
+                   at the horizontal_offset and vertical_offset coordinates
+        """
+        file_prefix = file_path.split('/')[-1].split('.')[0]
+        block_grid = self.get_file_names_grid(file_path, self.get_floor_palette(rgb_dict, blocks_list))
+        command_exporter = CommandExporter(block_grid, name=file_prefix, horizontal_offset=self.horizontal_offset,
+                                           vertical_offset=self.vertical_offset, y=y)
+        datapack_dir = os.path.abspath(f'../saves/datapacks/{command_exporter.function_name}')
+        command_count = command_exporter.export(datapack_dir, namespace=namespace)
+        if verbose:
+            print(f'{command_count} commands instead of {command_exporter.block_count} setblocks '
+                  f'({command_exporter.block_count / max(command_count, 1):.1f}x fewer): '
+                  f'/function {namespace}:{command_exporter.function_name}')
+        
+        return datapack_dir
+    
+    
+    
+    def write_to_world(self, file_path, world_dir, y, rgb_dict=None, blocks_list=None, create_missing_chunks=False,
+                       verbose=False):
+        """
+        :param world_dir:              the world save folder, holding level.dat; close the world in Minecraft first
+        :param y:                      the Y coordinate of the floor, whose columns and rows are placed from the
+                                       horizontal_offset and vertical_offset coordinates
+        :param create_missing_chunks:  True to write never-generated chunks as air with the build in them
+        :return:                       lists of the (chunk_x, chunk_z) written and of those left out
+        """
+        file_prefix = file_path.split('/')[-1].split('.')[0]
+        block_grid = self.get_file_names_grid(file_path, self.get_floor_palette(rgb_dict, blocks_list))
+        anvil_writer = AnvilWriter(block_grid, name=file_prefix, horizontal_offset=self.horizontal_offset,
+                                   vertical_offset=self.vertical_offset, y=y)
+        start_time = time.perf_counter()
+        written_chunks_list, missing_chunks_list = anvil_writer.write(world_dir,
+                                                                      create_missing_chunks=create_missing_chunks)
+        if verbose:
+            print(f'Wrote {anvil_writer.block_count} blocks into {len(written_chunks_list)} chunks in '
+                  f'{time.perf_counter() - start_time:.3f} seconds')
+            if missing_chunks_list:
+                print(f'Left out {len(missing_chunks_list)} chunks that were never generated: {missing_chunks_list}')
+        
+        return written_chunks_list, missing_chunks_list
     
     
     
@@ -566,23 +1177,156 @@ class PixelArtRecipies(object):
     
     
     
-    def get_section_file_path(self, art_file_path, row_range, column_range):
-        art_img = Image.open(art_file_path)
+    def is_up_to_date(self, output_path, input_path):
+        
+        return os.path.isfile(output_path) and (os.path.getmtime(output_path) >= os.path.getmtime(input_path))
+    
+    
+    
+    def get_section_file_path(self, art_file_path, row_range, column_range, art_array=None, overwrite=True):
+        """
+        :param art_array:  the already-decoded art, so that batch exports slice it rather than reopening the file
+        :param overwrite:  False to keep a section PNG that is newer than the art file
+        """
         left = column_range.start
         top = row_range.start
         right = column_range.stop
         bottom = row_range.stop
-        cropped_img = art_img.crop((left, top, right, bottom))
         art_dir = os.path.dirname(art_file_path)
         art_file_name = art_file_path.split(os.sep)[-1].split('.')[0]
         section_file_name = f'{art_file_name}_{left}_{top}_{right}_{bottom}.png'
         section_file_path = os.path.join(art_dir, section_file_name)
-        cropped_img.save(os.path.abspath(section_file_path))
+        if overwrite or not self.is_up_to_date(section_file_path, art_file_path):
+            if art_array is None:
+                art_img = Image.open(art_file_path)
+                cropped_img = art_img.crop((left, top, right, bottom))
+            else:
+                
+                # Slice a view, padding with zeros past the edges like Image.crop does
+                cropped_array = np.zeros((bottom - top, right - left) + art_array.shape[2:], dtype=art_array.dtype)
+                row_slice = slice(max(top, 0), min(bottom, art_array.shape[0]))
+                column_slice = slice(max(left, 0), min(right, art_array.shape[1]))
+                if (row_slice.start < row_slice.stop) and (column_slice.start < column_slice.stop):
+                    cropped_array[row_slice.start - top:row_slice.stop - top,
+                                  column_slice.start - left:column_slice.stop - left] = art_array[row_slice, column_slice]
+                cropped_img = Image.fromarray(cropped_array)
+            cropped_img.save(os.path.abspath(section_file_path))
         
         return section_file_path
     
     
     
+    def get_build_size(self, source_width, source_height, width=None, height=None, block_budget=None,
+                       map_alignment=None):
+        if (width is None) and (height is None):
+            if block_budget is None:
+                width, height = source_width, source_height
+            else:
+                scale = min(1.0, math.sqrt(block_budget / (source_width * source_height)))
+                width, height = max(1, int(source_width * scale)), max(1, int(source_height * scale))
+        elif width is None:
+            width = max(1, round(source_width * height / source_height))
+        elif height is None:
+            height = max(1, round(source_height * width / source_width))
+        
+        # Maps are 128 blocks on a side
+        if map_alignment == 'crop':
+            width, height = max(128, width // 128 * 128), max(128, height // 128 * 128)
+        elif map_alignment == 'pad':
+            width, height = -(-width // 128) * 128, -(-height // 128) * 128
+        
+        return width, height
+    
+    
+    
+    def resample_art(self, file_path, width=None, height=None, block_budget=None, method='area', map_alignment=None,
+                     pad_color=(255, 255, 255), overwrite=False, verbose=False):
+        """
+        :param width:          build width in blocks; with no height, the height keeps the aspect ratio
+        :param height:         build height in blocks; with no width, the width keeps the aspect ratio
+        :param block_budget:   the most blocks the build may use, when neither width nor height is given
+        :param method:         'area' to average the pixels under each block, or 'lanczos'
+        :param map_alignment:  None to keep the size, 'crop' to trim to a multiple of 128 blocks, or 'pad' to grow to
+                               one by padding the resampled image with pad_color; a build under 128 blocks across
+                               is scaled up to cover 128 blocks before cropping
+        :param pad_color:      the RGB colour of the padding, which is part of the cached image's name
+        :param overwrite:      True to resample again even if the cached build image is newer than the source
+        :return:               the path of the build-sized PNG, ready for show_art_recipe
+        """
+        resample_dict = {'area': Image.BOX, 'lanczos': Image.LANCZOS}
+        if method not in resample_dict:
+            raise ValueError(f'Unknown resampling method {method!r}: choose one of {sorted(resample_dict)}')
+        source_img = Image.open(file_path)
+        source_width, source_height = source_img.size
+        fit_width, fit_height = self.get_build_size(source_width, source_height, width=width, height=height,
+                                                    block_budget=block_budget)
+        build_width, build_height = self.get_build_size(source_width, source_height, width=fit_width,
+                                                        height=fit_height, map_alignment=map_alignment)
+        
+        # Name the build image like the hand-made ones, e.g. shuriken4032x3024.png to shuriken_area41x31.png
+        art_dir = os.path.dirname(file_path)
+        art_file_name = re.sub(r'\d+x\d+$', '', os.path.basename(file_path).split('.')[0])
+        if map_alignment is None:
+            alignment_str = ''
+        elif map_alignment == 'pad':
+            alignment_str = '_pad_' + ''.join(f'{int(channel):02x}' for channel in pad_color)
+        else:
+            alignment_str = f'_{map_alignment}'
+        build_file_name = f'{art_file_name}_{method}{alignment_str}{build_width}x{build_height}.png'
+        build_file_path = os.path.join(art_dir, build_file_name)
+        if not overwrite and self.is_up_to_date(build_file_path, file_path):
+            
+            return build_file_path
+        start_time = time.perf_counter()
+        
+        # Padding keeps the requested size, but a crop box bigger than it needs the image scaled up to cover it
+        if (map_alignment == 'crop') and ((fit_width < build_width) or (fit_height < build_height)):
+            scale = max(build_width / fit_width, build_height / fit_height)
+            fit_width = max(build_width, round(fit_width * scale))
+            fit_height = max(build_height, round(fit_height * scale))
+        
+        # Let JPEG decoding skip the resolution we are about to throw away
+        source_img.draft('RGB', (fit_width * 2, fit_height * 2))
+        source_array = np.asarray(source_img.convert('RGBA'))
+        
+        # Average in linear light, so that dark and light detail keep their brightness, and premultiplied
+        # by alpha, so that the colour of transparent pixels doesn't bleed into their neighbours
+        linear_array = rgb_to_linear(np.arange(256)).astype(np.float32)
+        alpha_array = source_array[:, :, 3].astype(np.float32) / 255
+        channels_list = [linear_array[source_array[:, :, channel]] * alpha_array for channel in range(3)]
+        channels_list.append(alpha_array)
+        resized_list = [np.asarray(Image.fromarray(channel_array, mode='F').resize((fit_width, fit_height),
+                                                                                   resample_dict[method]))
+                        for channel_array in channels_list]
+        resized_alpha_array = np.clip(resized_list[3], 0, 1)
+        fit_array = np.zeros((fit_height, fit_width, 4), dtype=np.uint8)
+        for channel in range(3):
+            unpremultiplied_array = np.divide(resized_list[channel], resized_alpha_array,
+                                              out=np.zeros_like(resized_alpha_array), where=resized_alpha_array > 0)
+            fit_array[:, :, channel] = np.rint(linear_to_rgb(unpremultiplied_array))
+        fit_array[:, :, 3] = np.rint(resized_alpha_array * 255)
+        
+        # Centre the fitted image on the build, cropping or padding the edges
+        build_array = np.zeros((build_height, build_width, 4), dtype=np.uint8)
+        build_array[:, :, :3] = pad_color
+        build_array[:, :, 3] = 255
+        top = (fit_height - build_height) // 2
+        left = (fit_width - build_width) // 2
+        row_slice = slice(max(top, 0), max(top, 0) + min(fit_height, build_height))
+        column_slice = slice(max(left, 0), max(left, 0) + min(fit_width, build_width))
+        build_array[max(-top, 0):max(-top, 0) + min(fit_height, build_height),
+                    max(-left, 0):max(-left, 0) + min(fit_width, build_width)] = fit_array[row_slice, column_slice]
+        if build_array[:, :, 3].min() == 255:
+            build_array = build_array[:, :, :3]
+        Image.fromarray(build_array).save(build_file_path)
+        if verbose:
+            print(f'Resampled {source_width}x{source_height} to {build_width}x{build_height} in '
+                  f'{time.perf_counter() - start_time:.3f} seconds: {build_file_path}')
+        
+        return build_file_path
+    
+    
+    
     def convert_minecraft_coords_to_rowcols(self, x, z):
         col = x - self.horizontal_offset
         row = z - self.vertical_offset
@@ -599,13 +1343,22 @@ class PixelArtRecipies(object):
     
     
     
+    def get_block_grid(self, file_names_df):
+        if isinstance(file_names_df, BlockGrid):
+            
+            return file_names_df
+        
+        return BlockGrid.from_dataframe(file_names_df)
+    
+    
+    
     def get_text_html_by_section(self, file_names_df, row_range, column_range, middle_row=None, center_column=None):
+        block_grid = self.get_block_grid(file_names_df)
         text_html_str = '<table style="border-collapse:collapse;">'
         for row in row_range:
             text_html_str += '<tr>'
             for col in column_range:
-                mask_series = (file_names_df.row_number == row) & (file_names_df.column_number == col)
-                attributes_dict = file_names_df[mask_series].to_dict(orient='records')[0]
+                attributes_dict = block_grid[(row, col)]
                 block_name = attributes_dict['block_name']
                 hex_str = attributes_dict['hex_str']
                 x, z = self.convert_rowcols_to_minecraft_coords(row, col)
@@ -622,16 +1375,19 @@ class PixelArtRecipies(object):
     
     def display_next_minimap(self, x=-450, z=233, art_file_path='../saves/png/visual_construction101x101.png', file_names_df=None):
         if file_names_df is None:
-            file_names_df = self.get_next_file_names_dataframe(art_file_path)
+            file_names_df = self.get_next_file_names_grid(art_file_path)
         middle_row, center_column = self.convert_minecraft_coords_to_rowcols(x, z)
         row_range = range(middle_row-5, middle_row+6)
         column_range = range(center_column-5, center_column+6)
         text_html_str = self.get_text_html_by_section(file_names_df, row_range, column_range, middle_row=middle_row, center_column=center_column)
+        from IPython.display import HTML, display
         display(HTML(text_html_str))
     
     
     
-    def get_image_html_by_section(self, art_file_path, file_names_df, row_range, column_range):
+    def get_image_html_by_section(self, art_file_path, file_names_df, row_range, column_range, art_array=None,
+                                  overwrite=True):
+        block_grid = self.get_block_grid(file_names_df)
         td_style = 'padding:0;margin:0;'
         img_style = 'display:block;margin:0!important;padding:0!important;border:0!important;'
         image_html_str = '<table style="border-collapse:collapse;">'
@@ -639,8 +1395,7 @@ class PixelArtRecipies(object):
         for row in row_range:
             image_html_str += '<tr>'
             for col in column_range:
-                mask_series = (file_names_df.row_number == row) & (file_names_df.column_number == col)
-                attributes_dict = file_names_df[mask_series].to_dict(orient='records')[0]
+                attributes_dict = block_grid[(row, col)]
                 file_name = attributes_dict['file_name']
                 img_path = os.path.abspath(f'{self.textures_dir}/{file_name}')
                 block_name = attributes_dict['block_name']
@@ -654,7 +1409,8 @@ class PixelArtRecipies(object):
                 top = row_range.start
                 right = column_range.stop
                 bottom = row_range.stop
-                section_file_path = self.get_section_file_path(art_file_path, row_range, column_range)
+                section_file_path = self.get_section_file_path(art_file_path, row_range, column_range,
+                                                               art_array=art_array, overwrite=overwrite)
                 section_file_name = art_file_path.split('/')[-1].split('.')[0]
                 src_url = 'file:///' + os.path.abspath(section_file_path).replace(os.sep, '/')
                 image_td_style = f"{td_style}background-image:url('{src_url}');background-size:cover;"
@@ -672,55 +1428,117 @@ class PixelArtRecipies(object):
     
     def surf_to_next_minimap(self, x=-450, z=233, art_file_path='../saves/png/visual_construction101x101.png', file_names_df=None):
         if file_names_df is None:
-            file_names_df = self.get_next_file_names_dataframe(art_file_path)
+            file_names_df = self.get_next_file_names_grid(art_file_path)
         row, col = self.convert_minecraft_coords_to_rowcols(x, z)
         row_range = range(row-5, row+5)
         column_range = range(col-5, col+5)
-        image_html_str = self.get_image_html_by_section(art_file_path, file_names_df, row_range, column_range)
+        section_file_path = self.write_section_html(art_file_path, file_names_df, row_range, column_range)
+        webbrowser.open(section_file_path, new=2)
+    
+    
+    
+    def get_section_hash(self, block_grid, row_range, column_range):
+        """Hash what a section page shows besides the art: its blocks, which change with the palette,
+        metric and dithering, and the textures folder and world offsets."""
+        section_hash = hashlib.sha1(f'{os.path.abspath(self.textures_dir)}|{self.horizontal_offset}|'
+                                    f'{self.vertical_offset}'.encode('utf-8'))
+        for row in row_range:
+            for col in column_range:
+                attributes_dict = block_grid[(row, col)]
+                section_hash.update(f'|{attributes_dict["file_name"]}:{attributes_dict["block_name"]}'.encode('utf-8'))
+        
+        return section_hash.hexdigest()
+    
+    
+    
+    def write_section_html(self, art_file_path, file_names_df, row_range, column_range, art_array=None,
+                           overwrite=True):
+        """
+        :param overwrite:  False to keep a section page that is newer than the art file; the page's name
+                           carries a hash of its blocks, so a new palette, metric or dithering writes a new page
+        """
+        block_grid = self.get_block_grid(file_names_df)
         section_dir = '../saves/html'
         section_file_name = art_file_path.split('/')[-1].split('.')[0]
         left = column_range.start
         top = row_range.start
         right = column_range.stop
         bottom = row_range.stop
-        section_file_name = f'{section_file_name}_{left}_{top}_{right}_{bottom}.html'
+        section_hash = self.get_section_hash(block_grid, row_range, column_range)
+        section_file_name = f'{section_file_name}_{left}_{top}_{right}_{bottom}_{section_hash[:8]}.html'
         section_file_path = os.path.join(section_dir, section_file_name)
-        Path(section_file_path).touch()
-        with open(section_file_path, 'w') as f:
-            f.write(f'<html><head><title>{section_file_name} Left: {left} Top: {top} Right: {right} Bottom: {bottom}</title></head><body>')
-            f.write(image_html_str)
-            f.write('</body></html>')
-        webbrowser.open(section_file_path, new=2)
+        if overwrite or not self.is_up_to_date(section_file_path, art_file_path):
+            image_html_str = self.get_image_html_by_section(art_file_path, block_grid, row_range, column_range,
+                                                            art_array=art_array, overwrite=overwrite)
+            os.makedirs(name=section_dir, exist_ok=True)
+            with open(section_file_path, 'w') as f:
+                f.write(f'<html><head><title>{section_file_name} Left: {left} Top: {top} Right: {right} Bottom: {bottom}</title></head><body>')
+                f.write(image_html_str)
+                f.write('</body></html>')
+        
+        return section_file_path
+    
+    
+    
+    def export_sections(self, art_file_path, file_names_df, row_groups_list=None, column_groups_list=None,
+                        max_workers=8, overwrite=False, verbose=False):
+        """
+        :param art_file_path:  the source art, decoded once and sliced into sections
+        :param max_workers:    number of threads writing section PNGs and HTML pages
+        :param overwrite:      True to rewrite sections that are already newer than the art file
+        :return:               list of the section HTML file paths
+        """
+        block_grid = self.get_block_grid(file_names_df)
+        if row_groups_list is None:
+            row_groups_list = list(self.group_list(range(block_grid.row_start, block_grid.row_start+block_grid.shape[0]), 10))
+        if column_groups_list is None:
+            column_groups_list = list(self.group_list(range(block_grid.column_start, block_grid.column_start+block_grid.shape[1]), 10))
+        art_array = np.array(Image.open(art_file_path))
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures_list = [executor.submit(self.write_section_html, art_file_path, block_grid, row_range, column_range,
+                                            art_array=art_array, overwrite=overwrite)
+                            for row_range in row_groups_list for column_range in column_groups_list]
+            section_file_paths_list = [future.result() for future in futures_list]
+        if verbose:
+            print(f'Exported {len(section_file_paths_list)} sections in {time.perf_counter() - start_time:.3f} seconds')
+        
+        return section_file_paths_list
     
     
     
     def get_it_markup_by_groups(self, art_file_path, file_names_df, row_groups_list=None, column_groups_list=None):
+        
+        # Index the build once for all the sections
+        block_grid = self.get_block_grid(file_names_df)
         if row_groups_list is None:
-            row_groups_list = list(self.group_list(range(file_names_df.row_number.min(), file_names_df.row_number.max()+1), 10))
+            row_groups_list = list(self.group_list(range(block_grid.row_start, block_grid.row_start+block_grid.shape[0]), 10))
         if column_groups_list is None:
-            column_groups_list = list(self.group_list(range(file_names_df.column_number.min(), file_names_df.column_number.max()+1), 10))
+            column_groups_list = list(self.group_list(range(block_grid.column_start, block_grid.column_start+block_grid.shape[1]), 10))
         tuples_list = []
         for row_range in row_groups_list:
             for column_range in column_groups_list:
-                text_html_str = self.get_text_html_by_section(file_names_df, row_range, column_range)
-                image_html_str = self.get_image_html_by_section(art_file_path, file_names_df, row_range, column_range)
-                tuples_list.append(text_html_str, image_html_str)
+                text_html_str = self.get_text_html_by_section(block_grid, row_range, column_range)
+                image_html_str = self.get_image_html_by_section(art_file_path, block_grid, row_range, column_range)
+                tuples_list.append((text_html_str, image_html_str))
         
         return tuples_list
     
     
     
     def get_map_center(self, file_path='../saves/png/visual_construction101x101.png', file_name='cyan_terracotta.png'):
-        file_names_df = self.get_next_file_names_dataframe(file_path=file_path)
-        mask_series = (file_names_df.file_name == file_name)
+        block_grid = self.get_next_file_names_grid(file_path=file_path)
+        
+        # Only expand the cells of the block into rows
+        file_names_df = block_grid.to_dataframe(mask_array=block_grid.get_mask(file_name))
         
-        mean_row_number = file_names_df[mask_series].row_number.mean()
-        file_names_df['middleness'] = file_names_df.row_number.map(lambda x: abs(x - mean_row_number))
+        mean_row_number = file_names_df.row_number.mean()
+        file_names_df['middleness'] = (file_names_df.row_number - mean_row_number).abs()
         
-        mean_column_number = file_names_df[mask_series].column_number.mean()
-        file_names_df['centerness'] = file_names_df.column_number.map(lambda x: abs(x - mean_column_number))
+        mean_column_number = file_names_df.column_number.mean()
+        file_names_df['centerness'] = (file_names_df.column_number - mean_column_number).abs()
         
-        return file_names_df[mask_series].sort_values(['middleness', 'centerness'])
+        return file_names_df.sort_values(['middleness', 'centerness'])
     
     
     
@@ -758,29 +1576,31 @@ class PixelArtRecipies(object):
     
     
     
-    def get_filename(self, row, col):
-        mask_series = (file_names_df.row_number == row) & (file_names_df.column_number == col)
-        file_name = file_names_df[mask_series].file_name.squeeze()
+    def get_filename(self, row, col, file_names_df=None):
+        if file_names_df is None:
+            file_names_df = self.get_next_file_names_grid()
+        file_name = self.get_block_grid(file_names_df).get_file_name(row, col)
         
         return file_name
     
     
     
-    def get_circle_html(self, middle_row, center_column, diameter):
+    def get_circle_html(self, middle_row, center_column, diameter, file_names_df=None):
         radius = diameter / 2
         if (diameter % 2) == 0:
             maxblocks = math.ceil(radius - .5) * 2 + 1
         else:
             maxblocks = math.ceil(radius) * 2
-        west_column = north_row = middle_center - diameter
-        east_column = south_row = middle_center + diameter
+        if file_names_df is None:
+            file_names_df = self.get_next_file_names_grid()
+        block_grid = self.get_block_grid(file_names_df)
         td_style = 'padding:0;margin:0;'
         img_style = 'display:block;margin:0!important;padding:0!important;border:0!important;'
         html_str = '<table style="border-collapse:collapse;">'
         for row in range(int(-maxblocks / 2) + 1, int(maxblocks / 2)):
             html_str += '<tr>'
             for col in range(int(-maxblocks / 2) + 1, int(maxblocks / 2)):
-                file_name = self.get_filename(middle_row+row, center_column+col)
+                file_name = block_grid.get_file_name(middle_row+row, center_column+col)
                 block_name = self.get_block_name(file_name)
                 html_str += f'<td title="{block_name}" style="{td_style}">'
                 if self.distance((middle_row, center_column), (middle_row+row, center_column+col)) <= radius:
@@ -795,8 +1615,8 @@ class PixelArtRecipies(object):
     
     
     
-    def surf_to_next_circle_html(self, middle_center=51, diameter=21):
-        html_str = self.get_circle_html(middle_center, middle_center, diameter)
+    def surf_to_next_circle_html(self, middle_center=51, diameter=21, file_names_df=None):
+        html_str = self.get_circle_html(middle_center, middle_center, diameter, file_names_df=file_names_df)
         html_path = os.path.abspath(f'../saves/html/tens.html')
         os.makedirs(name=os.path.dirname(html_path), exist_ok=True)
         Path(html_path).touch()
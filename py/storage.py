@@ -11,21 +11,94 @@ try:
     import pickle5 as pickle
 except:
     import pickle
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import pyarrow.feather as feather
+except:
+    feather = None
+try:
+    import fcntl
+except:
+    fcntl = None
+try:
+    import msvcrt
+except:
+    msvcrt = None
+try:
+    import zstandard
+except:
+    zstandard = None
+try:
+    import lz4.frame
+except:
+    lz4 = None
+import numpy as np
 import pandas as pd
 import os
 import sys
 import csv
+import contextlib
+import functools
+import glob
+import gzip
+import hashlib
+import inspect
+import io
+import json
+import mmap
+import re
+import struct
+import threading
+import time
+
+# The storage backends, in the order load_object looks for them (see register_backend)
+BACKENDS_DICT = {}
+
+def register_backend(object_format, folder_name, extension, read_function, write_function=None, is_legacy=False):
+    """
+    :param folder_name:  the subfolder of the saves folder that holds the backend's files
+    :param read_function:  read_function(storage, object_path, mmap_mode) returns the stored object
+    :param write_function:  write_function(storage, obj, temp_path) writes it, or None for the
+                            pickle formats, which pickle_object chooses between
+    :param is_legacy:  only read the backend's files, and don't create its folder
+    """
+    BACKENDS_DICT[object_format] = (folder_name, extension, read_function, write_function, is_legacy)
+
+# A pkl5 file is this magic, the buffer count and pickle length, an (offset, length)
+# pair per out-of-band buffer, the pickle stream, and then the 64-byte-aligned buffers
+PKL5_MAGIC = b'PKL5'
+PKL5_HEADER_FORMAT = '<4sIQ'
+PKL5_ALIGNMENT = 64
+
+# A pklz file is this magic and the codec name, then the compressed pickle stream
+PKLZ_MAGIC = b'PKLZ'
+PKLZ_HEADER_FORMAT = '<4s8s'
+
+# Stream compressor and decompressor openers for each installed codec
+CODECS_DICT = {'gzip': (lambda handle: gzip.GzipFile(fileobj=handle, mode='wb', compresslevel=6),
+                        lambda handle: gzip.GzipFile(fileobj=handle, mode='rb'))}
+if zstandard is not None:
+    CODECS_DICT['zstd'] = (lambda handle: zstandard.ZstdCompressor(level=3).stream_writer(handle),
+                           lambda handle: io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(handle)))
+if lz4 is not None:
+    CODECS_DICT['lz4'] = (lambda handle: lz4.frame.open(handle, mode='wb'),
+                          lambda handle: lz4.frame.open(handle, mode='rb'))
 
 class Storage(object):
     """Storage class."""
     
-    def __init__(self, verbose=False):
+    def __init__(self, verbose=False, data_folder=None, saves_folder=None):
+        """
+        :param data_folder:  defaults to $STORAGE_DATA_FOLDER, or else the data folder of the
+                             repository this file is in, so it doesn't depend on the launch directory
+        :param saves_folder:  defaults to $STORAGE_SAVES_FOLDER, or else the repository's saves folder
+        """
         
         # Change this to your data and saves folders
-        self.data_folder = r'../data/'
+        self.data_folder = self.get_root_folder(data_folder, 'STORAGE_DATA_FOLDER', 'data')
         if verbose:
             print('data_folder: {}'.format(self.data_folder))
-        self.saves_folder = r'../saves/'
+        self.saves_folder = self.get_root_folder(saves_folder, 'STORAGE_SAVES_FOLDER', 'saves')
         if verbose:
             print('saves_folder: {}'.format(self.saves_folder))
 
@@ -33,33 +106,74 @@ class Storage(object):
         self.data_csv_folder = os.path.join(self.data_folder, 'csv')
         self.saves_pickle_folder = os.path.join(self.saves_folder, 'pkl')
         self.saves_csv_folder = os.path.join(self.saves_folder, 'csv')
-        if sys.version_info.major == 2:
-            try:
-                os.makedirs(name=self.data_csv_folder)
-            except:
-                pass
-            try:
-                os.makedirs(name=self.saves_pickle_folder)
-            except:
-                pass
-            try:
-                os.makedirs(name=self.saves_csv_folder)
-            except:
-                pass
-        elif sys.version_info.major == 3:
-            os.makedirs(name=self.data_csv_folder, exist_ok=True)
-            os.makedirs(name=self.saves_pickle_folder, exist_ok=True)
-            os.makedirs(name=self.saves_csv_folder, exist_ok=True)
+        self.saves_npy_folder = os.path.join(self.saves_folder, 'npy')
+        self.saves_parquet_folder = os.path.join(self.saves_folder, 'parquet')
+        self.saves_feather_folder = os.path.join(self.saves_folder, 'feather')
+        self.saves_lock_folder = os.path.join(self.saves_folder, 'lock')
+        folders_list = [self.data_csv_folder, self.saves_csv_folder, self.saves_lock_folder]
+        folders_list += [os.path.join(self.saves_folder, backend_tuple[0]) for backend_tuple in BACKENDS_DICT.values()
+                         if not backend_tuple[4]]
+        for folder_path in folders_list:
+            if sys.version_info.major == 2:
+                try:
+                    os.makedirs(name=folder_path)
+                except:
+                    pass
+            elif sys.version_info.major == 3:
+                os.makedirs(name=folder_path, exist_ok=True)
         
         # Handy list of the different types of encodings
         self.encoding_type = ['latin1', 'iso8859-1', 'utf-8'][2]
+        
+        # DataFrames are stored as 'parquet' or 'feather' when pyarrow is installed
+        self.dataframe_format = 'parquet'
+        
+        # Pickles at least as big as a threshold are compressed with the first installed
+        # codec of the largest threshold they reach: zstd for its ratio, and lz4 for its
+        # speed on very large pickles, either falling back to gzip. Set to [] to never compress
+        self.compression_thresholds_list = [(64 << 10, ['zstd', 'gzip']), (256 << 20, ['lz4', 'zstd', 'gzip'])]
+        
+        # How often, and after how long a first wait, to retry reading a file that is mid-write
+        self.read_attempts = 5
+        self.read_retry_seconds = 0.05
+        
+        # Hit and miss counts of each memoized function
+        self.memo_stats_dict = {}
+        
+        # The index of stored objects, reread only when another Storage changes it
+        self.manifest_path = os.path.join(self.saves_folder, 'manifest.json')
+        self.manifest_dict = None
+        self.manifest_signature = None
     
+    @staticmethod
+    def get_root_folder(folder_path, environment_variable, folder_name):
+        if folder_path is None:
+            folder_path = os.environ.get(environment_variable)
+        if folder_path is None:
+            
+            # This file lives one folder down from the repository root, in py/ or load_magic/
+            repository_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            if os.path.isdir(os.path.join(repository_folder, folder_name)):
+                folder_path = os.path.join(repository_folder, folder_name)
+            
+            # Otherwise assume the notebook or script was launched one folder down
+            else:
+                folder_path = os.path.join(os.pardir, folder_name)
+        
+        return os.path.abspath(folder_path)
+
     def csv_exists(self, csv_name):
         csv_path = os.path.join(self.saves_csv_folder, '{}.csv'.format(csv_name))
 
         return os.path.isfile(csv_path)
 
-    def load_csv(self, csv_name=None, folder_path=None):
+    def load_csv(self, csv_name=None, folder_path=None, compact=False, chunk_size=100_000, engine=None,
+                 cache=False, verbose=False):
+        """
+        :param compact:  read in chunks with compact dtypes inferred from the first chunk (see read_csv_compact)
+        :param engine:  the pandas CSV engine for compact reads; 'pyarrow' reads the whole file with threads
+        :param cache:  keep the compact frame in the best columnar backend, keyed by the CSV's path, size and mtime
+        """
         if folder_path is None:
             csv_folder = self.data_csv_folder
         else:
@@ -72,21 +186,516 @@ class Storage(object):
                 csv_path = os.path.join(csv_folder, csv_name)
             else:
                 csv_path = os.path.join(csv_folder, f'{csv_name}.csv')
-        data_frame = pd.read_csv(os.path.abspath(csv_path), encoding=self.encoding_type)
+        if compact:
+            read_csv_compact = self.memoize(self.read_csv_compact, file_arguments=['csv_path']) if cache else self.read_csv_compact
+            data_frame = read_csv_compact(os.path.abspath(csv_path), chunk_size=chunk_size, engine=engine)
+            if verbose:
+                memory_df = self.get_memory_report(data_frame)
+                print('Loaded {:,} rows of {} in {:,.1f} MB'.format(data_frame.shape[0], os.path.abspath(csv_path),
+                                                                   memory_df.memory_bytes.sum() / 2**20))
+        else:
+            data_frame = pd.read_csv(os.path.abspath(csv_path), encoding=self.encoding_type)
         
         return(data_frame)
 
+    def read_csv_compact(self, csv_path, chunk_size=100_000, engine=None, max_category_ratio=0.5):
+        """
+        Read a CSV a chunk at a time, with repeated strings (like block_name) as categoricals and
+        integers (like row_number and column_number) downcast to the smallest type that holds them.
+        Each chunk is compacted as it arrives and the columns are joined one at a time, so the
+        peak memory is about the compact frame plus one chunk and one column. The pyarrow
+        engine reads the whole file at once, so its peak is the whole parsed frame.
+        
+        :param max_category_ratio:  make an object column categorical if at most this fraction of
+                                    the first chunk's values are distinct
+        """
+        if (engine == 'pyarrow') and (feather is None):
+            engine = None
+        
+        # Infer the categorical columns from the first chunk
+        sample_df = pd.read_csv(csv_path, nrows=chunk_size, encoding=self.encoding_type, engine=engine)
+        dtype_dict = {}
+        for column_name in sample_df.columns:
+            if (sample_df[column_name].dtype == object) or pd.api.types.is_string_dtype(sample_df[column_name]):
+                if sample_df[column_name].nunique() <= max_category_ratio * max(len(sample_df), 1):
+                    dtype_dict[column_name] = 'category'
+        if len(sample_df) < chunk_size:
+            chunks_iterator = iter([sample_df.astype(dtype_dict)])
+        elif engine == 'pyarrow':
+            
+            # The pyarrow engine can't read in chunks, but reads the whole file with several threads
+            chunks_iterator = iter([pd.read_csv(csv_path, encoding=self.encoding_type, engine=engine, dtype=dtype_dict)])
+        else:
+            chunks_iterator = pd.read_csv(csv_path, chunksize=chunk_size, encoding=self.encoding_type,
+                                          engine=engine, dtype=dtype_dict)
+        del sample_df
+        
+        # Each chunk has its own categories, so map its codes onto the categories seen so far
+        columns_dict = {}
+        codes_dicts_dict = {column_name: {} for column_name in dtype_dict}
+        for chunk_df in chunks_iterator:
+            for column_name in chunk_df.columns:
+                column_series = chunk_df[column_name]
+                if column_name in codes_dicts_dict:
+                    codes_dict = codes_dicts_dict[column_name]
+                    
+                    # The extra -1 keeps missing values missing
+                    codes_array = np.array([codes_dict.setdefault(category, len(codes_dict))
+                                            for category in column_series.cat.categories] + [-1], dtype=np.int64)
+                    column_series = codes_array[column_series.cat.codes.to_numpy()]
+                    column_series = pd.Series(column_series.astype(np.min_scalar_type(-len(codes_dict))))
+                elif pd.api.types.is_integer_dtype(column_series):
+                    column_series = pd.to_numeric(column_series, downcast='integer')
+                columns_dict.setdefault(column_name, []).append(column_series.reset_index(drop=True))
+            del chunk_df, column_series
+        
+        # Join the chunks of one column at a time, freeing them as they go
+        for column_name in list(columns_dict):
+            chunks_list = columns_dict.pop(column_name)
+            column_series = pd.concat(chunks_list, ignore_index=True) if len(chunks_list) > 1 else chunks_list[0]
+            del chunks_list
+            if column_name in codes_dicts_dict:
+                categories_list = list(codes_dicts_dict[column_name])
+                codes_array = column_series.to_numpy().astype(np.min_scalar_type(-len(categories_list)))
+                column_series = pd.Categorical.from_codes(codes_array, categories=categories_list)
+            elif pd.api.types.is_integer_dtype(column_series):
+                column_series = pd.to_numeric(column_series, downcast='integer')
+            columns_dict[column_name] = column_series
+        data_frame = pd.DataFrame(columns_dict, copy=False)
+        
+        return(data_frame)
+
+    def get_memory_report(self, data_frame):
+        """Return each column's dtype and its deep memory usage in bytes, largest first."""
+        memory_series = data_frame.memory_usage(index=False, deep=True)
+        memory_df = pd.DataFrame({'column_name': memory_series.index, 'dtype': data_frame.dtypes.astype(str).values,
+                                  'memory_bytes': memory_series.values})
+        
+        return memory_df.sort_values('memory_bytes', ascending=False).reset_index(drop=True)
+
     def pickle_exists(self, pickle_name):
-        pickle_path = os.path.join(self.saves_pickle_folder, '{}.pkl'.format(pickle_name))
         
-        return os.path.isfile(pickle_path)
+        # store_objects picks the format by type, so any stored format counts
+        return self.object_exists(pickle_name)
+
+    def object_exists(self, obj_name):
+        
+        return self.get_existing_format(obj_name) is not None
+
+    def get_object_path(self, obj_name, object_format='pkl'):
+        folder_name, extension = BACKENDS_DICT[object_format][:2]
+        
+        return os.path.join(self.saves_folder, folder_name, '{}.{}'.format(obj_name, extension))
+
+    def find_object_format(self, obj_name, manifest_dict=None):
+        """
+        Return the format the manifest records the object in, without touching the object's
+        file: a file deleted by hand is only noticed when reading it fails, and one copied
+        in by hand is only found after rebuild_manifest.
+        """
+        if manifest_dict is None:
+            manifest_dict = self.get_manifest()
+        entry = manifest_dict.get(obj_name)
+        
+        return None if entry is None else entry['format']
+
+    def get_existing_format(self, obj_name):
+        object_format = self.find_object_format(obj_name)
+        if (object_format is not None) and not os.path.isfile(self.get_object_path(obj_name, object_format)):
+            object_format = self.forget_missing_object(obj_name)
+        
+        return object_format
+
+    def forget_missing_object(self, obj_name):
+        """
+        Drop a manifest entry whose file is gone, for instance deleted by hand to have it
+        recomputed, and return the format of any copy left in the saves folders by code
+        that doesn't keep the manifest, which is indexed in its place.
+        """
+        for object_format in BACKENDS_DICT:
+            object_path = self.get_object_path(obj_name, object_format)
+            if os.path.isfile(object_path):
+                file_stat = os.stat(object_path)
+                self.update_manifest({obj_name: {'format': object_format, 'size': file_stat.st_size,
+                                                 'mtime': file_stat.st_mtime, 'sha1': None}})
+                
+                return object_format
+        self.update_manifest({obj_name: None})
+
+    def get_object_format(self, obj):
+        if isinstance(obj, np.ndarray) and not obj.dtype.hasobject:
+            object_format = 'npy'
+        elif isinstance(obj, pd.DataFrame) and (feather is not None):
+            object_format = self.dataframe_format
+        else:
+            object_format = 'pkl'
+        
+        return object_format
+
+    def npy_exists(self, npy_name):
+        
+        return self.get_existing_format(npy_name) == 'npy'
+
+    def get_manifest(self):
+        """
+        Return the {obj_name: {'format', 'size', 'mtime', 'sha1'}} index of stored objects,
+        building manifest.json from the saves folders the first time it is missing.
+        """
+        try:
+            file_stat = os.stat(self.manifest_path)
+        except OSError:
+            self.rebuild_manifest()
+            
+            return self.manifest_dict
+        
+        # Atomic replacement gives the manifest a new inode on every update
+        manifest_signature = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+        if manifest_signature != self.manifest_signature:
+            with open(self.manifest_path, 'r', encoding='utf-8') as handle:
+                self.manifest_dict = json.load(handle)
+            self.manifest_signature = manifest_signature
+        
+        return self.manifest_dict
+
+    def get_manifest_entry(self, obj_name, object_format):
+        object_path = self.get_object_path(obj_name, object_format)
+        file_stat = os.stat(object_path)
+        file_hash = hashlib.sha1()
+        with open(object_path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(1 << 20), b''):
+                file_hash.update(chunk)
+        
+        return {'format': object_format, 'size': file_stat.st_size, 'mtime': file_stat.st_mtime,
+                'sha1': file_hash.hexdigest()}
+
+    def rebuild_manifest(self, hash_files=False):
+        """Index every object in the saves folders, for instance after files were deleted by hand."""
+        manifest_dict = {}
+        for object_format in reversed(list(BACKENDS_DICT)):
+            object_folder = os.path.dirname(self.get_object_path('', object_format))
+            suffix = '.{}'.format(BACKENDS_DICT[object_format][1])
+            if not os.path.isdir(object_folder):
+                continue
+            for file_name in os.listdir(object_folder):
+                if file_name.endswith(suffix):
+                    obj_name = file_name[:-len(suffix)]
+                    if hash_files:
+                        manifest_dict[obj_name] = self.get_manifest_entry(obj_name, object_format)
+                    else:
+                        file_stat = os.stat(os.path.join(object_folder, file_name))
+                        manifest_dict[obj_name] = {'format': object_format, 'size': file_stat.st_size,
+                                                   'mtime': file_stat.st_mtime, 'sha1': None}
+        self.update_manifest(manifest_dict, replace=True)
+
+    def update_manifest(self, entries_dict, replace=False):
+        """Merge {obj_name: entry} into the manifest, where an entry of None removes the name."""
+        with self.lock_file(self.manifest_path):
+            manifest_dict = {}
+            if not replace:
+                try:
+                    with open(self.manifest_path, 'r', encoding='utf-8') as handle:
+                        manifest_dict = json.load(handle)
+                except (OSError, ValueError):
+                    pass
+            for obj_name, entry in entries_dict.items():
+                if entry is None:
+                    manifest_dict.pop(obj_name, None)
+                else:
+                    manifest_dict[obj_name] = entry
+            def write_manifest(temp_path):
+                with open(temp_path, 'w', encoding='utf-8') as handle:
+                    json.dump(manifest_dict, handle, indent=1, sort_keys=True)
+            
+            # Already holding the manifest's lock
+            self.write_atomically(self.manifest_path, write_manifest, lock=False)
+            file_stat = os.stat(self.manifest_path)
+            self.manifest_dict = manifest_dict
+            self.manifest_signature = (file_stat.st_ino, file_stat.st_mtime_ns, file_stat.st_size)
+
+    def load_array(self, array_name, mmap_mode='r', verbose=False):
+        npy_path = os.path.join(self.saves_npy_folder, '{}.npy'.format(array_name))
+        if verbose:
+            print('Loading {}'.format(os.path.abspath(npy_path)))
+        
+        # Memory-map the array rather than reading it all in
+        array = np.load(npy_path, mmap_mode=mmap_mode)
+        
+        return(array)
+
+    def store_arrays(self, verbose=True, **kwargs):
+        for array_name in kwargs:
+            npy_path = os.path.join(self.saves_npy_folder, '{}.npy'.format(array_name))
+            if verbose:
+                print('Saving to {}'.format(os.path.abspath(npy_path)))
+            self.write_atomically(npy_path, self.get_npy_writer(np.asarray(kwargs[array_name])))
+        self.update_manifest({array_name: self.get_manifest_entry(array_name, 'npy') for array_name in kwargs})
+
+    @contextlib.contextmanager
+    def lock_file(self, file_path):
+        """Hold an exclusive lock on a file path, across threads and processes, with flock
+        on POSIX and msvcrt.locking on Windows."""
+        if (fcntl is None) and (msvcrt is None):
+            raise RuntimeError('Neither fcntl nor msvcrt is available to lock {}'.format(file_path))
+        lock_path = os.path.join(self.saves_lock_folder, '{}.lock'.format(os.path.basename(file_path)))
+        with open(lock_path, 'a+') as lock_handle:
+            if fcntl is not None:
+                fcntl.flock(lock_handle, fcntl.LOCK_EX)
+            else:
+                
+                # msvcrt locks bytes from the current position, and its blocking mode gives up after 10 seconds
+                lock_handle.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(lock_handle.fileno(), msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(self.read_retry_seconds)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_handle, fcntl.LOCK_UN)
+                else:
+                    lock_handle.seek(0)
+                    msvcrt.locking(lock_handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def replace_file(self, temp_path, file_path):
+        """Rename temp_path over file_path, retrying while Windows refuses because
+        a reader still has the old file open or memory-mapped."""
+        for attempt_number in range(self.read_attempts):
+            try:
+                os.replace(temp_path, file_path)
+                
+                return
+            except PermissionError:
+                if attempt_number == self.read_attempts - 1:
+                    raise PermissionError('{} is still open or memory-mapped elsewhere, so it '
+                                          "can't be replaced; close it and store again".format(file_path))
+                time.sleep(self.read_retry_seconds * 2**attempt_number)
+
+    def write_atomically(self, file_path, write_function, lock=True):
+        """Write to a temporary file beside file_path under its lock, then rename
+        it into place, so that readers never see a partly written file."""
+        temp_path = '{}.{}.{}.tmp'.format(file_path, os.getpid(), threading.get_ident())
+        with (self.lock_file(file_path) if lock else contextlib.nullcontext()):
+            try:
+                write_function(temp_path)
+                self.replace_file(temp_path, file_path)
+            except:
+                if os.path.isfile(temp_path):
+                    os.remove(temp_path)
+                raise
+
+    def get_npy_writer(self, array):
+        def write_npy(temp_path):
+            
+            # Save through a handle, since np.save appends .npy to paths that don't end in it
+            with open(temp_path, 'wb') as handle:
+                np.save(handle, array, allow_pickle=False)
+        
+        return write_npy
+
+    def get_pickle_writer(self, obj, protocol=None):
+        def write_pickle(temp_path):
+            with open(temp_path, 'wb') as handle:
+                pickle.dump(obj, handle, protocol)
+        
+        return write_pickle
+
+    def memoize(self, function=None, file_arguments=None, hash_files=False, max_bytes=None, max_entries=None,
+                verbose=False):
+        """
+        Decorate a function so that its result is stored under a key derived from
+        the function, its argument values and the files or folders named by its file
+        arguments, and loaded from there on the next call with the same inputs.
+        
+        :param file_arguments:  names of the arguments that are file or folder paths, to be keyed
+                                by the modification times and sizes of the files they name
+        :param hash_files:  key those files by their contents instead, and any other argument
+                            that names a file (but never a folder) by its contents too
+        :param max_bytes:  evict the least recently used memoized results over this total size
+        :param max_entries:  evict the least recently used memoized results over this count
+        
+        >>> @s.memoize(file_arguments=['file_path'])
+        ... def get_file_names_dataframe(file_path):
+        >>> @s.memoize(max_bytes=100_000_000)
+        ... def get_label_grid(img_array, rgb_dict):
+        """
+        file_arguments_set = set(file_arguments or [])
+        def decorator(function):
+            signature = inspect.signature(function)
+            
+            # Lambdas are named <lambda> and partials have no name, neither of which makes a Windows file name
+            function_name = re.sub(r'\W', '_', getattr(function, '__name__', type(function).__name__))
+            stats_dict = self.memo_stats_dict.setdefault(getattr(function, '__qualname__', function_name),
+                                                         {'hits': 0, 'misses': 0})
+            
+            @functools.wraps(function)
+            def memoized_function(*args, **kwargs):
+                bound_arguments = signature.bind(*args, **kwargs)
+                bound_arguments.apply_defaults()
+                
+                # The instance is not part of the key, only the arguments are
+                arguments_dict = {argument_name: value for argument_name, value in bound_arguments.arguments.items()
+                                  if argument_name not in ['self', 'cls']}
+                memo_key = self.get_memo_key(function, arguments_dict, file_arguments_set, hash_files=hash_files)
+                memo_name = 'memo_{}_{}'.format(function_name, memo_key[:16])
+                object_format = self.find_object_format(memo_name)
+                if object_format is not None:
+                    
+                    # Touch the file to record the use for least-recently-used eviction
+                    try:
+                        os.utime(self.get_object_path(memo_name, object_format))
+                    except FileNotFoundError:
+                        object_format = self.forget_missing_object(memo_name)
+                if object_format is not None:
+                    stats_dict['hits'] += 1
+                    
+                    return self.load_stored_object(memo_name, object_format)
+                stats_dict['misses'] += 1
+                result = function(*args, **kwargs)
+                self.store_objects(verbose=verbose, **{memo_name: result})
+                if (max_bytes is not None) or (max_entries is not None):
+                    self.evict_memos(max_bytes=max_bytes, max_entries=max_entries, verbose=verbose)
+                
+                return result
+            memoized_function.memo_stats_dict = stats_dict
+            
+            return memoized_function
+        if function is None:
+            
+            return decorator
+        
+        return decorator(function)
+
+    def get_memo_key(self, function, arguments_dict, file_arguments_set=frozenset(), hash_files=False):
+        key_hash = hashlib.sha1('{}.{}'.format(getattr(function, '__module__', None),
+                                               getattr(function, '__qualname__', type(function).__qualname__)).encode())
+        
+        # Editing the function's body, constants or defaults, or a helper it calls, invalidates its stored results
+        key_hash.update(self.get_function_digest(function))
+        for argument_name, value in sorted(arguments_dict.items()):
+            key_hash.update(argument_name.encode())
+            key_hash.update(self.get_value_digest(value, is_file=(argument_name in file_arguments_set),
+                                                  hash_files=hash_files))
+        
+        return key_hash.hexdigest()
+
+    def get_function_digest(self, function, visited_set=None):
+        """Hash a function's bytecode, constants and defaults, and those of the functions of
+        the same module that it refers to by global name."""
+        if visited_set is None:
+            visited_set = set()
+        function_hash = hashlib.sha1()
+        
+        # A partial is its function with some arguments filled in
+        if isinstance(function, functools.partial):
+            function_hash.update(self.get_function_digest(function.func, visited_set))
+            for value in function.args:
+                function_hash.update(self.get_value_digest(value))
+            for argument_name, value in sorted(function.keywords.items()):
+                function_hash.update(argument_name.encode())
+                function_hash.update(self.get_value_digest(value))
+            
+            return function_hash.digest()
+        function = getattr(function, '__func__', function)
+        code = getattr(function, '__code__', None)
+        if (code is None) or (code in visited_set):
+            
+            return function_hash.digest()
+        visited_set.add(code)
+        function_hash.update(self.get_code_digest(code))
+        function_hash.update(repr(getattr(function, '__defaults__', None)).encode())
+        function_hash.update(repr(sorted((getattr(function, '__kwdefaults__', None) or {}).items())).encode())
+        globals_dict = getattr(function, '__globals__', {})
+        for name in code.co_names:
+            helper = globals_dict.get(name)
+            if inspect.isfunction(helper) and (helper.__module__ == function.__module__):
+                function_hash.update(self.get_function_digest(helper, visited_set))
+        
+        return function_hash.digest()
+
+    def get_code_digest(self, code):
+        code_hash = hashlib.sha1(code.co_code)
+        for constant in code.co_consts:
+            
+            # Nested functions and comprehensions have their own code, whose repr holds an address
+            if inspect.iscode(constant):
+                code_hash.update(self.get_code_digest(constant))
+            elif isinstance(constant, frozenset):
+                code_hash.update(repr(sorted(map(repr, constant))).encode())
+            else:
+                code_hash.update(repr(constant).encode())
+        code_hash.update(repr(code.co_names).encode())
+        
+        return code_hash.digest()
+
+    def get_value_digest(self, value, is_file=False, hash_files=False):
+        value_hash = hashlib.sha1()
+        if isinstance(value, np.ndarray):
+            value_hash.update('{}{}'.format(value.dtype, value.shape).encode())
+            value_hash.update(np.ascontiguousarray(value).tobytes())
+        elif isinstance(value, (pd.DataFrame, pd.Series)):
+            value_hash.update(repr(value.dtypes.to_dict() if isinstance(value, pd.DataFrame) else (value.name, value.dtype)).encode())
+            value_hash.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+        else:
+            try:
+                value_hash.update(pickle.dumps(value, protocol=4))
+            except:
+                value_hash.update(repr(value).encode())
+            
+            # Key file arguments by what they contain too, but only walk folders that are marked as file arguments
+            if isinstance(value, (str, os.PathLike)) and (is_file or hash_files):
+                if is_file and os.path.isdir(value):
+                    file_paths_list = sorted(os.path.join(root, file_name) for root, _, file_names_list in os.walk(value)
+                                             for file_name in file_names_list)
+                elif os.path.isfile(value):
+                    file_paths_list = [value]
+                else:
+                    file_paths_list = []
+                for file_path in file_paths_list:
+                    value_hash.update(os.fspath(file_path).encode())
+                    if hash_files:
+                        with open(file_path, 'rb') as handle:
+                            for chunk in iter(lambda: handle.read(1 << 20), b''):
+                                value_hash.update(chunk)
+                    else:
+                        file_stat = os.stat(file_path)
+                        value_hash.update('{}:{}'.format(file_stat.st_mtime_ns, file_stat.st_size).encode())
+        
+        return value_hash.digest()
+
+    def evict_memos(self, max_bytes=None, max_entries=None, verbose=False):
+        """Remove the least recently used memoized results until both limits are met."""
+        memo_paths_list = []
+        for object_format in BACKENDS_DICT:
+            memo_paths_list += glob.glob(self.get_object_path('memo_*', object_format))
+        memo_paths_list.sort(key=os.path.getmtime, reverse=True)
+        total_bytes = 0
+        evicted_dict = {}
+        for entry_number, memo_path in enumerate(memo_paths_list, 1):
+            total_bytes += os.path.getsize(memo_path)
+            if ((max_bytes is not None) and (total_bytes > max_bytes)) or ((max_entries is not None) and (entry_number > max_entries)):
+                if verbose:
+                    print('Evicting {}'.format(os.path.abspath(memo_path)))
+                try:
+                    os.remove(memo_path)
+                    evicted_dict[os.path.splitext(os.path.basename(memo_path))[0]] = None
+                
+                # Another process got to it first
+                except OSError:
+                    pass
+        if evicted_dict:
+            self.update_manifest(evicted_dict)
+        
+        return len(evicted_dict)
 
     def load_dataframes(self, **kwargs):
-        frame_dict = {}
+        
+        # Load everything already stored in one pass, and only then look for CSVs
+        frame_dict = self.load_many(list(kwargs))
         for frame_name in kwargs:
-            pickle_path = os.path.join(self.saves_pickle_folder, '{}.pkl'.format(frame_name))
-            print('Attempting to load {}.'.format(os.path.abspath(pickle_path)))
-            if not os.path.isfile(pickle_path):
+            if frame_dict[frame_name] is None:
                 csv_name = '{}.csv'.format(frame_name)
                 csv_path = os.path.join(self.saves_csv_folder, csv_name)
                 print('No pickle exists - attempting to load {}.'.format(os.path.abspath(csv_path)))
@@ -100,13 +709,65 @@ class Storage(object):
                         frame_dict[frame_name] = self.load_csv(csv_name=frame_name)
                 else:
                     frame_dict[frame_name] = self.load_csv(csv_name=frame_name, folder_path=self.saves_folder)
-            else:
-                frame_dict[frame_name] = self.load_object(frame_name)
         
         return frame_dict
 
-    def load_object(self, obj_name, pickle_path=None, download_url=None, verbose=True):
+    def load_many(self, obj_names_list, max_workers=None, mmap_mode=None, verbose=False):
+        """
+        Resolve every name against one read of the manifest, then read the stored objects,
+        in a thread pool unless max_workers is 1.
+        
+        :return: a {obj_name: object} dictionary, with None for names that aren't stored
+        """
+        manifest_dict = self.get_manifest()
+        formats_dict = {obj_name: self.find_object_format(obj_name, manifest_dict) for obj_name in obj_names_list}
+        stored_names_list = [obj_name for obj_name in obj_names_list if formats_dict[obj_name] is not None]
+        if verbose:
+            print('Loading {} of {} objects'.format(len(stored_names_list), len(obj_names_list)))
+        def load_stored_object(obj_name):
+            try:
+                
+                return self.load_stored_object(obj_name, formats_dict[obj_name], mmap_mode=mmap_mode)
+            
+            # The file is gone and no other copy is left
+            except FileNotFoundError:
+                
+                return None
+        if (max_workers == 1) or (len(stored_names_list) < 2):
+            objects_list = [load_stored_object(obj_name) for obj_name in stored_names_list]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                objects_list = list(executor.map(load_stored_object, stored_names_list))
+        objects_dict = {obj_name: None for obj_name in obj_names_list}
+        objects_dict.update(zip(stored_names_list, objects_list))
+        
+        return objects_dict
+
+    def store_many(self, objects_dict, max_workers=None, verbose=False):
+        """Store many objects, in a thread pool unless max_workers is 1, updating the manifest once."""
+        if (max_workers == 1) or (len(objects_dict) < 2):
+            entries_list = [self.store_object(obj_name, obj, verbose=verbose) for obj_name, obj in objects_dict.items()]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                entries_list = list(executor.map(lambda item: self.store_object(*item, verbose=verbose),
+                                                 objects_dict.items()))
+        self.update_manifest(dict(zip(objects_dict, entries_list)))
+
+    def load_object(self, obj_name, pickle_path=None, download_url=None, verbose=True, mmap_mode=None):
+        """
+        :param mmap_mode:  None to read .npy files and out-of-band pickle buffers into writable
+                           memory, or 'r' to return read-only views on the memory-mapped files
+        """
         if pickle_path is None:
+            object_format = self.find_object_format(obj_name)
+            if object_format is not None:
+                try:
+                    
+                    return self.load_stored_object(obj_name, object_format, mmap_mode=mmap_mode)
+                
+                # The file is gone and no other copy is left, so fall back to the csv or the URL
+                except FileNotFoundError:
+                    pass
             pickle_path = os.path.join(self.saves_pickle_folder, '{}.pkl'.format(obj_name))
         if not os.path.isfile(pickle_path):
             if verbose:
@@ -123,51 +784,273 @@ class Storage(object):
             if isinstance(object, pd.DataFrame):
                 self.attempt_to_pickle(object, pickle_path, raise_exception=False)
             else:
-                with open(pickle_path, 'wb') as handle:
                 
-                    # Protocol 4 is not handled in python 2
-                    if sys.version_info.major == 2:
-                        pickle.dump(object, handle, 2)
-                    elif sys.version_info.major == 3:
-                        pickle.dump(object, handle, pickle.HIGHEST_PROTOCOL)
+                # Protocol 4 is not handled in python 2
+                if sys.version_info.major == 2:
+                    self.write_atomically(pickle_path, self.get_pickle_writer(object, 2))
+                elif sys.version_info.major == 3:
+                    self.write_atomically(pickle_path, self.get_pickle_writer(object, pickle.HIGHEST_PROTOCOL))
         else:
+            object = self.read_with_retries(pickle_path, 'pkl')
+        
+        return(object)
+
+    def load_stored_object(self, obj_name, object_format, mmap_mode=None):
+        try:
+            
+            return self.read_with_retries(self.get_object_path(obj_name, object_format), object_format,
+                                          mmap_mode=mmap_mode)
+        
+        # Only now that the manifest has proven stale, look for the file on disk
+        except FileNotFoundError:
+            object_format = self.forget_missing_object(obj_name)
+            if object_format is None:
+                raise
+        
+        return self.read_with_retries(self.get_object_path(obj_name, object_format), object_format, mmap_mode=mmap_mode)
+
+    def read_with_retries(self, object_path, object_format, mmap_mode=None):
+        """Read a stored object, backing off and retrying if the file is missing or
+        truncated because another writer (one without atomic writes) is mid-write."""
+        for attempt_number in range(self.read_attempts):
             try:
-                object = pd.read_pickle(pickle_path)
-            except:
-                with open(pickle_path, 'rb') as handle:
-                    object = pickle.load(handle)
+                
+                return self.read_object_file(object_path, object_format, mmap_mode=mmap_mode)
+            except (EOFError, OSError, ValueError, pickle.UnpicklingError, struct.error):
+                if attempt_number == self.read_attempts - 1:
+                    raise
+                time.sleep(self.read_retry_seconds * 2**attempt_number)
+
+    def read_object_file(self, object_path, object_format, mmap_mode=None):
+        
+        return BACKENDS_DICT[object_format][2](self, object_path, mmap_mode)
+
+    def read_pickle_file(self, pickle_path):
+        try:
+            object = pd.read_pickle(pickle_path)
+        except:
+            with open(pickle_path, 'rb') as handle:
+                object = pickle.load(handle)
+        
+        return(object)
+
+    def load_pkl5(self, pkl5_path, mmap_mode=None):
+        with open(pkl5_path, 'rb') as handle:
+            if mmap_mode is None:
+                
+                # Read into a bytearray so that the arrays are writable
+                file_view = memoryview(bytearray(os.fstat(handle.fileno()).st_size))
+                handle.readinto(file_view)
+            else:
+                file_view = memoryview(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, buffer_count, pickle_length = struct.unpack_from(PKL5_HEADER_FORMAT, file_view)
+        if magic != PKL5_MAGIC:
+            raise ValueError('{} is not a pkl5 file'.format(pkl5_path))
+        offset = struct.calcsize(PKL5_HEADER_FORMAT)
+        buffers_list = []
+        for buffer_offset, buffer_length in struct.iter_unpack('<QQ', file_view[offset:offset + 16*buffer_count]):
+            buffers_list.append(file_view[buffer_offset:buffer_offset + buffer_length])
+        offset += 16*buffer_count
+        
+        # The arrays in the object become views on the file's buffers
+        object = pickle.loads(file_view[offset:offset + pickle_length], buffers=buffers_list)
         
         return(object)
 
+    def store_pkl5(self, obj, pkl5_path):
+        """Pickle with protocol 5, writing each large buffer out of band so that it
+        can be memory-mapped on load. Return False if there were no such buffers."""
+        buffers_list = []
+        pickle_bytes = pickle.dumps(obj, protocol=5, buffer_callback=buffers_list.append)
+        if not buffers_list:
+            
+            return False
+        buffers_list = [buffer.raw() for buffer in buffers_list]
+        offset = struct.calcsize(PKL5_HEADER_FORMAT) + 16*len(buffers_list) + len(pickle_bytes)
+        offsets_list = []
+        for buffer in buffers_list:
+            offset += -offset % PKL5_ALIGNMENT
+            offsets_list.append(offset)
+            offset += buffer.nbytes
+        def write_pkl5(temp_path):
+            with open(temp_path, 'wb') as handle:
+                handle.write(struct.pack(PKL5_HEADER_FORMAT, PKL5_MAGIC, len(buffers_list), len(pickle_bytes)))
+                for buffer_offset, buffer in zip(offsets_list, buffers_list):
+                    handle.write(struct.pack('<QQ', buffer_offset, buffer.nbytes))
+                handle.write(pickle_bytes)
+                for buffer_offset, buffer in zip(offsets_list, buffers_list):
+                    handle.write(b'\0' * (buffer_offset - handle.tell()))
+                    handle.write(buffer)
+        self.write_atomically(pkl5_path, write_pkl5)
+        
+        return True
+
+    def get_codec(self, pickle_size):
+        codec = None
+        for threshold_bytes, codecs_list in self.compression_thresholds_list:
+            if pickle_size >= threshold_bytes:
+                codec = next((codec for codec in codecs_list if codec in CODECS_DICT), None)
+        
+        return codec
+
+    def load_pklz(self, pklz_path):
+        with open(pklz_path, 'rb') as handle:
+            magic, codec = struct.unpack(PKLZ_HEADER_FORMAT, handle.read(struct.calcsize(PKLZ_HEADER_FORMAT)))
+            if magic != PKLZ_MAGIC:
+                raise ValueError('{} is not a pklz file'.format(pklz_path))
+            codec = codec.rstrip(b'\0').decode()
+            if codec not in CODECS_DICT:
+                raise RuntimeError('{} is compressed with {}, which is not installed'.format(pklz_path, codec))
+            
+            # Unpickle straight from the decompressing stream
+            with CODECS_DICT[codec][1](handle) as stream:
+                object = pickle.load(stream)
+        
+        return(object)
+
+    def store_pklz(self, pickle_bytes, codec, pklz_path):
+        def write_pklz(temp_path):
+            with open(temp_path, 'wb') as handle:
+                handle.write(struct.pack(PKLZ_HEADER_FORMAT, PKLZ_MAGIC, codec.encode()))
+                with CODECS_DICT[codec][0](handle) as stream:
+                    stream.write(pickle_bytes)
+        self.write_atomically(pklz_path, write_pklz)
+
+    def benchmark_codecs(self, obj_names_list=None, repeats=3, verbose=False):
+        """
+        Compare the size and the load latency of the stored pickles under each installed codec.
+        The compressed copies are kept in memory, so load_seconds is decompressing and unpickling.
+        
+        :return: a DataFrame with one row per pickle and codec ('none' for uncompressed)
+        """
+        if obj_names_list is None:
+            obj_names_list = sorted(os.path.splitext(file_name)[0] for file_name in os.listdir(self.saves_pickle_folder)
+                                    if file_name.endswith('.pkl'))
+        rows_list = []
+        for obj_name in obj_names_list:
+            with open(self.get_object_path(obj_name, 'pkl'), 'rb') as handle:
+                pickle_bytes = handle.read()
+            for codec in ['none'] + list(CODECS_DICT):
+                start_time = time.perf_counter()
+                if codec == 'none':
+                    stored_bytes = pickle_bytes
+                else:
+                    bytes_io = io.BytesIO()
+                    with CODECS_DICT[codec][0](bytes_io) as stream:
+                        stream.write(pickle_bytes)
+                    stored_bytes = bytes_io.getvalue()
+                compress_seconds = time.perf_counter() - start_time
+                load_seconds_list = []
+                try:
+                    for _ in range(repeats):
+                        start_time = time.perf_counter()
+                        if codec == 'none':
+                            pickle.loads(stored_bytes)
+                        else:
+                            with CODECS_DICT[codec][1](io.BytesIO(stored_bytes)) as stream:
+                                pickle.load(stream)
+                        load_seconds_list.append(time.perf_counter() - start_time)
+                except Exception as e:
+                    if verbose:
+                        print(e, ': Skipping {}.'.format(obj_name))
+                    break
+                rows_list.append({'obj_name': obj_name, 'codec': codec, 'stored_bytes': len(stored_bytes),
+                                  'compression_ratio': len(pickle_bytes) / max(len(stored_bytes), 1),
+                                  'compress_seconds': compress_seconds, 'load_seconds': min(load_seconds_list)})
+        
+        return pd.DataFrame(rows_list)
+
     def save_dataframes(self, include_index=False, verbose=True, **kwargs):
         for frame_name in kwargs:
             if isinstance(kwargs[frame_name], pd.DataFrame):
                 csv_path = os.path.join(self.saves_csv_folder, '{}.csv'.format(frame_name))
                 if verbose:
                     print('Saving to {}'.format(os.path.abspath(csv_path)))
-                kwargs[frame_name].to_csv(csv_path, sep=',', encoding=self.encoding_type,
-                                          index=include_index)
+                self.write_atomically(csv_path, lambda temp_path: kwargs[frame_name].to_csv(
+                    temp_path, sep=',', encoding=self.encoding_type, index=include_index))
 
     # Classes, functions, and methods cannot be pickled
     def store_objects(self, verbose=True, **kwargs):
+        entries_dict = {}
         for obj_name in kwargs:
-            if hasattr(kwargs[obj_name], '__call__'):
-                raise RuntimeError('Functions cannot be pickled.')
-            pickle_path = os.path.join(self.saves_pickle_folder, '{}.pkl'.format(obj_name))
-            if isinstance(kwargs[obj_name], pd.DataFrame):
-                self.attempt_to_pickle(kwargs[obj_name], pickle_path, raise_exception=False, verbose=verbose)
-            else:
+            entries_dict[obj_name] = self.store_object(obj_name, kwargs[obj_name], verbose=verbose)
+        self.update_manifest(entries_dict)
+
+    def store_object(self, obj_name, obj, verbose=True):
+        """Store one object in the format chosen for its type, and return its manifest entry."""
+        if hasattr(obj, '__call__'):
+            raise RuntimeError('Functions cannot be pickled.')
+        object_format = self.get_object_format(obj)
+        object_path = self.get_object_path(obj_name, object_format)
+        if verbose and (object_format != 'pkl'):
+            print('Saving to {}'.format(os.path.abspath(object_path)))
+        write_function = BACKENDS_DICT[object_format][3]
+        if write_function is not None:
+            try:
+                self.write_atomically(object_path, lambda temp_path: write_function(self, obj, temp_path))
+            
+            # Fall back to pickle, for instance for frames pyarrow can't write, like those with non-string column names
+            except Exception as e:
+                if verbose:
+                    print(e, ': Pickling instead.')
+                object_format = 'pkl'
+        if object_format == 'pkl':
+            object_format = self.pickle_object(obj, obj_name, verbose=verbose)
+        
+        # Remove any copy stored in another format, so it can't shadow this one
+        for stale_format in BACKENDS_DICT:
+            stale_path = self.get_object_path(obj_name, stale_format)
+            if (stale_format != object_format) and os.path.isfile(stale_path):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+        try:
+            
+            return self.get_manifest_entry(obj_name, object_format)
+        
+        # attempt_to_pickle couldn't save it
+        except OSError:
+            
+            return None
+
+    def pickle_object(self, obj, obj_name, verbose=True):
+        pickle_path = self.get_object_path(obj_name, 'pkl')
+        
+        # DataFrames stay in-band, since callers expect to be able to modify them in place
+        if (not isinstance(obj, pd.DataFrame)) and (sys.version_info.major == 3) and (pickle.HIGHEST_PROTOCOL >= 5):
+            if self.store_pkl5(obj, self.get_object_path(obj_name, 'pkl5')):
+                if verbose:
+                    print('Pickling to {}'.format(os.path.abspath(self.get_object_path(obj_name, 'pkl5'))))
+                
+                return 'pkl5'
+        
+        # Compress pickles big enough to be worth it
+        if (sys.version_info.major == 3) and self.compression_thresholds_list:
+            pickle_bytes = pickle.dumps(obj, min(4, pickle.HIGHEST_PROTOCOL))
+            codec = self.get_codec(len(pickle_bytes))
+            if codec is not None:
+                pklz_path = self.get_object_path(obj_name, 'pklz')
                 if verbose:
-                    print('Pickling to {}'.format(os.path.abspath(pickle_path)))
-                with open(pickle_path, 'wb') as handle:
+                    print('Pickling to {} with {}'.format(os.path.abspath(pklz_path), codec))
+                self.store_pklz(pickle_bytes, codec, pklz_path)
                 
-                    # Protocol 4 is not handled in python 2
-                    if sys.version_info.major == 2:
-                        pickle.dump(kwargs[obj_name], handle, 2)
+                return 'pklz'
+        if isinstance(obj, pd.DataFrame):
+            self.attempt_to_pickle(obj, pickle_path, raise_exception=False, verbose=verbose)
+        else:
+            if verbose:
+                print('Pickling to {}'.format(os.path.abspath(pickle_path)))
+            
+            # Protocol 4 is not handled in python 2
+            if sys.version_info.major == 2:
+                self.write_atomically(pickle_path, self.get_pickle_writer(obj, 2))
 
-                    # Pickle protocol must be <= 4
-                    elif sys.version_info.major == 3:
-                        pickle.dump(kwargs[obj_name], handle, min(4, pickle.HIGHEST_PROTOCOL))
+            # Pickle protocol must be <= 4
+            elif sys.version_info.major == 3:
+                self.write_atomically(pickle_path, self.get_pickle_writer(obj, min(4, pickle.HIGHEST_PROTOCOL)))
+        
+        return 'pkl'
 
     def attempt_to_pickle(self, df, pickle_path, raise_exception=False, verbose=True):
         try:
@@ -176,15 +1059,34 @@ class Storage(object):
         
             # Protocol 4 is not handled in python 2
             if sys.version_info.major == 2:
-                df.to_pickle(pickle_path, protocol=2)
+                self.write_atomically(pickle_path, lambda temp_path: df.to_pickle(temp_path, protocol=2))
 
             # Pickle protocol must be <= 4
             elif sys.version_info.major == 3:
-                df.to_pickle(pickle_path, protocol=min(4, pickle.HIGHEST_PROTOCOL))
+                self.write_atomically(pickle_path, lambda temp_path: df.to_pickle(
+                    temp_path, protocol=min(4, pickle.HIGHEST_PROTOCOL)))
         
+        # The temporary file is gone and any earlier pickle is left intact
         except Exception as e:
-            os.remove(pickle_path)
             if verbose:
                 print(e, ": Couldn't save {:,} cells as a pickle.".format(df.shape[0]*df.shape[1]))
             if raise_exception:
-                raise
\ No newline at end of file
+                raise
+
+register_backend('npy', 'npy', 'npy', lambda storage, object_path, mmap_mode: np.load(object_path, mmap_mode=mmap_mode),
+                 lambda storage, obj, temp_path: storage.get_npy_writer(obj)(temp_path))
+register_backend('parquet', 'parquet', 'parquet', lambda storage, object_path, mmap_mode: pd.read_parquet(object_path),
+                 lambda storage, obj, temp_path: obj.to_parquet(temp_path))
+
+# Feather columns are read straight out of the memory-mapped file
+register_backend('feather', 'feather', 'feather',
+                 lambda storage, object_path, mmap_mode: feather.read_table(
+                     object_path, memory_map=(mmap_mode is not None)).to_pandas(),
+                 lambda storage, obj, temp_path: obj.to_feather(temp_path))
+register_backend('pkl5', 'pkl', 'pkl5', lambda storage, object_path, mmap_mode: storage.load_pkl5(object_path, mmap_mode=mmap_mode))
+register_backend('pklz', 'pkl', 'pklz', lambda storage, object_path, mmap_mode: storage.load_pklz(object_path))
+register_backend('pkl', 'pkl', 'pkl', lambda storage, object_path, mmap_mode: storage.read_pickle_file(object_path))
+
+# The pickle/*.pickle layout of storage2.py
+register_backend('pickle', 'pickle', 'pickle', lambda storage, object_path, mmap_mode: storage.read_pickle_file(object_path),
+                 is_legacy=True)
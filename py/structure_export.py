@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# Structure Export for MineCraft pixel art
+# Dave Babbitt <dave.babbitt@gmail.com>
+# Author: Dave Babbitt, Data Scientist
+# coding: utf-8
+
+# Soli Deo gloria
+
+"""
+StructureExporter: Write a quantized build to Sponge .schem, vanilla structure
+.nbt or Litematica .litematic files in one streaming pass
+"""
+from nbt_writer import NbtWriter, TAG_BYTE_ARRAY, TAG_COMPOUND, TAG_INT, TAG_LONG_ARRAY
+import gzip
+import math
+import numpy as np
+import os
+import re
+import time
+
+# The pixelart textures come from the 1.18.1 resource pack
+DATA_VERSION = 2865
+AIR_STATE = 'minecraft:air'
+
+# Textures that no simple rule maps to the block to lay for them
+BLOCK_STATES_DICT = {
+    'piston_side': 'minecraft:piston[facing=north]',
+    'piston_top': 'minecraft:piston[facing=up]',
+    'piston_top_sticky': 'minecraft:sticky_piston[facing=up]',
+    'smooth_stone_slab_side': 'minecraft:smooth_stone_slab[type=double]',
+    }
+
+# Textures that no block shows on top, with the texture their block shows there instead
+SIDE_TEXTURES_DICT = {
+    'bookshelf': 'oak_planks',
+    'chiseled_quartz_block': 'chiseled_quartz_block_top',
+    'chiseled_red_sandstone': 'red_sandstone_top',
+    'chiseled_sandstone': 'sandstone_top',
+    'furnace_front': 'furnace_top',
+    'furnace_side': 'furnace_top',
+    'grass_block_side': 'grass_block_top',
+    'jack_o_lantern': 'pumpkin_top',
+    'melon_side': 'melon_top',
+    'mycelium_side': 'mycelium_top',
+    'podzol_side': 'podzol_top',
+    'pumpkin_side': 'pumpkin_top',
+    'quartz_block_side': 'quartz_block_top',
+    'red_sandstone': 'red_sandstone_top',
+    'sandstone': 'sandstone_top',
+    'smooth_stone_slab_side': 'smooth_stone',
+    }
+
+# Pillar blocks show their side texture on top when laid along the X axis
+AXIS_BLOCKS_REGEX = re.compile(r'(_log|bone_block|hay_block|quartz_pillar|purpur_pillar)$')
+
+# Backlit glass textures are glass with a light source under it
+BACKLIT_REGEX = re.compile(r'^(glowstone|sea_lantern)_backlit_(.+)$')
+
+def get_texture_name(file_name):
+    """Return the texture name of a file name, and the light source under it for backlit glass, or None."""
+    texture_name = file_name.split('.')[0].lower()
+    match_obj = BACKLIT_REGEX.match(texture_name)
+    if match_obj:
+
+        return match_obj.group(2), f'minecraft:{match_obj.group(1)}'
+
+    return texture_name, None
+
+def is_shown_on_top(file_name):
+    """Say whether the floor block laid for a texture shows it on top. Side textures of blocks that
+    can't be turned on their side, like furnace_front or sandstone, show another texture there."""
+    texture_name, _ = get_texture_name(file_name)
+    if texture_name in SIDE_TEXTURES_DICT:
+
+        return False
+    if (texture_name in BLOCK_STATES_DICT) or texture_name.endswith('_top'):
+
+        return True
+    if re.search(r'_(side|front|back|bottom)$', texture_name):
+
+        return bool(AXIS_BLOCKS_REGEX.search(re.sub(r'_(side|front|back|bottom)$', '', texture_name)))
+
+    return True
+
+def get_block_states(file_name):
+    """
+    :param file_name:  a texture file name such as 'oak_log_top.png'
+    :return:           the block state of the floor block for the texture, which shows it on top when
+                       is_shown_on_top says so, and the block state to place under it, or None
+    """
+    texture_name, backing_state = get_texture_name(file_name)
+    if texture_name in BLOCK_STATES_DICT:
+
+        return BLOCK_STATES_DICT[texture_name], backing_state
+    axis = 'x'
+    for suffix in ['_top', '_side', '_front']:
+        if texture_name.endswith(suffix):
+            texture_name = texture_name[:-len(suffix)]
+            if suffix == '_top':
+                axis = 'y'
+            break
+    block_state = f'minecraft:{texture_name}'
+    if AXIS_BLOCKS_REGEX.search(texture_name):
+        block_state += f'[axis={axis}]'
+
+    return block_state, backing_state
+
+def parse_block_state(block_state):
+    """Split 'minecraft:oak_log[axis=y]' into its name and a dictionary of its properties."""
+    name, _, properties_str = block_state.rstrip(']').partition('[')
+    properties_dict = dict(property_str.split('=') for property_str in properties_str.split(',') if property_str)
+
+    return name, properties_dict
+
+def encode_varints(values_array):
+    """Encode non-negative integers as the unsigned LEB128 varints of the Sponge BlockData."""
+    values_array = np.asarray(values_array, dtype=np.uint32)
+    lengths_array = 1 + sum([(values_array >= (1 << (7 * k))).astype(np.intp) for k in range(1, 5)])
+    varints_array = np.empty(int(lengths_array.sum()), dtype=np.uint8)
+    positions_array = np.cumsum(lengths_array) - lengths_array
+    for k in range(5):
+        mask_array = lengths_array > k
+        if not mask_array.any():
+            break
+        continuation_array = (lengths_array[mask_array] > k + 1).astype(np.uint32) << 7
+        varints_array[positions_array[mask_array] + k] = ((values_array[mask_array] >> (7 * k)) & 0x7F) | continuation_array
+
+    return varints_array
+
+def pack_longs(values_array, bits):
+    """Pack values into little-endian bit fields that may span longs, as Litematica does, returned as
+    big-endian long bytes. The value count times bits must be a multiple of 64."""
+    bits_array = (values_array.astype(np.uint64)[:, None] >> np.arange(bits, dtype=np.uint64)) & np.uint64(1)
+    packed_array = np.packbits(bits_array.astype(np.uint8).reshape(-1), bitorder='little').view('<u8')
+
+    return packed_array.astype('>u8').tobytes()
+
+class StructureExporter(object):
+    """This class lays a BlockGrid out as a floor, with its columns along X
+    and its rows along Z, and streams it into structure files a row at a
+    time. The texture file names decide the block states, and backlit glass
+    adds a layer of light sources under the floor.
+
+    Examples
+    --------
+
+    >>> import sys
+    >>> sys.path.insert(1, '../py')
+    >>> import structure_export
+    >>> exporter = structure_export.StructureExporter(block_grid, name='shuriken')
+    >>> exporter.export('../saves/schem/shuriken.schem')
+    """
+
+    def __init__(self, block_grid, name='pixel_art', data_version=DATA_VERSION, allow_side_textures=False):
+        """
+        :param allow_side_textures:  True to lay blocks for textures that no block shows on top (see
+                                     is_shown_on_top), whose floor then doesn't match the recipe
+        """
+        self.block_grid = block_grid
+        self.name = name
+        self.data_version = data_version
+        self.length, self.width = block_grid.shape
+
+        # One palette lookup per layer, indexed by block code; code -1, an empty cell, picks the trailing air
+        self.states_list = [AIR_STATE]
+        top_indices_list = []
+        backing_indices_list = []
+        for file_name in block_grid.blocks_df.file_name.tolist():
+            top_state, backing_state = get_block_states(file_name)
+            top_indices_list.append(self.get_state_index(top_state))
+            backing_indices_list.append(0 if backing_state is None else self.get_state_index(backing_state))
+        self.layer_luts_list = [np.array(top_indices_list + [0], dtype=np.int64)]
+        if any(backing_indices_list):
+            self.layer_luts_list.insert(0, np.array(backing_indices_list + [0], dtype=np.int64))
+        self.height = len(self.layer_luts_list)
+
+        # Count each palette entry from the block code counts, without expanding the grid
+        code_counts_array = np.bincount(block_grid.codes_array.ravel().astype(np.intp) + 1,
+                                        minlength=len(top_indices_list) + 1)
+        side_textures_list = [file_name for file_name, code_count in zip(block_grid.blocks_df.file_name.tolist(),
+                                                                         code_counts_array[1:].tolist())
+                              if (code_count > 0) and not is_shown_on_top(file_name)]
+        if side_textures_list and not allow_side_textures:
+            raise ValueError(f'No block shows {", ".join(side_textures_list)} on top, so the floor would not match '
+                             'the recipe: quantize without them, or pass allow_side_textures=True')
+        self.state_counts_array = np.zeros(len(self.states_list), dtype=np.int64)
+        for lut_array in self.layer_luts_list:
+            self.state_counts_array += np.bincount(lut_array[np.arange(-1, len(top_indices_list))],
+                                                   weights=code_counts_array,
+                                                   minlength=len(self.states_list)).astype(np.int64)
+        self.volume = self.width * self.height * self.length
+        self.block_count = self.volume - int(self.state_counts_array[0])
+    
+    
+    
+    def get_state_index(self, block_state):
+        if block_state not in self.states_list:
+            self.states_list.append(block_state)
+
+        return self.states_list.index(block_state)
+    
+    
+    
+    def iter_rows(self):
+        """Yield (y, z, palette indices along x) in Y, then Z, then X order."""
+        for y, lut_array in enumerate(self.layer_luts_list):
+            for z in range(self.length):
+                yield y, z, lut_array[self.block_grid.codes_array[z]]
+    
+    
+    
+    def write_palette_list(self, writer, name):
+        writer.begin_list(name, TAG_COMPOUND, len(self.states_list))
+        for block_state in self.states_list:
+            block_name, properties_dict = parse_block_state(block_state)
+            writer.begin_compound(None)
+            writer.write_string('Name', block_name)
+            if properties_dict:
+                writer.write_compound('Properties', properties_dict)
+            writer.end_compound()
+    
+    
+    
+    def write_schem(self, file_path):
+        """Write a Sponge Schematic version 2 file, as read by WorldEdit."""
+        with gzip.open(file_path, 'wb', compresslevel=6) as f:
+            writer = NbtWriter(f)
+            writer.begin_compound('Schematic')
+            writer.write_int('Version', 2)
+            writer.write_int('DataVersion', self.data_version)
+
+            # The dimensions are unsigned shorts
+            for dimension_name, dimension in [('Width', self.width), ('Height', self.height), ('Length', self.length)]:
+                writer.write_short(dimension_name, dimension - 65536 if dimension > 32767 else dimension)
+            writer.write_int_array('Offset', [0, 0, 0])
+            writer.write_int('PaletteMax', len(self.states_list))
+            writer.write_compound('Palette', {block_state: i for i, block_state in enumerate(self.states_list)})
+            varint_lengths_array = np.array([len(encode_varints([i])) for i in range(len(self.states_list))])
+            writer.begin_array(TAG_BYTE_ARRAY, 'BlockData', int((self.state_counts_array * varint_lengths_array).sum()))
+            for _, _, indices_array in self.iter_rows():
+                writer.write_raw(encode_varints(indices_array).tobytes())
+            writer.begin_list('BlockEntities', TAG_COMPOUND, 0)
+            writer.end_compound()
+    
+    
+    
+    def write_structure_nbt(self, file_path):
+        """Write a vanilla structure block file, leaving out the air."""
+        block_dtype = np.dtype([('pos_header', 'V11'), ('x', '>i4'), ('y', '>i4'), ('z', '>i4'),
+                                ('state_header', 'V8'), ('state', '>i4'), ('end', 'u1')])
+        with gzip.open(file_path, 'wb', compresslevel=6) as f:
+            writer = NbtWriter(f)
+            writer.begin_compound('')
+            writer.write_int('DataVersion', self.data_version)
+            writer.begin_list('size', TAG_INT, 3)
+            writer.write_raw(np.array([self.width, self.height, self.length], dtype='>i4').tobytes())
+            self.write_palette_list(writer, 'palette')
+
+            # Every block is the same fixed-size compound, so write each row of them as one record array
+            writer.begin_list('blocks', TAG_COMPOUND, self.block_count)
+            for y, z, indices_array in self.iter_rows():
+                x_array = np.flatnonzero(indices_array)
+                blocks_array = np.zeros(len(x_array), dtype=block_dtype)
+                blocks_array['pos_header'] = np.void(b'\x09\x00\x03pos\x03\x00\x00\x00\x03')
+                blocks_array['x'] = x_array
+                blocks_array['y'] = y
+                blocks_array['z'] = z
+                blocks_array['state_header'] = np.void(b'\x03\x00\x05state')
+                blocks_array['state'] = indices_array[x_array]
+                writer.write_raw(blocks_array.tobytes())
+            writer.begin_list('entities', TAG_COMPOUND, 0)
+            writer.end_compound()
+    
+    
+    
+    def write_litematic(self, file_path):
+        """Write a single-region Litematica schematic."""
+        bits = max(2, (len(self.states_list) - 1).bit_length())
+        group_size = 64 // math.gcd(bits, 64)
+        time_ms = int(time.time() * 1000)
+        size_dict = {'x': self.width, 'y': self.height, 'z': self.length}
+        with gzip.open(file_path, 'wb', compresslevel=6) as f:
+            writer = NbtWriter(f)
+            writer.begin_compound('')
+            writer.write_int('MinecraftDataVersion', self.data_version)
+            writer.write_int('Version', 5)
+            writer.begin_compound('Metadata')
+            writer.write_string('Name', self.name)
+            writer.write_string('Author', os.environ.get('USER', ''))
+            writer.write_string('Description', '')
+            writer.write_int('RegionCount', 1)
+            writer.write_int('TotalBlocks', self.block_count)
+            writer.write_int('TotalVolume', self.volume)
+            writer.write_long('TimeCreated', time_ms)
+            writer.write_long('TimeModified', time_ms)
+            writer.write_compound('EnclosingSize', size_dict)
+            writer.end_compound()
+            writer.begin_compound('Regions')
+            writer.begin_compound(self.name)
+            writer.write_compound('Position', {'x': 0, 'y': 0, 'z': 0})
+            writer.write_compound('Size', size_dict)
+            self.write_palette_list(writer, 'BlockStatePalette')
+
+            # Pack whole groups of values, which fill whole longs, carrying the rest into the next row
+            long_count = -(-self.volume * bits // 64)
+            writer.begin_array(TAG_LONG_ARRAY, 'BlockStates', long_count)
+            carry_array = np.empty(0, dtype=np.int64)
+            for _, _, indices_array in self.iter_rows():
+                values_array = np.concatenate([carry_array, indices_array])
+                usable_count = len(values_array) // group_size * group_size
+                writer.write_raw(pack_longs(values_array[:usable_count], bits))
+                carry_array = values_array[usable_count:]
+            if len(carry_array):
+                padded_array = np.zeros(group_size, dtype=np.int64)
+                padded_array[:len(carry_array)] = carry_array
+                writer.write_raw(pack_longs(padded_array, bits)[:8 * -(-len(carry_array) * bits // 64)])
+            for list_name in ['Entities', 'TileEntities', 'PendingBlockTicks', 'PendingFluidTicks']:
+                writer.begin_list(list_name, TAG_COMPOUND, 0)
+            writer.end_compound()
+            writer.end_compound()
+            writer.end_compound()
+    
+    
+    
+    def export(self, file_path):
+        """Write the file format named by the extension: .schem, .nbt or .litematic."""
+        write_dict = {'.schem': self.write_schem, '.nbt': self.write_structure_nbt, '.litematic': self.write_litematic}
+        extension = os.path.splitext(file_path)[1].lower()
+        if extension not in write_dict:
+            raise ValueError(f'Unknown structure format {extension!r}: choose one of {sorted(write_dict)}')
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        write_dict[extension](file_path)
+
+        return file_path
@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules import each other by name from py/, as the notebooks do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'py'))
+
+def get_old_file_name(pixel, rgb_dict):
+    """The nearest block as pixel_to_filename found it before the index: a stable sort by distance."""
+    f = lambda item: np.linalg.norm(np.array(item[1]) - np.array(pixel))
+
+    return sorted(rgb_dict.items(), key=f)[0][0]
+
+@pytest.fixture
+def rgb_dict():
+
+    # A random palette with a repeated colour, so that ties have to go to the first block
+    rng = np.random.default_rng(0)
+    rgb_dict = {f'block_{index}.png': tuple(rng.integers(0, 256, 3).tolist()) for index in range(24)}
+    rgb_dict['block_copy.png'] = rgb_dict['block_3.png']
+
+    return rgb_dict
+
+@pytest.fixture
+def img_array(rgb_dict):
+    rng = np.random.default_rng(1)
+    img_array = rng.integers(0, 256, (19, 23, 3)).astype(np.uint8)
+
+    # Include the palette colours themselves, which tie with their copies
+    img_array[0, :len(rgb_dict)] = np.array(list(rgb_dict.values()))[:img_array.shape[1]]
+
+    return img_array
+
+@pytest.fixture
+def recipes(tmp_path, monkeypatch):
+    """A PixelArtRecipies storing its lookup tables and objects under a temporary folder."""
+    monkeypatch.setenv('STORAGE_DATA_FOLDER', str(tmp_path / 'data'))
+    monkeypatch.setenv('STORAGE_SAVES_FOLDER', str(tmp_path / 'saves'))
+    from pixel_art_recipes import PixelArtRecipies
+
+    return PixelArtRecipies()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from anvil_writer import (REGION_CHUNKS, SECTOR_SIZE, AnvilWriter, get_chunk_bytes, get_palette_key, get_region_path,
+                          read_chunk_dict, read_region_locations, unpack_block_states, write_empty_world)
+from nbt_reader import NbtReader
+from test_structure_export import get_block_grid, get_expected_states_array
+import mmap
+import numpy as np
+import pytest
+
+# The build straddles chunk and region borders, and the last chunk is never touched
+CHUNK_POSITIONS_LIST = [(-1, -1), (-1, 0), (0, -1), (0, 0), (3, 3)]
+HORIZONTAL_OFFSET = -5
+VERTICAL_OFFSET = -3
+Y = -60
+
+def read_chunk(world_dir, chunk_x, chunk_z):
+    """Return the chunk dictionary, and its raw sectors, at chunk coordinates."""
+    region_path = get_region_path(world_dir, chunk_x // REGION_CHUNKS, chunk_z // REGION_CHUNKS)
+    with open(region_path, 'rb') as f:
+        region_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    location = int(read_region_locations(region_mmap)[(chunk_x % REGION_CHUNKS) + REGION_CHUNKS * (chunk_z % REGION_CHUNKS)])
+    chunk_bytes = region_mmap[(location >> 8) * SECTOR_SIZE:((location >> 8) + (location & 0xFF)) * SECTOR_SIZE]
+    chunk_dict = read_chunk_dict(region_mmap, location)
+    region_mmap.close()
+
+    return chunk_dict, chunk_bytes
+
+def get_block_state(world_dir, x, y, z):
+    chunk_dict, _ = read_chunk(world_dir, x >> 4, z >> 4)
+    section_dict = next(section_dict for section_dict in chunk_dict['sections'][1][1] if section_dict['Y'][1] == y >> 4)
+    block_states_dict = section_dict['block_states'][1]
+    palette_list = block_states_dict['palette'][1][1]
+    data_array = block_states_dict['data'][1] if 'data' in block_states_dict else None
+    indices_array = unpack_block_states(data_array, len(palette_list))
+
+    return get_palette_key(palette_list[indices_array[(y & 15) * 256 + (z & 15) * 16 + (x & 15)]])
+
+@pytest.fixture
+def world_dir(tmp_path):
+    write_empty_world(str(tmp_path), CHUNK_POSITIONS_LIST)
+
+    return str(tmp_path)
+
+def test_nbt_round_trip(world_dir):
+    chunk_dict, _ = read_chunk(world_dir, 0, 0)
+    chunk_bytes = get_chunk_bytes(chunk_dict)
+    assert get_chunk_bytes(NbtReader(chunk_bytes).read_named_tag()[2]) == chunk_bytes
+
+def test_written_blocks_read_back(world_dir):
+    block_grid = get_block_grid(shape=(9, 11))
+    untouched_bytes = read_chunk(world_dir, 3, 3)[1]
+    anvil_writer = AnvilWriter(block_grid, horizontal_offset=HORIZONTAL_OFFSET, vertical_offset=VERTICAL_OFFSET, y=Y)
+    written_chunks_list, missing_chunks_list = anvil_writer.write(world_dir)
+    assert sorted(written_chunks_list) == CHUNK_POSITIONS_LIST[:4]
+    assert missing_chunks_list == []
+
+    # Air in the build leaves the world's air, so every position reads back as its expected state
+    expected_states_array = get_expected_states_array(block_grid)
+    for layer, y in enumerate([Y - 1, Y]):
+        for row in range(9):
+            for col in range(11):
+                block_state = get_block_state(world_dir, col + HORIZONTAL_OFFSET, y, row + VERTICAL_OFFSET)
+                assert block_state == expected_states_array[layer, row, col]
+    assert get_block_state(world_dir, HORIZONTAL_OFFSET, Y + 1, VERTICAL_OFFSET) == 'minecraft:air'
+    assert read_chunk(world_dir, 3, 3)[1] == untouched_bytes
+
+def test_palette_and_indices_stay_compact(world_dir):
+    AnvilWriter(get_block_grid(shape=(9, 11)), horizontal_offset=HORIZONTAL_OFFSET, vertical_offset=VERTICAL_OFFSET,
+                y=Y).write(world_dir)
+    chunk_dict, _ = read_chunk(world_dir, 0, 0)
+    section_dict = next(section_dict for section_dict in chunk_dict['sections'][1][1] if section_dict['Y'][1] == Y >> 4)
+    block_states_dict = section_dict['block_states'][1]
+    palette_keys_list = [get_palette_key(palette_dict) for palette_dict in block_states_dict['palette'][1][1]]
+    indices_array = unpack_block_states(block_states_dict['data'][1], len(palette_keys_list))
+
+    # Every palette entry is used, none twice, and the data is as short as 4-bit indices allow
+    assert len(set(palette_keys_list)) == len(palette_keys_list)
+    assert np.array_equal(np.unique(indices_array), np.arange(len(palette_keys_list)))
+    assert len(block_states_dict['data'][1]) == 4096 * 4 // 64
+
+def test_missing_chunks_are_left_out(tmp_path):
+    write_empty_world(str(tmp_path), [(0, 0)])
+    anvil_writer = AnvilWriter(get_block_grid(shape=(9, 11)), horizontal_offset=HORIZONTAL_OFFSET,
+                               vertical_offset=VERTICAL_OFFSET, y=Y)
+    written_chunks_list, missing_chunks_list = anvil_writer.write(str(tmp_path))
+    assert written_chunks_list == [(0, 0)]
+    assert sorted(missing_chunks_list) == [(-1, -1), (-1, 0), (0, -1)]
+    written_chunks_list, _ = anvil_writer.write(str(tmp_path), create_missing_chunks=True)
+    assert sorted(written_chunks_list) == CHUNK_POSITIONS_LIST[:4]
+    assert get_block_state(str(tmp_path), HORIZONTAL_OFFSET, Y, VERTICAL_OFFSET) != 'minecraft:air'
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from conftest import get_old_file_name
+import numpy as np
+
+def test_full_lut_matches_old_sort(recipes, rgb_dict, img_array):
+    labels_array, _ = recipes.get_label_grid(img_array, rgb_dict)
+    recipes.lut_bits_per_channel = 8
+    lut_labels_array, file_names_list = recipes.get_label_grid(img_array, rgb_dict)
+    assert np.array_equal(lut_labels_array, labels_array)
+    assert file_names_list[lut_labels_array[0, 3]] == get_old_file_name(img_array[0, 3], rgb_dict)
+
+def test_coarse_lut_maps_bin_centres(recipes, rgb_dict, img_array):
+    recipes.lut_bits_per_channel = 5
+    lut_labels_array, file_names_list = recipes.get_label_grid(img_array, rgb_dict)
+    centres_array = (img_array.astype(np.intp) >> 3 << 3) + 3.5
+    for row, col in [(0, 0), (4, 9), (18, 22)]:
+        assert file_names_list[lut_labels_array[row, col]] == get_old_file_name(centres_array[row, col], rgb_dict)
+
+def test_lut_is_stored_once_and_memory_mapped(recipes, rgb_dict):
+    lut_array = recipes.get_block_lut(rgb_dict, bits_per_channel=5)
+    assert isinstance(lut_array, np.memmap) and (lut_array.shape == (32, 32, 32))
+    assert recipes.s.npy_exists(recipes.get_lut_name(rgb_dict, bits_per_channel=5))
+
+    # Another palette gets another table
+    other_rgb_dict = dict(rgb_dict, **{'block_0.png': (1, 2, 3)})
+    assert recipes.get_lut_name(other_rgb_dict, bits_per_channel=5) != recipes.get_lut_name(rgb_dict, bits_per_channel=5)
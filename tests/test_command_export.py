@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from command_export import MAX_COMMAND_CHAIN_LENGTH, CommandExporter
+from structure_export import AIR_STATE
+from test_structure_export import get_block_grid, get_expected_states_array
+import numpy as np
+import os
+import pytest
+
+Y = 64
+
+def read_function(datapack_dir, function_name, namespace='pixel_art'):
+    with open(os.path.join(datapack_dir, 'data', namespace, 'functions', f'{function_name}.mcfunction')) as f:
+
+        return f.read().splitlines()
+
+def run_commands(commands_list, shape):
+    """Replay the /fill and /setblock commands onto an empty (y, z, x) volume at the origin."""
+    states_array = np.full(shape, AIR_STATE, dtype=object)
+    for command_str in commands_list:
+        words_list = command_str.split(' ')
+        if words_list[0] == 'setblock':
+            x1, y1, z1 = x2, y2, z2 = tuple(map(int, words_list[1:4]))
+        else:
+            x1, y1, z1, x2, y2, z2 = map(int, words_list[1:7])
+        states_array[y1 - Y + shape[0] - 1:y2 - Y + shape[0], z1:z2 + 1, x1:x2 + 1] = words_list[-1]
+
+    return states_array
+
+def test_commands_rebuild_the_floor(tmp_path):
+    block_grid = get_block_grid(shape=(9, 11))
+    exporter = CommandExporter(block_grid, name='test', y=Y)
+    command_count = exporter.export(str(tmp_path))
+    assert read_function(str(tmp_path), 'test') == ['function pixel_art:test_1']
+    commands_list = read_function(str(tmp_path), 'test_1')
+    assert len(commands_list) == command_count
+    expected_states_array = get_expected_states_array(block_grid)
+    assert np.array_equal(run_commands(commands_list, expected_states_array.shape), expected_states_array)
+
+def test_parts_are_scheduled_on_successive_ticks(tmp_path):
+    block_grid = get_block_grid(shape=(9, 11))
+    exporter = CommandExporter(block_grid, name='test', y=Y)
+    command_count = exporter.export(str(tmp_path), max_commands=10)
+    part_count = -(-command_count // 10)
+    assert part_count > 1
+    assert read_function(str(tmp_path), 'test') == [f'schedule function pixel_art:test_{part} {part}t'
+                                                    for part in range(1, part_count + 1)]
+    commands_list = sum([read_function(str(tmp_path), f'test_{part}') for part in range(1, part_count + 1)], [])
+    expected_states_array = get_expected_states_array(block_grid)
+    assert np.array_equal(run_commands(commands_list, expected_states_array.shape), expected_states_array)
+
+def test_relative_y_needs_one_part(tmp_path):
+    block_grid = get_block_grid(shape=(9, 11))
+    datapack_dir = tmp_path / 'test'
+    with pytest.raises(ValueError, match='absolute y'):
+        CommandExporter(block_grid, name='test').export(str(datapack_dir), max_commands=10)
+    assert not datapack_dir.exists()
+    with pytest.raises(ValueError, match='command chain'):
+        CommandExporter(block_grid, name='test', y=Y).export(str(datapack_dir), max_commands=MAX_COMMAND_CHAIN_LENGTH)
+    assert not datapack_dir.exists()
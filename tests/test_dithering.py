@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from dithering import KERNELS_DICT, Ditherer
+from nearest_blocks import NearestBlockIndex
+import numpy as np
+import pytest
+
+def get_serial_labels(block_index, rgb_array, kernel_list):
+    """Diffuse the error one pixel at a time, in reading order, dropping whatever falls off the image."""
+    work_array = np.asarray(rgb_array, dtype=np.float64).copy()
+    row_count, col_count = work_array.shape[:2]
+    labels_array = np.empty((row_count, col_count), dtype=np.intp)
+    for row in range(row_count):
+        for col in range(col_count):
+            pixel_array = np.clip(work_array[row, col], 0, 255)
+            label = block_index.query(pixel_array[None, :])[0]
+            labels_array[row, col] = label
+            error_array = pixel_array - block_index.rgb_array[label]
+            for row_offset, column_offset, weight in kernel_list:
+                if (row + row_offset < row_count) and (0 <= col + column_offset < col_count):
+                    work_array[row + row_offset, col + column_offset] += weight * error_array
+
+    return labels_array
+
+@pytest.mark.parametrize('method', sorted(KERNELS_DICT))
+def test_wavefront_matches_serial_loop(rgb_dict, img_array, method):
+    block_index = NearestBlockIndex(rgb_dict)
+    labels_array = Ditherer(block_index, method=method).dither(img_array)
+    assert np.array_equal(labels_array, get_serial_labels(block_index, img_array, KERNELS_DICT[method]))
+
+def test_asymmetric_kernel_matches_serial_loop(rgb_dict, img_array, monkeypatch):
+
+    # Pushing error three columns left into the next row needs a steeper wavefront than the stock kernels
+    kernel_list = [(0, 1, 0.4), (1, -3, 0.3), (1, 0, 0.2), (2, -5, 0.1)]
+    monkeypatch.setitem(KERNELS_DICT, 'asymmetric', kernel_list)
+    block_index = NearestBlockIndex(rgb_dict)
+    labels_array = Ditherer(block_index, method='asymmetric').dither(img_array)
+    assert np.array_equal(labels_array, get_serial_labels(block_index, img_array, kernel_list))
+
+def test_upward_kernel_is_refused(rgb_dict, img_array, monkeypatch):
+    monkeypatch.setitem(KERNELS_DICT, 'upward', [(0, 1, 0.5), (-1, 0, 0.5)])
+    with pytest.raises(ValueError, match='upward'):
+        Ditherer(NearestBlockIndex(rgb_dict), method='upward').dither(img_array)
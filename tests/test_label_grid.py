@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from conftest import get_old_file_name
+import numpy as np
+
+def get_old_file_names_list(img_array, rgb_dict):
+
+    return [[get_old_file_name(pixel, rgb_dict) for pixel in row_array] for row_array in img_array]
+
+def test_label_grid_matches_old_sort(recipes, rgb_dict, img_array):
+    labels_array, file_names_list = recipes.get_label_grid(img_array, rgb_dict)
+    assert labels_array.shape == img_array.shape[:2]
+    file_names_grid_list = [[file_names_list[label] for label in row_array] for row_array in labels_array.tolist()]
+    assert file_names_grid_list == get_old_file_names_list(img_array, rgb_dict)
+
+def test_label_grid_ignores_alpha(recipes, rgb_dict, img_array):
+    rgba_array = np.dstack([img_array, np.full(img_array.shape[:2], 255, dtype=np.uint8)])
+    assert np.array_equal(recipes.get_label_grid(rgba_array, rgb_dict)[0], recipes.get_label_grid(img_array, rgb_dict)[0])
+
+def test_pixel_to_filename_matches_old_sort(recipes, rgb_dict, img_array):
+    for row, col in [(0, 0), (0, 3), (5, 7), (18, 22)]:
+        assert recipes.pixel_to_filename(img_array, row, col, rgb_dict) == get_old_file_name(img_array[row, col], rgb_dict)
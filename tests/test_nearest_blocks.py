@@ -0,0 +1,22 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from conftest import get_old_file_name
+from nearest_blocks import NearestBlockIndex
+import numpy as np
+
+def test_index_matches_old_sort(rgb_dict, img_array):
+    pixels_array = img_array.reshape(-1, 3)
+    file_names_array = NearestBlockIndex(rgb_dict).query_file_names(pixels_array)
+    assert file_names_array.tolist() == [get_old_file_name(pixel, rgb_dict) for pixel in pixels_array]
+
+def test_ties_go_to_the_first_block(rgb_dict):
+    pixels_array = np.array([rgb_dict['block_copy.png']])
+    assert NearestBlockIndex(rgb_dict).query_file_names(pixels_array).tolist() == ['block_3.png']
+
+def test_brute_force_matches_tree(rgb_dict, img_array):
+    block_index = NearestBlockIndex(rgb_dict, chunk_size=7)
+    pixels_array = img_array.reshape(-1, 3).astype(np.float64)
+    assert np.array_equal(block_index.get_brute_force_labels(pixels_array), block_index.query(pixels_array))
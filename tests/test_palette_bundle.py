@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from palette_bundle import PaletteBundle
+import glob
+import os
+import pandas as pd
+import pytest
+import shutil
+
+PICKLES_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'saves', 'pkl')
+
+@pytest.fixture
+def migrated_recipes(tmp_path, monkeypatch):
+    """A PixelArtRecipies whose saves hold only the old *_DICT and minecraft_*_list pickles."""
+    pickles_folder = tmp_path / 'saves' / 'pkl'
+    os.makedirs(pickles_folder)
+    for pickle_path in glob.glob(os.path.join(PICKLES_FOLDER, '*_DICT.pkl')) + glob.glob(
+        os.path.join(PICKLES_FOLDER, 'minecraft_*_list.pkl')):
+        shutil.copy(pickle_path, pickles_folder)
+    monkeypatch.setenv('STORAGE_DATA_FOLDER', str(tmp_path / 'data'))
+    monkeypatch.setenv('STORAGE_SAVES_FOLDER', str(tmp_path / 'saves'))
+    from pixel_art_recipes import PixelArtRecipies
+
+    return PixelArtRecipies()
+
+def load_pickle(pickle_name):
+
+    return pd.read_pickle(os.path.join(PICKLES_FOLDER, f'{pickle_name}.pkl'))
+
+def test_bundle_keeps_the_dictionaries(migrated_recipes):
+    assert not migrated_recipes.s.npy_exists(PaletteBundle.get_bundle_name())
+    for feature in ['average', 'dominant', 'weighted_average']:
+        rgb_dict = load_pickle(f'{feature.upper()}_DICT')
+        assert getattr(migrated_recipes, f'{feature}_dict') == rgb_dict
+        assert list(migrated_recipes.palette_bundle.get_rgb_dict(feature)) == list(rgb_dict)
+    assert migrated_recipes.s.npy_exists(PaletteBundle.get_bundle_name())
+
+def test_masks_give_the_stored_lists(migrated_recipes):
+    average_dict = load_pickle('AVERAGE_DICT')
+
+    # The stored glass lists name plain stained glass, which isn't in the texture set, so the glass
+    # category selects the backlit stained glass that is
+    backlit_list = [file_name for file_name in average_dict
+                    if ('_backlit_' in file_name) and file_name.endswith('_stained_glass.png')]
+    assert len(backlit_list) == 32
+    assert not set(load_pickle('minecraft_glass_list')) & set(average_dict)
+    assert migrated_recipes.glass_list == backlit_list
+    assert migrated_recipes.stained_glass_list == backlit_list
+    for list_name, (included_list, _) in migrated_recipes.BLOCK_LISTS_DICT.items():
+        pickle_name = f'minecraft_{list_name}'
+        if not os.path.isfile(os.path.join(PICKLES_FOLDER, f'{pickle_name}.pkl')):
+            continue
+        expected_list = [file_name for file_name in load_pickle(pickle_name) if file_name in average_dict]
+        if 'glass' in included_list:
+            expected_list += backlit_list
+        assert sorted(getattr(migrated_recipes, list_name)) == sorted(expected_list), list_name
+    expected_list = [file_name for file_name in load_pickle('minecraft_concrete_list') + load_pickle(
+        'minecraft_terracotta_list') + load_pickle('minecraft_wool_list')
+                     if ('powder' not in file_name) and ('glazed' not in file_name)]
+    assert sorted(migrated_recipes.unpowdered_and_unglazed_list) == sorted(expected_list)
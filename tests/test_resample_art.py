@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from PIL import Image
+import numpy as np
+import os
+
+def write_image(file_path, img_array):
+    Image.fromarray(img_array).save(file_path)
+
+    return str(file_path)
+
+def read_image(file_path):
+    with Image.open(file_path) as img:
+
+        return np.asarray(img)
+
+def test_pad_keeps_the_requested_size(recipes, tmp_path):
+    img_array = np.random.default_rng(0).integers(0, 256, (200, 300, 3)).astype(np.uint8)
+    file_path = write_image(tmp_path / 'art300x200.png', img_array)
+    fit_array = read_image(recipes.resample_art(file_path, width=150))
+    assert fit_array.shape == (100, 150, 3)
+    pad_path = recipes.resample_art(file_path, width=150, map_alignment='pad')
+    assert os.path.basename(pad_path) == 'art_area_pad_ffffff256x128.png'
+    pad_array = read_image(pad_path)
+    assert pad_array.shape == (128, 256, 3)
+
+    # The art is centred unscaled, and everything around it is the pad colour
+    top, left = (128 - 100) // 2, (256 - 150) // 2
+    assert np.array_equal(pad_array[top:top + 100, left:left + 150], fit_array)
+    border_mask = np.ones((128, 256), dtype=bool)
+    border_mask[top:top + 100, left:left + 150] = False
+    assert (pad_array[border_mask] == 255).all()
+
+def test_transparent_pixels_dont_bleed(recipes, tmp_path):
+
+    # Opaque red on the left, and transparent pixels that still hold green on the right
+    img_array = np.zeros((10, 40, 4), dtype=np.uint8)
+    img_array[:, :15] = (255, 0, 0, 255)
+    img_array[:, 15:] = (0, 255, 0, 0)
+    build_array = read_image(recipes.resample_art(write_image(tmp_path / 'edge.png', img_array), width=4))
+    assert build_array.shape == (1, 4, 4)
+
+    # The edge block is half covered, and what covers it is red
+    assert build_array[0, 1].tolist() == [255, 0, 0, 128]
+    assert (build_array[0, :, 1] == 0).all()
+    assert build_array[0, 2:, 3].tolist() == [0, 0]
+
+def test_pad_color_names_the_image(recipes, tmp_path):
+    img_array = np.full((20, 30, 3), 90, dtype=np.uint8)
+    file_path = write_image(tmp_path / 'art.png', img_array)
+    white_path = recipes.resample_art(file_path, map_alignment='pad')
+    black_path = recipes.resample_art(file_path, map_alignment='pad', pad_color=(0, 0, 0))
+    assert white_path != black_path
+    assert os.path.basename(black_path) == 'art_area_pad_000000128x128.png'
+    assert read_image(white_path)[0, 0].tolist() == [255, 255, 255]
+    assert read_image(black_path)[0, 0].tolist() == [0, 0, 0]
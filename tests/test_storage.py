@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+import functools
+import numpy as np
+import os
+import pandas as pd
+import pytest
+import re
+import storage
+
+@pytest.fixture
+def s(tmp_path):
+
+    return storage.Storage(data_folder=str(tmp_path / 'data'), saves_folder=str(tmp_path / 'saves'))
+
+def test_deleted_pickle_is_recomputed(s):
+    s.store_objects(verbose=False, SMALL={'a': 1})
+    assert s.pickle_exists('SMALL')
+    os.remove(s.get_object_path('SMALL', s.find_object_format('SMALL')))
+    assert not s.pickle_exists('SMALL')
+    assert 'SMALL' not in s.get_manifest()
+    assert s.load_many(['SMALL']) == {'SMALL': None}
+
+def test_load_many_trusts_the_manifest_until_a_read_fails(s, monkeypatch):
+    s.store_objects(verbose=False, FIRST={'a': 1}, SECOND=[2])
+    checked_list = []
+    monkeypatch.setattr(os.path, 'isfile', lambda path: checked_list.append(path) or os.path.exists(path))
+    assert s.load_many(['FIRST', 'SECOND', 'UNKNOWN'], max_workers=1) == {'FIRST': {'a': 1}, 'SECOND': [2],
+                                                                          'UNKNOWN': None}
+    assert checked_list == []
+
+    # A copy left by code that doesn't keep the manifest is only looked for once the read fails
+    s.read_retry_seconds = 0
+    first_path = s.get_object_path('FIRST', s.find_object_format('FIRST'))
+    os.makedirs(os.path.dirname(s.get_object_path('FIRST', 'pickle')), exist_ok=True)
+    os.replace(first_path, s.get_object_path('FIRST', 'pickle'))
+    assert s.load_many(['FIRST'], max_workers=1) == {'FIRST': {'a': 1}}
+    assert s.get_manifest()['FIRST']['format'] == 'pickle'
+
+def test_objects_load_writable_unless_memory_mapped(s):
+    s.store_objects(verbose=False, ARRAY=np.arange(10), ARRAYS={'x': np.arange(100_000)})
+    array = s.load_object('ARRAY', verbose=False)
+    array[0] = 5
+    arrays_dict = s.load_object('ARRAYS', verbose=False)
+    arrays_dict['x'][0] = 5
+    assert not s.load_object('ARRAYS', verbose=False, mmap_mode='r')['x'].flags.writeable
+    assert s.load_many(['ARRAY'])['ARRAY'].flags.writeable
+
+def get_function(source_str):
+    globals_dict = {'__name__': 'memo_test'}
+    exec(source_str, globals_dict)
+
+    return globals_dict['f']
+
+def test_memo_key_follows_constants_defaults_and_helpers(s):
+    source_str = 'def h(x):\n    return x + 1\ndef f(x, y=2):\n    return h(x) * 3\n'
+    memo_key = s.get_memo_key(get_function(source_str), {'x': 1})
+    assert memo_key == s.get_memo_key(get_function(source_str), {'x': 1})
+    for old_str, new_str in [('* 3', '* 4'), ('y=2', 'y=5'), ('x + 1', 'x + 2')]:
+        assert s.get_memo_key(get_function(source_str.replace(old_str, new_str)), {'x': 1}) != memo_key
+
+def test_memo_keys_only_marked_files(s, tmp_path, monkeypatch):
+    walked_list = []
+    monkeypatch.setattr(os, 'walk', lambda *args, **kwargs: walked_list.append(args) or iter([]))
+    s.get_memo_key(len, {'path': str(tmp_path)})
+    assert walked_list == []
+    file_path = tmp_path / 'input.txt'
+    file_path.write_text('a')
+    get_size = s.memoize(lambda file_path: os.path.getsize(file_path), file_arguments=['file_path'])
+    assert get_size(str(file_path)) == 1
+    file_path.write_text('abc')
+    assert get_size(str(file_path)) == 3
+
+def test_lambdas_and_partials_memoize_under_file_names(s):
+    square = s.memoize(lambda x: x * x)
+    assert square(3) == 9 and square(3) == 9
+    assert square.memo_stats_dict == {'hits': 1, 'misses': 1}
+    power = s.memoize(functools.partial(pow, 2))
+    assert power(10) == 1024 and power(10) == 1024
+    assert power.memo_stats_dict == {'hits': 1, 'misses': 1}
+    assert s.memoize(functools.partial(pow, 3))(10) == 59049
+    memo_names_list = [obj_name for obj_name in s.get_manifest() if obj_name.startswith('memo_')]
+    assert len(memo_names_list) == 3
+    assert all(re.fullmatch(r'\w+', memo_name) for memo_name in memo_names_list)
+
+def test_compact_csv_matches_plain_read(s, tmp_path):
+    row_count = 2_500
+    rows_array = np.arange(row_count)
+    block_names_array = np.array(['stone.png', 'white_wool.png', 'oak_planks.png'], dtype=object)[rows_array % 3]
+
+    # A category the first chunk never sees, and a missing value, turn up in later chunks
+    block_names_array[2_000:2_100] = 'new_block.png'
+    block_names_array[2_200] = None
+    csv_df = pd.DataFrame({'block_name': block_names_array, 'row_number': rows_array % 50,
+                           'pixel_number': rows_array * 100, 'weight': rows_array / 7})
+    csv_path = str(tmp_path / 'blocks.csv')
+    csv_df.to_csv(csv_path, index=False)
+    compact_df = s.read_csv_compact(csv_path, chunk_size=1_000)
+    assert compact_df.dtypes.astype(str).tolist() == ['category', 'int8', 'int32', 'float64']
+    assert set(compact_df.block_name.cat.categories) == {'stone.png', 'white_wool.png', 'oak_planks.png',
+                                                         'new_block.png'}
+    plain_df = pd.read_csv(csv_path)
+    pd.testing.assert_frame_equal(compact_df.astype(plain_df.dtypes.to_dict()), plain_df)
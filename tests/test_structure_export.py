@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Soli Deo gloria
+
+from block_grid import BlockGrid
+from nbt_reader import NbtReader
+from structure_export import AIR_STATE, StructureExporter, encode_varints, get_block_states, is_shown_on_top
+import gzip
+import numpy as np
+import pytest
+
+FILE_NAMES_LIST = ['oak_log_top.png', 'white_wool.png', 'glowstone_backlit_red_stained_glass.png', 'stone.png',
+                   'piston_side.png']
+
+def get_block_grid(file_names_list=FILE_NAMES_LIST, shape=(5, 7), seed=0):
+    labels_array = np.random.default_rng(seed).integers(0, len(file_names_list), shape)
+
+    return BlockGrid.from_labels(labels_array, file_names_list, lambda file_name: {'block_name': file_name})
+
+def get_expected_states_array(block_grid):
+    """Return the block state of every (y, z, x) position: the floor on top, with any backing under it."""
+    file_names_array = np.array(block_grid.blocks_df.file_name.tolist(), dtype=object)[block_grid.codes_array]
+    top_array = np.vectorize(lambda file_name: get_block_states(file_name)[0], otypes=[object])(file_names_array)
+    backing_array = np.vectorize(lambda file_name: get_block_states(file_name)[1] or AIR_STATE,
+                                 otypes=[object])(file_names_array)
+
+    return np.stack([backing_array, top_array])
+
+def read_gzipped_nbt(file_path):
+    with gzip.open(file_path, 'rb') as f:
+
+        return NbtReader(f.read()).read_named_tag()
+
+def get_state_str(palette_dict):
+    block_state = palette_dict['Name'][1]
+    if 'Properties' in palette_dict:
+        block_state += '[' + ','.join(f'{key}={value}' for key, (_, value) in palette_dict['Properties'][1].items()) + ']'
+
+    return block_state
+
+def decode_varints(varints_array):
+    values_list = []
+    value = shift = 0
+    for byte in varints_array.astype(np.uint8).tolist():
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            values_list.append(value)
+            value = shift = 0
+
+    return np.array(values_list)
+
+def unpack_spanning_longs(longs_array, bits, count):
+    """Unpack little-endian bit fields that may span longs, as Litematica packs them."""
+    bits_array = np.unpackbits(longs_array.astype('<i8').view(np.uint8), bitorder='little')[:count * bits]
+
+    return (bits_array.reshape(count, bits).astype(np.int64) << np.arange(bits)).sum(axis=1)
+
+def test_varints_round_trip():
+    values_array = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**21, 2**28 + 5])
+    assert np.array_equal(decode_varints(encode_varints(values_array)), values_array)
+
+def test_schem_round_trip(tmp_path):
+    block_grid = get_block_grid()
+    exporter = StructureExporter(block_grid, name='test')
+    _, name, schematic_dict = read_gzipped_nbt(exporter.export(str(tmp_path / 'test.schem')))
+    assert name == 'Schematic'
+    assert (schematic_dict['Width'][1], schematic_dict['Height'][1], schematic_dict['Length'][1]) == (7, 2, 5)
+    states_list = [None] * schematic_dict['PaletteMax'][1]
+    for block_state, (_, index) in schematic_dict['Palette'][1].items():
+        states_list[index] = block_state
+    indices_array = decode_varints(schematic_dict['BlockData'][1]).reshape(2, 5, 7)
+    assert np.array_equal(np.array(states_list, dtype=object)[indices_array], get_expected_states_array(block_grid))
+
+def test_structure_nbt_round_trip(tmp_path):
+    block_grid = get_block_grid()
+    exporter = StructureExporter(block_grid, name='test')
+    _, _, structure_dict = read_gzipped_nbt(exporter.export(str(tmp_path / 'test.nbt')))
+    assert structure_dict['size'][1] == (3, [7, 2, 5])
+    states_list = [get_state_str(palette_dict) for palette_dict in structure_dict['palette'][1][1]]
+    states_array = np.full((2, 5, 7), AIR_STATE, dtype=object)
+    for block_dict in structure_dict['blocks'][1][1]:
+        x, y, z = block_dict['pos'][1][1]
+        states_array[y, z, x] = states_list[block_dict['state'][1]]
+    assert np.array_equal(states_array, get_expected_states_array(block_grid))
+
+def test_litematic_round_trip(tmp_path):
+    block_grid = get_block_grid(shape=(9, 11))
+    exporter = StructureExporter(block_grid, name='test')
+    _, _, litematic_dict = read_gzipped_nbt(exporter.export(str(tmp_path / 'test.litematic')))
+    region_dict = litematic_dict['Regions'][1]['test'][1]
+    states_list = [get_state_str(palette_dict) for palette_dict in region_dict['BlockStatePalette'][1][1]]
+    bits = max(2, (len(states_list) - 1).bit_length())
+    indices_array = unpack_spanning_longs(region_dict['BlockStates'][1], bits, 2 * 9 * 11).reshape(2, 9, 11)
+    assert np.array_equal(np.array(states_list, dtype=object)[indices_array], get_expected_states_array(block_grid))
+
+def test_side_textures_are_refused():
+    assert not is_shown_on_top('furnace_front.png') and not is_shown_on_top('sandstone.png')
+    assert is_shown_on_top('oak_log.png') and is_shown_on_top('glowstone_backlit_red_stained_glass.png')
+    block_grid = get_block_grid(file_names_list=['stone.png', 'pumpkin_side.png'])
+    with pytest.raises(ValueError, match='pumpkin_side'):
+        StructureExporter(block_grid)
+    assert StructureExporter(block_grid, allow_side_textures=True).block_count == 35